@@ -0,0 +1,98 @@
+import argparse
+import time
+from itertools import islice
+
+import numpy as np
+
+from trackers import InferenceEngine
+from trackers.detector_backend import load_detector
+from utils import iter_video_frames
+
+
+def box_iou(boxes_a, boxes_b):
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+def compare_detections(reference, detections, iou_threshold=0.5):
+    # Greedy one-to-one matching of same-class boxes, highest IoU first
+    matched, reference_total, detection_total, confidence_diff = 0, 0, 0, []
+    for frame_reference, frame_detections in zip(reference, detections):
+        reference_total += len(frame_reference.class_id)
+        detection_total += len(frame_detections.class_id)
+        if len(frame_reference.class_id) == 0 or len(frame_detections.class_id) == 0:
+            continue
+
+        iou = box_iou(frame_reference.xyxy, frame_detections.xyxy)
+        iou[frame_reference.class_id[:, None] != frame_detections.class_id[None, :]] = 0
+        while True:
+            i, j = np.unravel_index(np.argmax(iou), iou.shape)
+            if iou[i, j] < iou_threshold:
+                break
+            matched += 1
+            confidence_diff.append(abs(float(frame_reference.confidence[i]) - float(frame_detections.confidence[j])))
+            iou[i, :] = 0
+            iou[:, j] = 0
+
+    return {
+        "recall": matched / reference_total if reference_total else 1.0,
+        "precision": matched / detection_total if detection_total else 1.0,
+        "confidence_diff": float(np.mean(confidence_diff)) if confidence_diff else 0.0,
+    }
+
+
+def run_backend(frames, model_path, backend, quantization, imgsz, batch_size, conf):
+    model = load_detector(model_path, backend, imgsz, quantization)
+    engine = InferenceEngine(model, conf=conf, imgsz=imgsz, batch_size=batch_size)
+
+    # Warm up the runtime so one-off graph compilation is not counted
+    list(engine.iter_detections(frames[:batch_size]))
+
+    start = time.perf_counter()
+    detections = list(engine.iter_detections(frames))
+    elapsed = time.perf_counter() - start
+    return detections, len(frames) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detector backends against the PyTorch model")
+    parser.add_argument("video_path")
+    parser.add_argument("model_path")
+    parser.add_argument("--backends", nargs="+", default=["onnx", "openvino"],
+                        choices=["pytorch", "onnx", "openvino"])
+    parser.add_argument("--quantization", nargs="+", default=["none"], choices=["none", "fp16", "int8"])
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--conf", type=float, default=0.1)
+    args = parser.parse_args()
+
+    frames = list(islice(iter_video_frames(args.video_path), args.frames))
+    reference, reference_fps = run_backend(frames, args.model_path, "pytorch", None, args.imgsz, args.batch_size,
+                                           args.conf)
+    print(f"[INFO] {len(frames)} frames, batch size {args.batch_size}, image size {args.imgsz}")
+    print(f"[INFO] pytorch: {reference_fps:.1f} fps")
+
+    for backend in args.backends:
+        for quantization in args.quantization:
+            quantization = None if quantization == "none" else quantization
+            name = f"{backend}/{quantization or 'fp32'}"
+            try:
+                detections, fps = run_backend(frames, args.model_path, backend, quantization, args.imgsz,
+                                              args.batch_size, args.conf)
+            except (ValueError, ImportError, RuntimeError) as e:
+                print(f"[WARNING] Skipping {name}: {e}")
+                continue
+
+            agreement = compare_detections(reference, detections)
+            print(f"[INFO] {name}: {fps:.1f} fps ({fps / reference_fps:.2f}x), "
+                  f"recall {agreement['recall']:.3f}, precision {agreement['precision']:.3f}, "
+                  f"mean confidence difference {agreement['confidence_diff']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import copy
+import time
+
+import numpy as np
+
+from speed_and_distance_estimator import SpeedAndDistanceEstimator
+from track_store import TrackStore, tracks_to_stores
+from utils import measure_distance
+
+
+def make_synthetic_tracks(number_of_frames, number_of_players=22, seed=0):
+    rng = np.random.default_rng(seed)
+    players = []
+    next_track_id = 1
+
+    for _ in range(number_of_players):
+        position = rng.uniform([0, 0], [23.32, 68])
+        players.append({"track_id": next_track_id, "position": position})
+        next_track_id += 1
+
+    object_tracks = []
+    for _ in range(number_of_frames):
+        frame_tracks = {}
+        for player in players:
+            player["position"] = player["position"] + rng.normal(0, 0.1, 2)
+
+            # ByteTrack ID churn, short detection gaps and players walking out of the projected area
+            if rng.random() < 0.002:
+                player["track_id"] = next_track_id
+                next_track_id += 1
+            if rng.random() < 0.02:
+                continue
+
+            # Projected positions come out of cv2.perspectiveTransform as float32
+            position_transformed = player["position"].astype(np.float32).tolist() if rng.random() > 0.05 else None
+            frame_tracks[player["track_id"]] = {"position_transformed": position_transformed}
+        object_tracks.append(frame_tracks)
+
+    return {"players": object_tracks, "referees": [{} for _ in range(number_of_frames)],
+            "ball": [{} for _ in range(number_of_frames)]}
+
+
+def legacy_add_speed_and_distance_to_track(tracks, frame_window=5, frame_rate=24):
+    # The per-window Python loop the vectorized engine replaced, kept as the reference implementation
+    total_distance = {}
+
+    for object, object_tracks in tracks.items():
+        if object == 'ball' or object == 'referees':
+            continue
+        number_of_frames = len(object_tracks)
+        for frame_num in range(0, number_of_frames, frame_window):
+            last_frame = min(frame_num + frame_window, number_of_frames - 1)
+
+            for track_id, _ in object_tracks[frame_num].items():
+                if track_id not in object_tracks[last_frame]:
+                    continue
+
+                start_position = object_tracks[frame_num][track_id]['position_transformed']
+                end_position = object_tracks[last_frame][track_id]['position_transformed']
+
+                if start_position is None or end_position is None:
+                    continue
+
+                distance_covered = measure_distance(start_position, end_position)
+                time_elapsed = (last_frame - frame_num) / frame_rate
+
+                speed_meters_per_second = distance_covered / time_elapsed
+                speed_km_per_hour = speed_meters_per_second * 3.6
+
+                if object not in total_distance:
+                    total_distance[object] = {}
+
+                if track_id not in total_distance[object]:
+                    total_distance[object][track_id] = 0
+
+                total_distance[object][track_id] += distance_covered
+
+                for frame_num_batch in range(frame_num, last_frame):
+                    if track_id not in tracks[object][frame_num_batch]:
+                        continue
+
+                    tracks[object][frame_num_batch][track_id]['distance'] = total_distance[object][track_id]
+                    tracks[object][frame_num_batch][track_id]['speed'] = speed_km_per_hour
+
+
+def compare_tracks(expected, actual, rtol=1e-9):
+    mismatches = 0
+    for expected_frame, actual_frame in zip(expected["players"], actual["players"]):
+        for track_id, expected_info in expected_frame.items():
+            actual_info = actual_frame[track_id]
+            if ("speed" in expected_info) != ("speed" in actual_info):
+                mismatches += 1
+            elif "speed" in expected_info and not (
+                    np.isclose(expected_info["speed"], actual_info["speed"], rtol=rtol) and
+                    np.isclose(expected_info["distance"], actual_info["distance"], rtol=rtol)):
+                mismatches += 1
+    return mismatches
+
+
+def compare_store(expected, store, rtol=1e-6):
+    expected_store = TrackStore.from_frames(expected["players"])
+    mismatches = 0
+    for name in ("speed", "distance"):
+        expected_column = expected_store.get_column(name)
+        column = store.get_column(name)
+        mismatches += np.count_nonzero(np.isnan(expected_column) != np.isnan(column))
+        both = ~np.isnan(expected_column) & ~np.isnan(column)
+        mismatches += np.count_nonzero(~np.isclose(expected_column[both], column[both], rtol=rtol))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark speed and distance estimation")
+    parser.add_argument("--frames", type=int, default=100000)
+    parser.add_argument("--players", type=int, default=22)
+    args = parser.parse_args()
+
+    # Keep the last frame off a window boundary; the legacy loop divides by zero there
+    if args.frames % 5 == 1:
+        args.frames += 1
+
+    tracks = make_synthetic_tracks(args.frames, args.players)
+    legacy_tracks = copy.deepcopy(tracks)
+    stores = tracks_to_stores(tracks)
+
+    start = time.perf_counter()
+    legacy_add_speed_and_distance_to_track(legacy_tracks)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    SpeedAndDistanceEstimator().add_speed_and_distance_to_track(tracks)
+    dict_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    SpeedAndDistanceEstimator().add_speed_and_distance_to_track_stores(stores)
+    store_time = time.perf_counter() - start
+
+    print(f"[INFO] {args.frames} frames, {args.players} players, {sum(len(s) for s in stores.values())} rows")
+    print(f"[INFO] Legacy loop: {legacy_time:.2f}s")
+    print(f"[INFO] Vectorized on dict tracks: {dict_time:.2f}s ({legacy_time / dict_time:.1f}x)")
+    print(f"[INFO] Vectorized on TrackStore: {store_time:.2f}s ({legacy_time / store_time:.1f}x)")
+    print(f"[INFO] Mismatched rows (dict tracks): {compare_tracks(legacy_tracks, tracks)}")
+    print(f"[INFO] Mismatched rows (TrackStore): {compare_store(legacy_tracks, stores['players'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import argparse
+import copy
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic_match import SyntheticMatch
+from camera_movement_estimator import CameraMovementEstimator
+from instrumentation import get_rss
+from player_ball_assigner import BallControlStats, PlayerBallAssigner
+from renderer import AnnotationRenderer
+from speed_and_distance_estimator import SpeedAndDistanceEstimator
+from team_assigner import TeamAssigner
+from trackers import Tracker
+from utils import save_video
+from view_transformer import ViewTransformer
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+class PeakMemorySampler():
+    """Samples RSS on a background thread and keeps the peak above the level at entry."""
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        while not self.stop_event.wait(self.interval):
+            self.peak = max(self.peak, get_rss() or 0)
+
+    def __enter__(self):
+        self.baseline = self.peak = get_rss() or 0
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.sample, name="rss-sampler", daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        self.peak = max(self.peak, get_rss() or 0)
+
+    @property
+    def peak_increase(self):
+        return self.peak - self.baseline
+
+
+def run_stage(setup, run, frames, repeat):
+    # setup builds fresh inputs for every repetition, outside the timed region, since most stages write to them
+    times, peak_memory = [], 0
+    for _ in range(repeat):
+        inputs = setup()
+        with PeakMemorySampler() as sampler:
+            start = time.perf_counter()
+            run(*inputs)
+            times.append(time.perf_counter() - start)
+        peak_memory = max(peak_memory, sampler.peak_increase)
+        del inputs
+
+    best_time = min(times)
+    return {
+        "frames": frames,
+        "repeat": repeat,
+        "best_time": best_time,
+        "median_time": statistics.median(times),
+        "fps": frames / best_time if best_time > 0 else float("inf"),
+        "peak_memory": peak_memory,
+    }
+
+
+def prepare_tracks(match, tracker):
+    # The analytics stages each see tracks carrying everything the stages before them add in main.py
+    tracks = match.get_tracks(with_teams=True)
+    camera_movement_per_frame = match.get_camera_movement()
+    tracker.add_position_to_tracks(tracks)
+    CameraMovementEstimator(np.zeros((8, 8, 3), dtype=np.uint8)).add_adjust_positions_to_tracks(
+        tracks, camera_movement_per_frame)
+    adjusted_tracks = copy.deepcopy(tracks)
+    ViewTransformer().add_transformed_position_to_tracks(tracks, camera_movement_per_frame)
+    tracks['ball'] = tracker.interpolate_ball_positions(tracks['ball'])
+    return adjusted_tracks, tracks, camera_movement_per_frame
+
+
+def get_stages(match, frames, output_dir, model_path):
+    # The detector is only loaded for inference, which none of these stages run, so the weights need not exist
+    tracker = Tracker(model_path)
+    raw_tracks = match.get_tracks()
+    adjusted_tracks, tracks, camera_movement_per_frame = prepare_tracks(match, tracker)
+    team_ball_control = PlayerBallAssigner().add_ball_possession_to_tracks(copy.deepcopy(tracks))
+    SpeedAndDistanceEstimator().add_speed_and_distance_to_track(tracks)
+    num_frames = len(tracks['players'])
+
+    def setup_team_assigner():
+        team_assigner = TeamAssigner()
+        team_assigner.assign_team_color(frames[0], tracks['players'][0])
+        return (team_assigner,)
+
+    def get_player_teams(team_assigner):
+        for frame_num, frame in enumerate(frames):
+            team_assigner.get_player_teams(frame, tracks['players'][frame_num])
+
+    def draw_annotations():
+        # Drawing is in place; redrawing on already annotated frames costs the same
+        renderer = AnnotationRenderer(tracks, BallControlStats.from_team_ball_control(team_ball_control),
+                                      camera_movement_per_frame)
+        for _ in renderer.render(frames):
+            pass
+
+    # name: (frames processed, setup returning the arguments of run, run)
+    return {
+        "interpolate_ball_positions": (num_frames, lambda: (copy.deepcopy(raw_tracks['ball']),),
+                                       tracker.interpolate_ball_positions),
+        "camera_movement": (len(frames), lambda: (CameraMovementEstimator(frames[0]),),
+                            lambda estimator: estimator.camera_movement(frames)),
+        "add_transformed_position_to_tracks": (num_frames, lambda: (copy.deepcopy(adjusted_tracks),
+                                                                    camera_movement_per_frame),
+                                               ViewTransformer().add_transformed_position_to_tracks),
+        "add_speed_and_distance_to_track": (num_frames, lambda: (copy.deepcopy(tracks),),
+                                            SpeedAndDistanceEstimator().add_speed_and_distance_to_track),
+        "assign_team_color": (1, lambda: (TeamAssigner(),),
+                              lambda team_assigner: team_assigner.assign_team_color(frames[0], tracks['players'][0])),
+        "get_player_teams": (len(frames), setup_team_assigner, get_player_teams),
+        "assign_ball_to_player": (num_frames, lambda: (copy.deepcopy(tracks),),
+                                  PlayerBallAssigner().add_ball_possession_to_tracks),
+        "draw_annotations": (len(frames), lambda: (), draw_annotations),
+        "save_video": (len(frames), lambda: (),
+                       lambda: save_video(frames, str(Path(output_dir) / "benchmark.mp4"))),
+    }
+
+
+def get_environment():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                  cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "revision": revision,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare_results(results, baseline, threshold=0.1):
+    # Speedup of every stage against a saved run; slower than the threshold is flagged as a regression
+    if results["params"] != baseline["params"]:
+        print(f"[WARNING] Baseline was run with different parameters: {baseline['params']}")
+    for name, stage in results["stages"].items():
+        baseline_stage = baseline["stages"].get(name)
+        if baseline_stage is None:
+            continue
+        speedup = stage["fps"] / baseline_stage["fps"] if baseline_stage["fps"] else float("inf")
+        level = "WARNING" if speedup < 1 - threshold else "INFO"
+        print(f"[{level}] {name}: {speedup:.2f}x baseline ({baseline_stage['fps']:.1f} -> {stage['fps']:.1f} fps)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on a synthetic match")
+    parser.add_argument("--frames", type=int, default=3000, help="frames of synthetic tracks for the analytics stages")
+    parser.add_argument("--video-frames", type=int, default=100,
+                        help="rendered frames for the image stages (camera movement, teams, drawing, encoding)")
+    parser.add_argument("--players", type=int, default=22)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", nargs="+", default=None, help="only run these stages")
+    parser.add_argument("--output", default=None,
+                        help="where to save the results as JSON (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="a previous results file to compare against")
+    parser.add_argument("--model", default=str(Path(__file__).resolve().parent.parent / "models" / "best _model.pt"),
+                        help="detector weights the tracker is built with; never loaded by these stages")
+    args = parser.parse_args()
+
+    match = SyntheticMatch(max(args.frames, args.video_frames), num_players=args.players,
+                           frame_size=(args.width, args.height), seed=args.seed)
+    frames = list(match.iter_frames(args.video_frames))
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        stages = get_stages(match, frames, output_dir, args.model)
+        unknown = set(args.stages or []) - set(stages)
+        if unknown:
+            parser.error(f"unknown stages: {', '.join(sorted(unknown))} (expected: {', '.join(stages)})")
+
+        results = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "environment": get_environment(),
+            "params": {"frames": match.num_frames, "video_frames": len(frames), "players": args.players,
+                       "frame_size": [args.width, args.height], "repeat": args.repeat, "seed": args.seed},
+            "stages": {},
+        }
+        for name, (num_frames, setup, run) in stages.items():
+            if args.stages and name not in args.stages:
+                continue
+            stage = run_stage(setup, run, num_frames, args.repeat)
+            results["stages"][name] = stage
+            print(f"[INFO] {name}: {stage['fps']:.1f} fps ({stage['best_time'] * 1000:.1f} ms best of {args.repeat}), "
+                  f"peak memory +{stage['peak_memory'] / 1024 ** 2:.1f} MB")
+
+    output_path = Path(args.output) if args.output else RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[INFO] Results saved at: {output_path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare_results(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from main import COMMANDS, IMPORT_BUDGETS
+
+MAIN_PATH = Path(__file__).resolve().parent.parent / "main.py"
+
+# Dependencies that take hundreds of milliseconds to seconds to import; commands only load them when they need them
+HEAVY_MODULES = ("torch", "ultralytics", "supervision", "sklearn", "pandas", "scipy")
+
+
+def measure_startup(command, cache_dir):
+    # A missing input stops the command right after its imports, so nothing but startup is timed
+    args = [sys.executable, "-X", "importtime", str(MAIN_PATH), command, str(Path(cache_dir) / "missing.mp4"),
+            "--cache-dir", str(cache_dir), "--log-format", "json", "--log-level", "DEBUG"]
+    if command == "export":
+        args += ["--output", str(Path(cache_dir) / "export")]
+    start = time.perf_counter()
+    process = subprocess.run(args, capture_output=True, text=True)
+    wall_time = time.perf_counter() - start
+
+    import_time = None
+    for line in process.stdout.splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if "import_time" in entry:
+            import_time = entry["import_time"]
+
+    # -X importtime lists every module the interpreter loaded, heavy ones show up by their top-level package
+    modules = set()
+    for line in process.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+
+    return {
+        "wall_time": wall_time,
+        "import_time": import_time,
+        "budget": IMPORT_BUDGETS[command],
+        "heavy_modules": sorted(modules.intersection(HEAVY_MODULES)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check each CLI command's startup against its import-time budget")
+    parser.add_argument("--commands", nargs="+", choices=COMMANDS, default=list(COMMANDS))
+    parser.add_argument("--output", default=None, help="where to save the results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    over_budget = False
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for command in args.commands:
+            result = measure_startup(command, cache_dir)
+            results[command] = result
+            failed = (result["import_time"] is None or result["import_time"] > result["budget"]
+                      or result["heavy_modules"])
+            over_budget = over_budget or failed
+            import_time = "n/a" if result["import_time"] is None else f"{result['import_time'] * 1000:.0f} ms"
+            print(f"[{'WARNING' if failed else 'INFO'}] {command}: imports {import_time} "
+                  f"(budget {result['budget'] * 1000:.0f} ms), startup {result['wall_time'] * 1000:.0f} ms, "
+                  f"heavy modules: {', '.join(result['heavy_modules']) or 'none'}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"[INFO] Results saved at: {args.output}")
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import cv2
+import numpy as np
+
+# Shirt and shorts colours (BGR) of the two teams and the referees
+TEAM_KITS = {1: ((40, 40, 210), (255, 255, 255)), 2: ((210, 120, 30), (30, 30, 30))}
+REFEREE_KIT = ((0, 220, 240), (20, 20, 20))
+
+
+class SyntheticMatch():
+    """A reproducible fake broadcast: a panning pitch with coloured player blobs and a ball, plus its tracks.
+
+    Positions are generated once for every frame, so the rendered frames and the track dictionaries agree
+    and any stage can be fed either of them.
+    """
+
+    def __init__(self, num_frames, num_players=22, num_referees=3, frame_size=(1920, 1080), max_pan=400,
+                 ball_miss_rate=0.15, seed=0):
+        self.num_frames = num_frames
+        self.num_players = num_players
+        self.num_referees = num_referees
+        self.frame_size = tuple(frame_size)
+        self.rng = np.random.default_rng(seed)
+
+        width, height = self.frame_size
+        # Horizontal camera pan in pixels, slow and smooth like a broadcast camera following play
+        phase = np.arange(num_frames) / 25
+        self.camera_offset = np.round(max_pan / 2 * (1 - np.cos(phase))).astype(np.int64)
+
+        # Everything moves on the pitch canvas; the visible frame is a window into it
+        self.canvas = self.make_pitch(width + max_pan, height)
+        bounds = (np.array([0.1 * width, 0.3 * height]), np.array([0.85 * width + max_pan, 0.95 * height]))
+        self.player_positions = self.make_trajectories(num_players, bounds, max_speed=6)
+        self.referee_positions = self.make_trajectories(num_referees, bounds, max_speed=4)
+        self.ball_positions = self.make_ball_trajectory()
+        self.teams = np.arange(num_players) % 2 + 1
+
+        # Detection gaps of a few frames, like a ball hidden behind players or lost in motion blur
+        missing = self.rng.random(num_frames) < ball_miss_rate / 3
+        self.ball_visible = ~(missing | np.roll(missing, 1) | np.roll(missing, 2))
+        self.ball_visible[0] = True
+
+    def make_pitch(self, width, height):
+        canvas = np.empty((height, width, 3), dtype=np.uint8)
+        canvas[:] = (60, 140, 60)
+        # Mowing stripes and line markings give optical flow something to follow
+        for x in range(0, width, 160):
+            canvas[:, x:x + 80] = (70, 155, 70)
+        for x in range(20, width, 450):
+            cv2.line(canvas, (x, 0), (x, height), (235, 235, 235), 4)
+        cv2.line(canvas, (0, int(0.25 * height)), (width, int(0.25 * height)), (235, 235, 235), 4)
+        cv2.circle(canvas, (width // 2, height // 2), height // 6, (235, 235, 235), 4)
+        noise = self.rng.integers(-12, 13, size=(height, width, 1), dtype=np.int16)
+        return np.clip(canvas + noise, 0, 255).astype(np.uint8)
+
+    def make_trajectories(self, count, bounds, max_speed):
+        low, high = bounds
+        positions = np.empty((self.num_frames, count, 2))
+        position = self.rng.uniform(low, high, (count, 2))
+        velocity = self.rng.normal(0, 1, (count, 2))
+        for frame_num in range(self.num_frames):
+            velocity += self.rng.normal(0, 0.4, (count, 2))
+            speed = np.linalg.norm(velocity, axis=1, keepdims=True)
+            velocity *= np.minimum(1, max_speed / np.maximum(speed, 1e-9))
+            position += velocity
+            # Bounce off the edges of the playing area
+            outside = (position < low) | (position > high)
+            velocity[outside] *= -1
+            position = np.clip(position, low, high)
+            positions[frame_num] = position
+        return positions
+
+    def make_ball_trajectory(self):
+        # The carrier dribbles for a while, then passes to a nearby player at a realistic ball speed
+        positions = np.empty((self.num_frames, 2))
+        foot_offset = np.array([12, -4])
+        frame_num = 0
+        carrier = 0
+        while frame_num < self.num_frames:
+            end = min(frame_num + int(self.rng.integers(10, 50)), self.num_frames)
+            positions[frame_num:end] = self.player_positions[frame_num:end, carrier] + foot_offset
+            frame_num = end
+            if frame_num >= self.num_frames:
+                break
+
+            distances = np.linalg.norm(self.player_positions[frame_num] - self.player_positions[frame_num, carrier],
+                                       axis=1)
+            distances[carrier] = np.inf
+            receiver = int(self.rng.choice(np.argsort(distances)[:4]))
+            start_position = positions[frame_num - 1]
+            duration = max(int(distances[receiver] / self.rng.uniform(10, 30)), 2)
+            end = min(frame_num + duration, self.num_frames)
+            end_position = self.player_positions[min(frame_num + duration, self.num_frames) - 1, receiver] + foot_offset
+            steps = np.arange(1, end - frame_num + 1)[:, None] / duration
+            positions[frame_num:end] = start_position + steps * (end_position - start_position)
+            frame_num, carrier = end, receiver
+        return positions
+
+    def get_player_size(self, y):
+        # Players further up the frame are further from the camera
+        _, height = self.frame_size
+        scale = 0.5 + 0.5 * y / height
+        return 40 * scale, 90 * scale
+
+    def get_bbox(self, position, frame_num):
+        x, y = position[0] - self.camera_offset[frame_num], position[1]
+        width, height = self.get_player_size(y)
+        return [float(x - width / 2), float(y - height), float(x + width / 2), float(y)]
+
+    def get_ball_bbox(self, frame_num):
+        x, y = self.ball_positions[frame_num, 0] - self.camera_offset[frame_num], self.ball_positions[frame_num, 1]
+        return [float(x - 6), float(y - 6), float(x + 6), float(y + 6)]
+
+    def get_tracks(self, with_teams=False):
+        """Tracker-style dictionaries: players, referees and ball, each a list of {track_id: {"bbox": ...}}."""
+        tracks = {"players": [], "referees": [], "ball": []}
+        for frame_num in range(self.num_frames):
+            players = {}
+            for i in range(self.num_players):
+                players[i + 1] = {"bbox": self.get_bbox(self.player_positions[frame_num, i], frame_num)}
+                if with_teams:
+                    team = int(self.teams[i])
+                    players[i + 1]["team"] = team
+                    players[i + 1]["team_color"] = TEAM_KITS[team][0]
+            tracks["players"].append(players)
+            tracks["referees"].append({self.num_players + i + 1: {"bbox": self.get_bbox(position, frame_num)}
+                                       for i, position in enumerate(self.referee_positions[frame_num])})
+            tracks["ball"].append({1: {"bbox": self.get_ball_bbox(frame_num)}} if self.ball_visible[frame_num] else {})
+        return tracks
+
+    def get_camera_movement(self):
+        # Per-frame displacement of the camera relative to the previous frame, as the estimator reports it
+        movement = np.zeros((self.num_frames, 2))
+        movement[1:, 0] = np.diff(self.camera_offset)
+        return movement.tolist()
+
+    def draw_person(self, frame, bbox, kit):
+        x1, y1, x2, y2 = (int(round(value)) for value in bbox)
+        shirt, shorts = kit
+        waist = y1 + (y2 - y1) // 2
+        knees = y1 + 3 * (y2 - y1) // 4
+        head = max((x2 - x1) // 4, 3)
+        cv2.circle(frame, ((x1 + x2) // 2, y1 + head), head, (150, 180, 220), cv2.FILLED)
+        cv2.rectangle(frame, (x1, y1 + 2 * head), (x2, waist), shirt, cv2.FILLED)
+        cv2.rectangle(frame, (x1, waist), (x2, knees), shorts, cv2.FILLED)
+        cv2.rectangle(frame, (x1 + 3, knees), (x2 - 3, y2), (40, 40, 40), cv2.FILLED)
+
+    def render_frame(self, frame_num):
+        width, height = self.frame_size
+        offset = int(self.camera_offset[frame_num])
+        frame = self.canvas[:, offset:offset + width].copy()
+
+        for i in range(self.num_players):
+            self.draw_person(frame, self.get_bbox(self.player_positions[frame_num, i], frame_num),
+                             TEAM_KITS[int(self.teams[i])])
+        for position in self.referee_positions[frame_num]:
+            self.draw_person(frame, self.get_bbox(position, frame_num), REFEREE_KIT)
+        x1, y1, x2, y2 = self.get_ball_bbox(frame_num)
+        cv2.circle(frame, (int((x1 + x2) / 2), int((y1 + y2) / 2)), 6, (250, 250, 250), cv2.FILLED)
+
+        return frame
+
+    def iter_frames(self, num_frames=None):
+        for frame_num in range(self.num_frames if num_frames is None else min(num_frames, self.num_frames)):
+            yield self.render_frame(frame_num)
@@ -1,34 +1,56 @@
+import logging
+
 import cv2
 import numpy as np
 import os
 
-from utils import measure_distance
-from utils.bbox_utils import measure_xy_distance
+from detection_cache import load_camera_movement, save_camera_movement
+from instrumentation import metrics, timed
+
+logger = logging.getLogger(__name__)
 
 
 class CameraMovementEstimator():
-    def __init__(self, frame):
+    def __init__(self, frame, mode="max", scale=1.0, min_features=None):
         self.minimum_distance = 5
 
+        # The reported movement is a robust estimate over every tracked feature (the median displacement, or the
+        # similarity transform in "affine" mode), never gated, so it can be accumulated into the camera position.
+        # Both need most features on the background, hence the low qualityLevel: players' high-contrast corners
+        # would otherwise crowd out every feature of the pitch.
+        # minimum_distance only decides when features are re-detected: in "max" mode against the largest feature
+        # displacement, otherwise against the estimate itself. scale downsamples frames before optical flow.
+        # With min_features set, features are tracked across frames and only re-detected once fewer than
+        # min_features survive.
+        self.mode = mode
+        self.scale = scale
+        self.min_features = min_features
+
         self.lk_params = dict(
             winSize=(15, 15),
             maxLevel=2,
             criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
         )
 
-        first_frame_grayscale = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        first_frame_grayscale = self.to_grayscale(frame)
         mask_features = np.zeros_like(first_frame_grayscale)
-        mask_features[:, 0:20] = 1
-        mask_features[:, 900:1050] = 1
+        mask_features[:, 0:int(20 * scale)] = 1
+        mask_features[:, int(900 * scale):int(1050 * scale)] = 1
+        self.frame_center = np.array([first_frame_grayscale.shape[1] / 2, first_frame_grayscale.shape[0] / 2],
+                                     dtype=np.float32)
 
         self.features = dict(
             maxCorners=100,
-            qualityLevel=0.3,
+            qualityLevel=0.01,
             minDistance=3,
             blockSize=7,
             mask=mask_features
         )
 
+        self.old_gray = None
+        self.old_features = None
+        self.frame_num = 0
+
     def add_adjust_positions_to_tracks(self, tracks, camera_movement_per_frame):
         for object, object_tracks in tracks.items():
             for frame_num, track in enumerate(object_tracks):
@@ -38,61 +60,105 @@ class CameraMovementEstimator():
                     position_adjusted = (position[0] - camera_movement[0], position[1] - camera_movement[1])
                     tracks[object][frame_num][track_id]['position_adjusted'] = position_adjusted
 
-    def camera_movement(self, frames, read_from_stub=False, stub_path=None):
-        camera_movement = [[0, 0]] * len(frames)
+    def add_adjust_positions_to_track_stores(self, stores, camera_movement_per_frame):
+        camera_movement_per_frame = np.asarray(camera_movement_per_frame, dtype=np.float64).reshape(-1, 2)
+        for store in stores.values():
+            position = store.get_column('position')
+            store.set_column('position_adjusted', position - camera_movement_per_frame[store.frame])
+
+    def get_stub_params(self):
+        return {
+            "minimum_distance": self.minimum_distance,
+            "lk_params": self.lk_params,
+            "features": {k: v for k, v in self.features.items() if k != "mask"},
+            "mode": self.mode,
+            "scale": self.scale,
+            "min_features": self.min_features,
+            # Movement is reported ungated; caches from when it was zeroed under minimum_distance are stale
+            "movement": "robust",
+        }
+
+    def to_grayscale(self, frame):
+        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.scale != 1.0:
+            frame_gray = cv2.resize(frame_gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return frame_gray
 
-        old_gray = cv2.cvtColor(frames[0], cv2.COLOR_BGR2GRAY)
-        old_features = cv2.goodFeaturesToTrack(old_gray, **self.features)
-
-        for frame_num in range(1, len(frames)):
-            frame_gray = cv2.cvtColor(frames[frame_num], cv2.COLOR_BGR2GRAY)
-            if old_features is None or len(old_features) == 0:
-                print(f"[WARNING] Frame {frame_num}: No features found — skipping optical flow.")
-                camera_movement[frame_num] = [0, 0]
-                old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
-                old_gray = frame_gray.copy()
-                continue
-
-            new_features, _, _ = cv2.calcOpticalFlowPyrLK(old_gray, frame_gray, old_features, None, **self.lk_params)
+    def camera_movement(self, frames, read_from_stub=False, stub_path=None):
+        if read_from_stub and stub_path is not None and os.path.exists(stub_path):
+            return load_camera_movement(stub_path)
 
-            max_distance = 0
-            camera_movement_x, camera_movement_y = 0, 0
+        self.old_gray = None
+        camera_movement = list(self.iter_camera_movement(frames))
 
-            for i, (new, old) in enumerate(zip(new_features, old_features)):
-                new_features_point = new.ravel()
-                old_features_point = old.ravel()
+        if stub_path is not None:
+            save_camera_movement(camera_movement, stub_path)
 
-                distance = measure_distance(new_features_point, old_features_point)
-                if distance > max_distance:
-                    max_distance = distance
-                    camera_movement_x, camera_movement_y = measure_xy_distance(old_features_point, new_features_point)
+        return camera_movement
 
+    def iter_camera_movement(self, frames):
+        for frame in frames:
+            yield self.update_camera_movement(frame)
+
+    def estimate_movement(self, old_points, new_points, status):
+        tracked = status.ravel() == 1
+        if not tracked.any():
+            return 0.0, np.zeros(2, dtype=np.float32)
+        displacement = old_points[tracked] - new_points[tracked]
+
+        # A single feature can sit on a player, so the movement is always the robust estimate
+        movement = np.median(displacement, axis=0)
+        if self.mode == "affine" and tracked.sum() >= 3:
+            # Least median of squares: exact on the background as long as most features are on it
+            matrix, _ = cv2.estimateAffinePartial2D(old_points[tracked], new_points[tracked], method=cv2.LMEDS)
+            if matrix is not None:
+                # Displacement of the frame centre under the estimated similarity transform
+                movement = self.frame_center - (matrix[:, :2] @ self.frame_center + matrix[:, 2])
+
+        if self.mode == "max":
+            return float(np.sqrt((displacement ** 2).sum(axis=1)).max()), movement
+        return float(np.sqrt((movement ** 2).sum())), movement
+
+    @timed("camera_motion")
+    def update_camera_movement(self, frame):
+        frame_gray = self.to_grayscale(frame)
+
+        if self.old_gray is None:
+            self.frame_num = 0
+            self.old_gray = frame_gray
+            self.old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
+            return [0, 0]
+
+        self.frame_num += 1
+        if self.old_features is None or len(self.old_features) == 0:
+            logger.warning("Frame %d: No features found — skipping optical flow.", self.frame_num,
+                           extra={"frame": self.frame_num})
+            metrics.count("camera_frames_without_features")
+            self.old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
+            self.old_gray = frame_gray
+            return [0, 0]
+
+        new_features, status, _ = cv2.calcOpticalFlowPyrLK(self.old_gray, frame_gray, self.old_features, None,
+                                                           **self.lk_params)
+
+        max_distance, (camera_movement_x, camera_movement_y) = self.estimate_movement(
+            self.old_features.reshape(-1, 2), new_features.reshape(-1, 2), status)
+        max_distance /= self.scale
+        camera_movement = [float(camera_movement_x) / self.scale, float(camera_movement_y) / self.scale]
+
+        if self.min_features is None:
             if max_distance > self.minimum_distance:
-                camera_movement[frame_num] = [camera_movement_x, camera_movement_y]
-                old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
-
-            old_gray = frame_gray.copy()
-
+                self.old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
+            elif status.any():
+                # Below the threshold the features follow the content, so slow pans are still measured between
+                # matching points instead of on whatever has since moved under the old coordinates
+                self.old_features = new_features[status.ravel() == 1].reshape(-1, 1, 2)
+        else:
+            tracked_features = new_features[status.ravel() == 1]
+            if len(tracked_features) < self.min_features:
+                self.old_features = cv2.goodFeaturesToTrack(frame_gray, **self.features)
+            else:
+                self.old_features = tracked_features.reshape(-1, 1, 2)
+
+        self.old_gray = frame_gray
         return camera_movement
-
-    def draw_camera_movement(self, frames, camera_movement_per_frame):
-        output_frames = []
-
-        for frame_num, frame in enumerate(frames):
-            frame = frame.copy()
-
-            overlay = frame.copy()
-
-            cv2.rectangle(overlay, (0, 0), (500, 100), (255, 255, 255), -1)
-            alpha = 0.6
-            cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
-
-            x_movement, y_movement = camera_movement_per_frame[frame_num]
-            frame = cv2.putText(frame, f"Camera Movement X: {x_movement: .2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1,
-                                (0, 0, 0), 3)
-            frame = cv2.putText(frame, f"Camera Movement Y: {y_movement: .2f}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1,
-                                (0, 0, 0), 3)
-
-            output_frames.append(frame)
-
-        return output_frames
@@ -0,0 +1,2 @@
+from .detection_cache import DetectionCache, hash_file, save_tracks, load_tracks, load_track_stores, load_detections, \
+    detections_to_arrays, concat_detection_arrays, save_camera_movement, load_camera_movement
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+from instrumentation import metrics
+from track_store import TrackStore, tracks_to_stores, stores_to_tracks
+
+logger = logging.getLogger(__name__)
+
+_file_hashes = {}
+
+
+def hash_file(path, chunk_size=1 << 20):
+    stat = os.stat(path)
+    memo_key = (str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        _file_hashes[memo_key] = digest.hexdigest()
+    return _file_hashes[memo_key]
+
+
+def _save_arrays(path, arrays):
+    # Write to a temporary file first so an interrupted run never leaves a truncated entry behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def detections_to_arrays(detections, start_frame=0):
+    frames, xyxy, confidence, class_id = [], [], [], []
+    class_names = {}
+    for frame_num, detection in enumerate(detections, start=start_frame):
+        frames.append(np.full(len(detection.class_id), frame_num, dtype=np.int32))
+        xyxy.append(np.asarray(detection.xyxy, dtype=np.float32).reshape(-1, 4))
+        confidence.append(np.asarray(detection.confidence, dtype=np.float32))
+        class_id.append(np.asarray(detection.class_id, dtype=np.int16))
+        class_names = detection.names
+
+    return {
+        "frame": np.concatenate(frames) if frames else np.zeros(0, dtype=np.int32),
+        "xyxy": np.concatenate(xyxy) if xyxy else np.zeros((0, 4), dtype=np.float32),
+        "confidence": np.concatenate(confidence) if confidence else np.zeros(0, dtype=np.float32),
+        "class_id": np.concatenate(class_id) if class_id else np.zeros(0, dtype=np.int16),
+        "class_names": class_names,
+    }
+
+
+def concat_detection_arrays(detection_arrays):
+    if not detection_arrays:
+        return None
+
+    arrays = {name: np.concatenate([d[name] for d in detection_arrays])
+              for name in ("frame", "xyxy", "confidence", "class_id")}
+    arrays["class_names"] = detection_arrays[-1]["class_names"]
+    return arrays
+
+
+def save_tracks(tracks, path, detections=None):
+    arrays = {"num_frames": np.array(len(tracks["players"]))}
+
+    for object, store in tracks_to_stores(tracks, fields=("bbox", "confidence")).items():
+        for name, values in store.to_arrays().items():
+            arrays[f"{object}_{name}"] = values
+
+    if detections is not None:
+        for name in ("frame", "xyxy", "confidence", "class_id"):
+            arrays[f"detections_{name}"] = detections[name]
+        arrays["detections_class_names"] = np.array(json.dumps(detections["class_names"]))
+
+    _save_arrays(path, arrays)
+
+
+def load_track_stores(path):
+    with np.load(path) as arrays:
+        num_frames = int(arrays["num_frames"])
+        stores = {}
+        for object in ("players", "referees", "ball"):
+            prefix = f"{object}_"
+            object_arrays = {name[len(prefix):]: arrays[name] for name in arrays.files if name.startswith(prefix)}
+            stores[object] = TrackStore.from_arrays(num_frames, object_arrays)
+
+    return stores
+
+
+def load_tracks(path):
+    return stores_to_tracks(load_track_stores(path))
+
+
+def load_detections(path):
+    with np.load(path) as arrays:
+        if "detections_frame" not in arrays:
+            return None
+        detections = {name: arrays[f"detections_{name}"] for name in ("frame", "xyxy", "confidence", "class_id")}
+        class_names = json.loads(str(arrays["detections_class_names"]))
+        detections["class_names"] = {int(k): v for k, v in class_names.items()}
+
+    return detections
+
+
+def save_camera_movement(camera_movement_per_frame, path):
+    _save_arrays(path, {"camera_movement": np.array(camera_movement_per_frame, dtype=np.float32).reshape(-1, 2)})
+
+
+def load_camera_movement(path):
+    with np.load(path) as arrays:
+        return arrays["camera_movement"].tolist()
+
+
+class DetectionCache():
+    def __init__(self, cache_dir, max_size_bytes=5 * 1024 ** 3):
+        self.cache_dir = Path(cache_dir)
+        self.max_size_bytes = max_size_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def get_key(self, video_path, model_path=None, **params):
+        key = {
+            "video": hash_file(video_path),
+            "model": hash_file(model_path) if model_path is not None else None,
+            "params": params,
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+    def get_entry_path(self, name, video_path, model_path=None, **params):
+        return str(self.cache_dir / f"{name}-{self.get_key(video_path, model_path, **params)}.npz")
+
+    def has_entry(self, path):
+        if not os.path.exists(path):
+            metrics.count("cache_misses")
+            return False
+        # Touch the entry so eviction treats it as recently used
+        os.utime(path)
+        metrics.count("cache_hits")
+        return True
+
+    def evict(self):
+        entries = []
+        for entry in self.cache_dir.glob("*.npz"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # Another process evicted it first
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, entry in sorted(entries, key=lambda x: x[0]):
+            if total_size <= self.max_size_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total_size -= size
+            logger.info("Evicted cache entry: %s", entry.name)
@@ -0,0 +1,3 @@
+from .metrics import Metrics, metrics, timed, get_rss, get_peak_rss, get_available_ram
+from .profiler import profile, PROFILERS
+from .logs import configure_logging, get_logging_config, JsonFormatter
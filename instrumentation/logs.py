@@ -0,0 +1,40 @@
+import json
+import logging
+import sys
+import time
+
+# Attributes every LogRecord has; anything else was passed through extra= and belongs in the JSON line
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the fields passed through extra= kept as keys."""
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level="INFO", json_logs=False):
+    handler = logging.StreamHandler(sys.stdout)
+    # The plain format keeps the [LEVEL] prefix the console output always had
+    handler.setFormatter(JsonFormatter() if json_logs else logging.Formatter("[%(levelname)s] %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+
+def get_logging_config():
+    # The configure_logging arguments that reproduce the current setup, e.g. in a spawned worker
+    root = logging.getLogger()
+    if not root.handlers:
+        return None
+    return {"level": root.level, "json_logs": any(isinstance(h.formatter, JsonFormatter) for h in root.handlers)}
@@ -0,0 +1,191 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Upper bounds, in seconds, of the per-frame latency histogram buckets; a last bucket holds everything slower
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+
+def get_rss():
+    """Current resident set size of this process in bytes, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def get_available_ram():
+    """System memory available to new processes in bytes, or None where it cannot be read."""
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def get_peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_bucket(value):
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if value <= bound:
+            return i
+    return len(LATENCY_BUCKETS)
+
+
+def new_histogram():
+    return [0] * (len(LATENCY_BUCKETS) + 1)
+
+
+class Metrics():
+    """Thread-safe stage timers, counters and latency histograms. Disabled, every call is close to free."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.start_time = time.perf_counter()
+            self.stages = {}
+            self.counters = {}
+            self.histograms = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+        self.reset()
+
+    @contextmanager
+    def stage(self, name, frames=1):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, frames)
+
+    def record(self, name, elapsed, frames=1):
+        # Resident memory is sampled as each stage call ends; the peak is the largest sample
+        rss = get_rss()
+        frames = max(frames, 1)
+        with self.lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = {"calls": 0, "frames": 0, "total_time": 0.0, "max_time": 0.0,
+                         "histogram": new_histogram(), "peak_rss": 0}
+                self.stages[name] = stats
+            stats["calls"] += 1
+            stats["frames"] += frames
+            stats["total_time"] += elapsed
+            stats["max_time"] = max(stats["max_time"], elapsed)
+            # Batched calls count every frame at the batch's average time per frame
+            stats["histogram"][get_bucket(elapsed / frames)] += frames
+            if rss is not None:
+                stats["peak_rss"] = max(stats["peak_rss"], rss)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """Add one latency sample, in seconds, to the histogram called name."""
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.setdefault(name, new_histogram())
+            histogram[get_bucket(value)] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps({"stages": self.stages, "counters": self.counters,
+                                          "histograms": self.histograms}))
+
+    def merge(self, snapshot):
+        """Add the metrics another process collected, as returned by its snapshot()."""
+        with self.lock:
+            for name, other in snapshot["stages"].items():
+                stats = self.stages.setdefault(name, {"calls": 0, "frames": 0, "total_time": 0.0, "max_time": 0.0,
+                                                      "histogram": new_histogram(), "peak_rss": 0})
+                for key in ("calls", "frames", "total_time"):
+                    stats[key] += other[key]
+                stats["max_time"] = max(stats["max_time"], other["max_time"])
+                stats["peak_rss"] = max(stats["peak_rss"], other["peak_rss"])
+                stats["histogram"] = [a + b for a, b in zip(stats["histogram"], other["histogram"])]
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, histogram in snapshot["histograms"].items():
+                current = self.histograms.setdefault(name, new_histogram())
+                self.histograms[name] = [a + b for a, b in zip(current, histogram)]
+
+    def get_report(self):
+        snapshot = self.snapshot()
+        stages = {}
+        for name, stats in snapshot["stages"].items():
+            stages[name] = {
+                "calls": stats["calls"],
+                "frames": stats["frames"],
+                "total_time": stats["total_time"],
+                "mean_frame_time": stats["total_time"] / stats["frames"],
+                "max_call_time": stats["max_time"],
+                "fps": stats["frames"] / stats["total_time"] if stats["total_time"] > 0 else None,
+                "peak_rss": stats["peak_rss"] or None,
+                "frame_time_histogram": stats["histogram"],
+            }
+        return {
+            "wall_time": time.perf_counter() - self.start_time,
+            "peak_rss": get_peak_rss(),
+            "histogram_buckets": list(LATENCY_BUCKETS),
+            "stages": stages,
+            "counters": snapshot["counters"],
+            "histograms": snapshot["histograms"],
+        }
+
+    def save_report(self, path):
+        with open(path, "w") as f:
+            json.dump(self.get_report(), f, indent=2)
+
+
+# Process-wide instance the pipeline stages report to; main enables it with --metrics
+metrics = Metrics()
+
+
+def timed(name):
+    """Time every call of the decorated function as one frame of stage name."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            with metrics.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,54 @@
+import cProfile
+import io
+import logging
+import pstats
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+@contextmanager
+def profile(profiler=None, output_path=None):
+    """Profile the enclosed block with cProfile (pstats dump) or pyinstrument (HTML), or do nothing."""
+    if profiler is None:
+        yield
+        return
+
+    if profiler == "cprofile":
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+        try:
+            yield
+        finally:
+            cprofile.disable()
+            if output_path is not None:
+                cprofile.dump_stats(output_path)
+                logger.info("cProfile stats saved at: %s", output_path)
+            summary = io.StringIO()
+            pstats.Stats(cprofile, stream=summary).sort_stats("cumulative").print_stats(20)
+            logger.info("Top functions by cumulative time:\n%s", summary.getvalue())
+        return
+
+    if profiler == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError as e:
+            raise ImportError("The pyinstrument profiler needs the pyinstrument package: "
+                              "pip install pyinstrument") from e
+        sampler = Profiler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            if output_path is not None:
+                with open(output_path, "w") as f:
+                    f.write(sampler.output_html())
+                logger.info("pyinstrument profile saved at: %s", output_path)
+            else:
+                logger.info("%s", sampler.output_text())
+        return
+
+    raise ValueError(f"Unknown profiler: {profiler} (expected one of {', '.join(PROFILERS)})")
@@ -1,96 +1,273 @@
+import argparse
+import logging
 import sys
-
-import numpy as np
-import torch
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
-from speed_and_distance_estimator import SpeedAndDistanceEstimator
-from utils import read_video, save_video, convert_to_mp4
-from trackers import Tracker
-from team_assigner import TeamAssigner
-from player_ball_assigner import PlayerBallAssigner
-from camera_movement_estimator import CameraMovementEstimator
-from view_transformer import ViewTransformer
-
-
-def main(video_path="input_videos/demo.mp4"):
-    # Determine base path based on current script location
-    base_dir = Path(__file__).resolve().parent
-    model_path = base_dir / "models" / "best _model.pt"
-    output_path = base_dir / "output_videos" / "output_video.avi"
-
-    # Validate paths
-    if not model_path.exists():
-        raise FileNotFoundError(f"Model not found at: {model_path}")
-    if not Path(video_path).is_file():
+# Only the lightweight instrumentation is imported up front; each command imports the stages it runs, so
+# torch, ultralytics, supervision, sklearn and pandas are never loaded by a command that does not use them
+from instrumentation import PROFILERS, configure_logging, metrics, profile
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+MODEL_PATH = BASE_DIR / "models" / "best _model.pt"
+OUTPUT_PATH = BASE_DIR / "output_videos" / "output_video.mp4"
+POSSESSION_CSV_PATH = BASE_DIR / "output_videos" / "ball_control.csv"
+
+COMMANDS = ("detect", "analyse", "render", "export", "batch")
+
+# Seconds each command may spend importing its own modules before it starts working. The detector's torch and
+# ultralytics are imported when inference first runs, not here, so a cache hit never pays for them.
+IMPORT_BUDGETS = {"detect": 0.5, "analyse": 0.5, "render": 0.5, "export": 0.5, "batch": 0.5}
+
+
+@contextmanager
+def import_budget(command):
+    start = time.perf_counter()
+    with metrics.stage("imports"):
+        yield
+    elapsed = time.perf_counter() - start
+    logger.debug("Imported the %s modules in %.3fs", command, elapsed,
+                 extra={"command": command, "import_time": elapsed})
+    if elapsed > IMPORT_BUDGETS[command]:
+        logger.warning("Importing the %s modules took %.2fs, over the %.2fs budget", command, elapsed,
+                       IMPORT_BUDGETS[command], extra={"command": command, "import_time": elapsed})
+
+
+def check_inputs(video_path=None, live=False):
+    if not MODEL_PATH.exists():
+        raise FileNotFoundError(f"Model not found at: {MODEL_PATH}")
+    if video_path is not None and not live and not Path(video_path).is_file():
         raise FileNotFoundError(f"Input video not found at: {video_path}")
 
+
+def detect(video_path, cache_dir, cache_size_gb=5.0, window_size=100, camera_movement_params=None,
+           reader_params=None, tracker_params=None):
+    """Run detection, tracking and camera movement once, so later commands on the video are served from the cache."""
+    with import_budget("detect"):
+        from detection_cache import DetectionCache
+        from pipeline import StreamingPipeline
+
+    check_inputs(video_path)
+    cache = DetectionCache(cache_dir, max_size_bytes=int(cache_size_gb * 1024 ** 3))
+    pipeline = StreamingPipeline(str(MODEL_PATH), window_size=window_size, cache=cache,
+                                 camera_movement_params=camera_movement_params, reader_params=reader_params,
+                                 tracker_params=tracker_params)
+    tracks, _ = pipeline.get_tracks(video_path)
+    logger.info("Tracks of %d frames cached in: %s", len(tracks['players']), cache_dir)
+    return tracks
+
+
+def analyse_video(command, video_path, cache_dir=None, cache_size_gb=5.0, window_size=100,
+                  camera_movement_params=None, reader_params=None, tracker_params=None):
+    with import_budget(command):
+        from detection_cache import DetectionCache
+        from pipeline import StreamingPipeline
+
+    check_inputs(video_path)
+    cache = DetectionCache(cache_dir, max_size_bytes=int(cache_size_gb * 1024 ** 3)) if cache_dir else None
+    # Tracks and camera movement come from the cache when present, teams still need one pass over the frames
+    pipeline = StreamingPipeline(str(MODEL_PATH), window_size=window_size, cache=cache,
+                                 camera_movement_params=camera_movement_params, reader_params=reader_params,
+                                 tracker_params=tracker_params)
+    tracks, camera_movement_per_frame = pipeline.get_tracks(video_path)
+    ball_control_stats = pipeline.add_analytics_to_tracks(tracks, camera_movement_per_frame)
+    return tracks, camera_movement_per_frame, ball_control_stats, pipeline.speed_and_distance_estimator.frame_rate
+
+
+def analyse(video_path, cache_dir=None, cache_size_gb=5.0, window_size=100, camera_movement_params=None,
+            reader_params=None, tracker_params=None, possession_csv_path=None):
+    """Speed, distance and ball possession of every player, without rendering a video."""
+    tracks, _, ball_control_stats, frame_rate = analyse_video("analyse", video_path, cache_dir, cache_size_gb,
+                                                              window_size, camera_movement_params, reader_params,
+                                                              tracker_params)
+    save_analytics(tracks, ball_control_stats, possession_csv_path or POSSESSION_CSV_PATH, frame_rate)
+    return tracks, ball_control_stats
+
+
+def export(video_path, export_path, cache_dir=None, cache_size_gb=5.0, window_size=100,
+           camera_movement_params=None, reader_params=None, tracker_params=None):
+    """Tracks and per-frame analytics as a memory-mappable column bundle, without rendering a video."""
+    tracks, camera_movement_per_frame, ball_control_stats, frame_rate = analyse_video(
+        "export", video_path, cache_dir, cache_size_gb, window_size, camera_movement_params, reader_params,
+        tracker_params)
+
+    from track_store import TrackBundleWriter
+    with TrackBundleWriter(export_path, frame_rate) as results_writer:
+        results_writer.write_tracks(tracks, camera_movement_per_frame, ball_control_stats)
+    logger.info("Tracks exported to: %s", export_path)
+    return tracks, ball_control_stats
+
+
+def batch(source, output_dir, workers=None, worker_memory_gb=2.0, render=True, export=False, cache_dir=None,
+          cache_size_gb=5.0, window_size=100, camera_movement_params=None, encoder_params=None, reader_params=None,
+          tracker_params=None):
+    """Process every match of a directory or manifest in a pool of workers, resuming where a previous run stopped."""
+    with import_budget("batch"):
+        from detection_cache import DetectionCache
+        from pipeline import BatchRunner
+
+    check_inputs()
+    cache = DetectionCache(cache_dir, max_size_bytes=int(cache_size_gb * 1024 ** 3)) if cache_dir else None
+    runner = BatchRunner(str(MODEL_PATH), output_dir, workers=workers,
+                         worker_memory_bytes=int(worker_memory_gb * 1024 ** 3), window_size=window_size, cache=cache,
+                         camera_movement_params=camera_movement_params, encoder_params=encoder_params,
+                         reader_params=reader_params, tracker_params=tracker_params, render=render, export=export)
+    return runner.run(source)
+
+
+def render(video_path="input_videos/demo.mp4", stream=False, window_size=100, concurrent=False, queue_size=4,
+           cache_dir=None, cache_size_gb=5.0, camera_movement_params=None, possession_csv_path=None,
+           encoder_params=None, reader_params=None, tracker_params=None, workers=None, segment_seconds=120,
+           overlap_seconds=2, live=False, live_params=None, live_output=None, results_path=None, duration=None,
+           export_path=None):
+    with import_budget("render"):
+        from detection_cache import DetectionCache
+        from pipeline import StreamingPipeline, ConcurrentPipeline, ShardedPipeline, LivePipeline
+        from speed_and_distance_estimator import SpeedAndDistanceEstimator
+        from utils import VideoReader, create_video_writer
+        from track_store import TrackBundleWriter
+        from trackers import Tracker
+        from team_assigner import TeamAssigner
+        from player_ball_assigner import PlayerBallAssigner, BallControlStats
+        from camera_movement_estimator import CameraMovementEstimator
+        from view_transformer import ViewTransformer
+        from renderer import AnnotationRenderer
+
+    model_path = MODEL_PATH
+    output_path = OUTPUT_PATH
+    if possession_csv_path is None:
+        possession_csv_path = POSSESSION_CSV_PATH
+    check_inputs(video_path, live)
+
+    if live:
+        # Frame-by-frame on a live feed (or a file paced like one), publishing as it goes
+        pipeline = LivePipeline(str(model_path), camera_movement_params=camera_movement_params,
+                                encoder_params=encoder_params, tracker_params=tracker_params, **(live_params or {}))
+        pipeline.run(video_path, live_output or str(output_path), results_path=results_path, duration=duration,
+                     export_path=export_path)
+        return
+
+    # Detections, tracks and camera movement are cached by video content, model weights and parameters
+    cache = DetectionCache(cache_dir, max_size_bytes=int(cache_size_gb * 1024 ** 3)) if cache_dir else None
+
+    if workers:
+        # Overlapping segments of the match in separate processes, stitched back together
+        pipeline = ShardedPipeline(str(model_path), workers=workers, segment_seconds=segment_seconds,
+                                   overlap_seconds=overlap_seconds, window_size=window_size, cache=cache,
+                                   camera_movement_params=camera_movement_params, encoder_params=encoder_params,
+                                   reader_params=reader_params, tracker_params=tracker_params)
+        tracks, ball_control_stats = pipeline.run(video_path, str(output_path), export_path)
+        finish_output(output_path, tracks, ball_control_stats, possession_csv_path,
+                      pipeline.speed_and_distance_estimator.frame_rate)
+        return
+
+    if concurrent:
+        # Decode, inference, tracking, drawing and encoding in their own worker threads
+        pipeline = ConcurrentPipeline(str(model_path), window_size=window_size, queue_size=queue_size,
+                                      cache=cache, camera_movement_params=camera_movement_params,
+                                      encoder_params=encoder_params, reader_params=reader_params,
+                                      tracker_params=tracker_params)
+        tracks, ball_control_stats = pipeline.run(video_path, str(output_path), export_path)
+        finish_output(output_path, tracks, ball_control_stats, possession_csv_path,
+                      pipeline.speed_and_distance_estimator.frame_rate)
+        return
+
+    if stream:
+        # Decode, process and render in bounded windows of frames
+        pipeline = StreamingPipeline(str(model_path), window_size=window_size, cache=cache,
+                                     camera_movement_params=camera_movement_params, encoder_params=encoder_params,
+                                     reader_params=reader_params, tracker_params=tracker_params)
+        tracks, ball_control_stats = pipeline.run(video_path, str(output_path), export_path)
+        finish_output(output_path, tracks, ball_control_stats, possession_csv_path,
+                      pipeline.speed_and_distance_estimator.frame_rate)
+        return
+
     # Read the video
-    video_frames = read_video(video_path)
+    video_reader = VideoReader(video_path, **(reader_params or {}))
+    video_frames = list(video_reader)
 
     # Initialize tracker
-    tracker = Tracker(str(model_path))
-    tracks = tracker.get_object_tracks(video_frames)
+    tracker = Tracker(str(model_path), **(tracker_params or {}))
+    tracks_stub_path = None
+    if cache is not None:
+        tracks_stub_path = cache.get_entry_path("tracks", video_path, tracker.model_path,
+                                                **tracker.get_stub_params(),
+                                                **video_reader.get_stub_params())
+    tracks = tracker.get_object_tracks(video_frames,
+                                       read_from_stub=cache is not None and cache.has_entry(tracks_stub_path),
+                                       stub_path=tracks_stub_path)
 
     # Get players positions
     tracker.add_position_to_tracks(tracks)
 
     # Camera movement estimator
-    camera_movement_estimator = CameraMovementEstimator(video_frames[0])
-    camera_movement_per_frame = camera_movement_estimator.camera_movement(video_frames)
+    camera_movement_estimator = CameraMovementEstimator(video_frames[0], **(camera_movement_params or {}))
+    camera_movement_stub_path = None
+    if cache is not None:
+        camera_movement_stub_path = cache.get_entry_path("camera_movement", video_path,
+                                                         **camera_movement_estimator.get_stub_params(),
+                                                         **video_reader.get_stub_params())
+    camera_movement_per_frame = camera_movement_estimator.camera_movement(
+        video_frames,
+        read_from_stub=cache is not None and cache.has_entry(camera_movement_stub_path),
+        stub_path=camera_movement_stub_path)
+    if cache is not None:
+        cache.evict()
     camera_movement_estimator.add_adjust_positions_to_tracks(tracks, camera_movement_per_frame)
 
     # View transformer
     view_transformer = ViewTransformer()
-    view_transformer.add_transformed_position_to_tracks(tracks)
+    view_transformer.add_transformed_position_to_tracks(tracks, camera_movement_per_frame)
 
     # Interpolate ball positions
     tracks['ball'] = tracker.interpolate_ball_positions(tracks['ball'])
 
     # Assign speed and distance estimator
-    speed_and_distance_estimator = SpeedAndDistanceEstimator()
+    speed_and_distance_estimator = SpeedAndDistanceEstimator(frame_rate=video_reader.fps)
     speed_and_distance_estimator.add_speed_and_distance_to_track(tracks)
 
     # Assign player teams
     team_assigner = TeamAssigner()
     team_assigner.assign_team_color(video_frames[0], tracks['players'][0])
-
-    for frame_num, player_track in enumerate(tracks['players']):
-        for player_id, track in player_track.items():
-            team = team_assigner.get_player_team(video_frames[frame_num], track['bbox'], player_id)
-            track['team'] = team
-            track['team_color'] = team_assigner.team_colors.get(team, (128, 128, 128))
+    team_assigner.add_team_to_tracks(video_frames, tracks)
 
     # Assign ball acquisition
     player_assigner = PlayerBallAssigner()
-    team_ball_control = []
-    for frame_num, player_track in enumerate(tracks['players']):
-        ball_bbox = tracks['ball'][frame_num][1]['bbox']
-        assigned_player = player_assigner.assign_ball_to_player(player_track, ball_bbox)
-
-        if assigned_player != -1:
-            tracks['players'][frame_num][assigned_player]['has_ball'] = True
-            team_ball_control.append(tracks['players'][frame_num][assigned_player]['team'])
-        else:
-            team_ball_control.append(team_ball_control[-1] if team_ball_control else 0)
+    team_ball_control = player_assigner.add_ball_possession_to_tracks(tracks)
+    ball_control_stats = BallControlStats.from_team_ball_control(team_ball_control)
+
+    # Export every object's columns for downstream analytics
+    if export_path is not None:
+        with TrackBundleWriter(export_path, speed_and_distance_estimator.frame_rate) as results_writer:
+            results_writer.write_tracks(tracks, camera_movement_per_frame, ball_control_stats)
 
-    team_ball_control = np.array(team_ball_control)
+    # Draw output in place and write each frame straight to the encoder
+    renderer = AnnotationRenderer(tracks, ball_control_stats, camera_movement_per_frame)
+    writer = create_video_writer(str(output_path), (video_frames[0].shape[1], video_frames[0].shape[0]),
+                                 speed_and_distance_estimator.frame_rate, **(encoder_params or {}))
+    try:
+        for frame in renderer.render(video_frames):
+            writer.write(frame)
+    finally:
+        writer.release()
 
-    # Draw output
-    output_videos_frames = tracker.draw_annotations(video_frames, tracks, team_ball_control)
-    output_videos_frames = camera_movement_estimator.draw_camera_movement(output_videos_frames,
-                                                                          camera_movement_per_frame)
-    speed_and_distance_estimator.draw_speed_and_distance(output_videos_frames, tracks)
+    finish_output(output_path, tracks, ball_control_stats, possession_csv_path,
+                  speed_and_distance_estimator.frame_rate)
 
-    # Save the video
-    save_video(output_videos_frames, str(output_path))
-    avi_path = str(output_path)
-    mp4_path = avi_path.replace(".avi", ".mp4")
-    convert_to_mp4(avi_path, mp4_path)
 
-    print(f"[INFO] Video saved at: {output_path}")
+def finish_output(output_path, tracks, ball_control_stats, possession_csv_path, frame_rate):
+    logger.info("Video saved at: %s", output_path)
+    save_analytics(tracks, ball_control_stats, possession_csv_path, frame_rate)
 
-    print("\n[INFO] Final Speed and Distance per Player:")
+
+def save_analytics(tracks, ball_control_stats, possession_csv_path, frame_rate):
+    ball_control_stats.save_csv(possession_csv_path, frame_rate)
+    logger.info("Ball control time series saved at: %s", possession_csv_path)
+
+    logger.info("Final Speed and Distance per Player:")
     final_stats = {}
 
     for frame in tracks['players']:
@@ -107,15 +284,200 @@ def main(video_path="input_videos/demo.mp4"):
     for player_id in sorted(all_ids):
         if player_id in final_stats:
             speed, distance = final_stats[player_id]
-            print(f"Player ID {player_id}: {speed:.2f} km/h, {distance:.2f} meters")
+            logger.info("Player ID %s: %.2f km/h, %.2f meters", player_id, speed, distance,
+                        extra={"player_id": player_id, "speed": speed, "distance": distance})
         else:
-            print(f"Player ID {player_id}: Speed or distance not available")
+            logger.info("Player ID %s: Speed or distance not available", player_id)
 
 
-if __name__ == "__main__":
-    print("Using device:", torch.cuda.get_device_name(0) if torch.cuda.is_available() else "CPU")
-    if len(sys.argv) > 1:
-        video_path = sys.argv[1]
+def build_parser():
+    # Options every command takes: logging, metrics and profiling
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--metrics", default=None,
+                        help="time every stage and write a JSON report of stage timings, memory and latency here")
+    common.add_argument("--profile", choices=PROFILERS, default=None,
+                        help="profile the whole run with cProfile or pyinstrument")
+    common.add_argument("--profile-output", default=None,
+                        help="where to save the profile (pstats file for cprofile, HTML for pyinstrument)")
+    common.add_argument("--log-format", choices=["text", "json"], default="text",
+                        help="plain console messages or one JSON object per line")
+    common.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="INFO")
+
+    source = argparse.ArgumentParser(add_help=False)
+    source.add_argument("video_path", nargs="?", default=str(BASE_DIR / "input_videos" / "demo.mp4"))
+
+    # Everything that decides the tracks of a video: decoding, caching, detection and camera movement
+    video = argparse.ArgumentParser(add_help=False)
+    video.add_argument("--window-size", type=int, default=100,
+                       help="frames per window when the video is processed in windows")
+    video.add_argument("--cache-dir", default=str(BASE_DIR / "cache"),
+                       help="directory for cached detections, tracks and camera movement")
+    video.add_argument("--cache-size-gb", type=float, default=5.0,
+                       help="evict the least recently used cache entries above this size")
+    video.add_argument("--no-cache", action="store_true", help="always run inference, ignoring the cache")
+    video.add_argument("--camera-mode", choices=["max", "median", "affine"], default="max",
+                       help="how camera movement is estimated from the tracked features")
+    video.add_argument("--camera-scale", type=float, default=1.0,
+                       help="downscale factor applied to frames before optical flow")
+    video.add_argument("--camera-min-features", type=int, default=None,
+                       help="keep tracking features and only re-detect them below this count")
+    video.add_argument("--backend", choices=["pytorch", "onnx", "openvino"], default="pytorch",
+                       help="run the detector through PyTorch or an exported ONNX/OpenVINO model")
+    video.add_argument("--quantization", choices=["fp16", "int8"], default=None,
+                       help="quantize the exported detector (int8 needs the OpenVINO backend)")
+    video.add_argument("--calibration-data", default=None,
+                       help="dataset yaml used to calibrate INT8 quantization")
+    video.add_argument("--imgsz", type=int, default=640,
+                       help="detector input size, rounded up to a multiple of 32")
+    video.add_argument("--batch-size", type=int, default=None,
+                       help="frames per inference batch (default: chosen from measured throughput)")
+    video.add_argument("--ball-crop-size", type=int, default=None,
+                       help="re-detect the ball at native resolution in a crop of this size around its "
+                            "predicted position, with a tiled search when it is lost (rounded up to a multiple "
+                            "of 32)")
+    video.add_argument("--decoder", choices=["opencv", "ffmpeg"], default="opencv",
+                       help="decode the input with OpenCV or a piped ffmpeg process")
+    video.add_argument("--stride", type=int, default=1, help="analyse every Nth frame of the input video")
+    video.add_argument("--start", type=float, default=None, help="start of the time range to process, in seconds")
+    video.add_argument("--end", type=float, default=None, help="end of the time range to process, in seconds")
+
+    encoder = argparse.ArgumentParser(add_help=False)
+    encoder.add_argument("--codec", default="libx264", help="ffmpeg video encoder for the output video")
+    encoder.add_argument("--preset", default=None,
+                         help="encoder speed/compression preset (default: medium, ultrafast in live mode)")
+    encoder.add_argument("--crf", type=int, default=23, help="constant rate factor, lower is higher quality")
+    encoder.add_argument("--encoder-threads", type=int, default=0, help="encoder threads, 0 lets ffmpeg decide")
+
+    possession = argparse.ArgumentParser(add_help=False)
+    possession.add_argument("--possession-csv", default=None,
+                            help="where to write the per-frame ball control time series "
+                                 "(default: output_videos/ball_control.csv)")
+
+    parser = argparse.ArgumentParser(description="Football analysis. Without a command the video is rendered.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("detect", parents=[common, source, video],
+                          help="detect, track and estimate camera movement, filling the cache for later commands")
+    subparsers.add_parser("analyse", parents=[common, source, video, possession],
+                          help="speed, distance and ball possession per player, without rendering")
+
+    render_parser = subparsers.add_parser("render", parents=[common, source, video, encoder, possession],
+                                          help="annotate the video with tracks and analytics")
+    render_parser.add_argument("--stream", action="store_true",
+                               help="decode and process the video in bounded windows instead of loading it into "
+                                    "memory")
+    render_parser.add_argument("--concurrent", action="store_true",
+                               help="run decoding, inference, tracking, drawing and encoding as concurrent stages")
+    render_parser.add_argument("--queue-size", type=int, default=4,
+                               help="windows buffered between concurrent stages")
+    render_parser.add_argument("--live", action="store_true",
+                               help="treat the input as a live feed (file, camera index or stream URL) and process "
+                                    "it frame by frame within a latency budget")
+    render_parser.add_argument("--latency-budget", type=float, default=0.5,
+                               help="target end-to-end latency in live mode, in seconds; older frames are dropped")
+    render_parser.add_argument("--loop", action="store_true", help="loop a file input in live mode")
+    render_parser.add_argument("--duration", type=float, default=None,
+                               help="stop live mode after this many seconds")
+    render_parser.add_argument("--live-output", default=None,
+                               help="where live mode publishes the annotated stream: a file or a udp://, rtmp://, "
+                                    "rtsp:// URL (default: output_videos/output_video.mp4)")
+    render_parser.add_argument("--results", default=None,
+                               help="write per-frame live results as JSON lines to this path, or - for stdout")
+    render_parser.add_argument("--workers", type=int, default=None,
+                               help="split the match into segments processed by this many worker processes")
+    render_parser.add_argument("--segment-seconds", type=float, default=120,
+                               help="length of each segment in sharded mode")
+    render_parser.add_argument("--overlap-seconds", type=float, default=2,
+                               help="overlap between segments, used to carry track IDs and teams across them")
+    render_parser.add_argument("--export", default=None,
+                               help="also write tracks and per-frame analytics to this directory as "
+                                    "memory-mappable columns")
+
+    export_parser = subparsers.add_parser("export", parents=[common, source, video],
+                                          help="write tracks and per-frame analytics as memory-mappable columns, "
+                                               "without rendering")
+    export_parser.add_argument("--output", required=True, help="directory to write the column bundle to")
+
+    batch_parser = subparsers.add_parser("batch", parents=[common, video, encoder],
+                                         help="process many matches in a pool of workers that load the model once, "
+                                              "resuming after a crash")
+    batch_parser.add_argument("source", help="a directory of videos, or a manifest listing one video path per line")
+    batch_parser.add_argument("--output-dir", default=str(BASE_DIR / "output_videos" / "batch"),
+                              help="one directory of outputs per match, plus the checkpoint and the summary")
+    batch_parser.add_argument("--workers", type=int, default=None,
+                              help="worker processes (default: one per core, as far as memory allows)")
+    batch_parser.add_argument("--worker-memory-gb", type=float, default=2.0,
+                              help="memory to reserve for each worker when sizing the pool")
+    batch_parser.add_argument("--no-render", action="store_true",
+                              help="only compute the analytics, without annotating the videos")
+    batch_parser.add_argument("--export", action="store_true",
+                              help="also write each match's tracks and per-frame analytics as memory-mappable "
+                                   "columns")
+    return parser
+
+
+def parse_args(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # A bare video path (or no arguments at all) renders the video, as before there were commands
+    if not argv or argv[0] not in COMMANDS and argv[0] not in ("-h", "--help"):
+        argv = ["render", *argv]
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "detect" and args.no_cache:
+        parser.error("detect only fills the cache, it cannot be combined with --no-cache")
+    return args
+
+
+def get_encoder_params(args):
+    return {key: value for key, value in {"codec": args.codec, "preset": args.preset, "crf": args.crf,
+                                          "threads": args.encoder_threads}.items() if value is not None}
+
+
+def run_command(args):
+    video_params = {
+        "cache_dir": None if args.no_cache else args.cache_dir,
+        "cache_size_gb": args.cache_size_gb,
+        "window_size": args.window_size,
+        "camera_movement_params": {"mode": args.camera_mode, "scale": args.camera_scale,
+                                   "min_features": args.camera_min_features},
+        "reader_params": {"backend": args.decoder, "stride": args.stride, "start_time": args.start,
+                          "end_time": args.end},
+        "tracker_params": {"backend": args.backend, "quantization": args.quantization,
+                           "calibration_data": args.calibration_data, "imgsz": args.imgsz,
+                           "batch_size": args.batch_size, "ball_crop_size": args.ball_crop_size},
+    }
+
+    if args.command == "detect":
+        detect(args.video_path, **video_params)
+    elif args.command == "analyse":
+        analyse(args.video_path, possession_csv_path=args.possession_csv, **video_params)
+    elif args.command == "export":
+        export(args.video_path, args.output, **video_params)
+    elif args.command == "batch":
+        batch(args.source, args.output_dir, workers=args.workers, worker_memory_gb=args.worker_memory_gb,
+              render=not args.no_render, export=args.export, encoder_params=get_encoder_params(args), **video_params)
     else:
-        video_path = Path(__file__).resolve().parent / "input_videos" / "demo.mp4"
-    main(str(video_path))
+        render(args.video_path, stream=args.stream, concurrent=args.concurrent, queue_size=args.queue_size,
+               possession_csv_path=args.possession_csv, encoder_params=get_encoder_params(args),
+               workers=args.workers, segment_seconds=args.segment_seconds, overlap_seconds=args.overlap_seconds,
+               live=args.live, live_params={"latency_budget": args.latency_budget, "loop": args.loop},
+               live_output=args.live_output, results_path=args.results, duration=args.duration,
+               export_path=args.export, **video_params)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    configure_logging(args.log_level, json_logs=args.log_format == "json")
+    if args.metrics is not None:
+        metrics.enable()
+
+    with profile(args.profile, args.profile_output):
+        run_command(args)
+
+    if args.metrics is not None:
+        metrics.save_report(args.metrics)
+        logger.info("Metrics report saved at: %s", args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+from .streaming_pipeline import StreamingPipeline
+from .concurrent_pipeline import ConcurrentPipeline
+from .sharded_pipeline import ShardedPipeline
+from .live_pipeline import LivePipeline
+from .batch_runner import BatchRunner
@@ -0,0 +1,277 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import cv2
+
+from instrumentation import configure_logging, get_available_ram, get_logging_config, metrics
+from speed_and_distance_estimator import SpeedAndDistanceEstimator
+from team_assigner import TeamAssigner
+from trackers import Tracker
+from .streaming_pipeline import StreamingPipeline
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".m4v", ".ts", ".webm")
+
+# One pipeline per worker process: the detector is loaded by the first video a worker processes and reused after
+_worker_pipeline = None
+
+
+def _init_worker(pipeline_params, threads, metrics_enabled, logging_config):
+    global _worker_pipeline
+    if logging_config is not None:
+        configure_logging(**logging_config)
+    # Split the cores between the workers instead of letting every process use all of them
+    import torch
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+    metrics.enable(metrics_enabled)
+    _worker_pipeline = StreamingPipeline(**pipeline_params)
+
+
+def _process_video(video_path, output_dir, render, export):
+    pipeline = _worker_pipeline
+    # Everything learned from the previous video is dropped, only the loaded model is kept
+    pipeline.tracker.reset()
+    pipeline.team_assigner = TeamAssigner()
+    pipeline.speed_and_distance_estimator = SpeedAndDistanceEstimator()
+
+    metrics.reset()
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = {"possession_csv": os.path.join(output_dir, "ball_control.csv")}
+    if render:
+        outputs["video"] = os.path.join(output_dir, "output_video.mp4")
+    if export:
+        outputs["export"] = os.path.join(output_dir, "tracks")
+
+    start = time.perf_counter()
+    if render:
+        tracks, ball_control_stats = pipeline.run(video_path, outputs["video"], outputs.get("export"))
+    else:
+        tracks, camera_movement_per_frame = pipeline.get_tracks(video_path)
+        ball_control_stats = pipeline.add_analytics_to_tracks(tracks, camera_movement_per_frame)
+        results_writer = pipeline.open_results_writer(outputs.get("export"))
+        if results_writer is not None:
+            with results_writer:
+                results_writer.write_tracks(tracks, camera_movement_per_frame, ball_control_stats)
+    ball_control_stats.save_csv(outputs["possession_csv"], pipeline.speed_and_distance_estimator.frame_rate)
+    elapsed = time.perf_counter() - start
+
+    frames = len(tracks["players"])
+    result = {
+        "frames": frames,
+        "elapsed": elapsed,
+        "fps": frames / elapsed if elapsed > 0 else 0.0,
+        "worker": os.getpid(),
+        "outputs": outputs,
+    }
+    return result, metrics.snapshot()
+
+
+def find_videos(source):
+    """Videos of a batch: every video file under a directory, or the paths listed one per line in a manifest."""
+    source = Path(source)
+    if source.is_dir():
+        return sorted(path.resolve() for path in source.rglob("*")
+                      if path.is_file() and path.suffix.lower() in VIDEO_EXTENSIONS)
+
+    videos = []
+    with open(source) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            # Relative entries are relative to the manifest, so a manifest can travel with its videos
+            path = Path(line)
+            videos.append((path if path.is_absolute() else source.parent / path).resolve())
+    return videos
+
+
+def get_output_names(videos):
+    # Matches are named by file stem; stems that repeat across directories get a short hash of their path
+    stems = [video.stem for video in videos]
+    return {video: stem if stems.count(stem) == 1 else f"{stem}-{hashlib.sha1(str(video).encode()).hexdigest()[:8]}"
+            for video, stem in zip(videos, stems)}
+
+
+def get_video_signature(video):
+    # Size and modification time identify a video version without reading the whole file
+    stat = os.stat(video)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+class BatchRunner():
+    """Process many matches in a pool of worker processes that each load the model once.
+
+    Every finished video is appended to a checkpoint file in the output directory; a rerun after a crash skips
+    the videos recorded as done (unless the file changed since) and retries the rest.
+    """
+
+    def __init__(self, model_path, output_dir, workers=None, worker_memory_bytes=2 * 1024 ** 3, window_size=100,
+                 cache=None, camera_movement_params=None, encoder_params=None, reader_params=None,
+                 tracker_params=None, render=True, export=False):
+        self.output_dir = Path(output_dir).resolve()
+        self.workers = workers
+        self.worker_memory_bytes = worker_memory_bytes
+        self.render = render
+        self.export = export
+        self.checkpoint_path = self.output_dir / "checkpoint.jsonl"
+        self.summary_path = self.output_dir / "summary.json"
+        self.pipeline_params = {
+            "model_path": model_path,
+            "window_size": window_size,
+            "cache": cache,
+            "camera_movement_params": camera_movement_params,
+            "encoder_params": encoder_params,
+            "reader_params": reader_params,
+            "tracker_params": tracker_params,
+        }
+
+    def get_pipeline_params(self):
+        # Exported backends are converted here, once, and handed to the workers: workers spawned together would
+        # otherwise all export the same model on their first video
+        tracker_params = dict(self.pipeline_params["tracker_params"] or {})
+        tracker_params["export_path"] = Tracker(self.pipeline_params["model_path"], **tracker_params).export_backend()
+        return dict(self.pipeline_params, tracker_params=tracker_params)
+
+    def get_worker_count(self, num_videos):
+        if self.workers:
+            return max(min(self.workers, num_videos), 1)
+        # As many workers as there are cores, as long as each can hold a model and a window of frames
+        workers = os.cpu_count() or 1
+        available = get_available_ram()
+        if available is not None:
+            workers = min(workers, max(int(available // self.worker_memory_bytes), 1))
+        return max(min(workers, num_videos), 1)
+
+    def load_checkpoint(self):
+        # The last record of a video wins, so a video that failed and then succeeded counts as done
+        records = {}
+        if not self.checkpoint_path.exists():
+            return records
+        with open(self.checkpoint_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash
+                    continue
+                records[record["video"]] = record
+        return records
+
+    def save_record(self, record):
+        # Appended and synced as each video finishes, so a crash loses at most the videos still in progress
+        with open(self.checkpoint_path, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def is_done(self, record, video):
+        # Done with the current file and still holding every output this run asks for
+        expected_outputs = {"possession_csv"}
+        if self.render:
+            expected_outputs.add("video")
+        if self.export:
+            expected_outputs.add("export")
+        return (record is not None and record["status"] == "done"
+                and record["signature"] == get_video_signature(video)
+                and expected_outputs.issubset(record["outputs"])
+                and all(os.path.exists(path) for path in record["outputs"].values()))
+
+    def run(self, source):
+        videos = find_videos(source)
+        if not videos:
+            raise ValueError(f"No videos found in: {source}")
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        output_names = get_output_names(videos)
+
+        checkpoint = self.load_checkpoint()
+        pending, already_done = [], 0
+        for video in videos:
+            if not video.is_file():
+                # A missing match is reported in the summary instead of stopping the rest of the batch
+                logger.error("Input video not found at: %s", video)
+                checkpoint[str(video)] = {"video": str(video), "status": "missing"}
+            elif self.is_done(checkpoint.get(str(video)), video):
+                already_done += 1
+            else:
+                pending.append(video)
+        if already_done:
+            logger.info("Resuming batch: %d of %d videos already done", already_done, len(videos))
+        # Longest videos first, so a long match does not start last and hold up the whole batch
+        pending.sort(key=lambda video: os.path.getsize(video), reverse=True)
+
+        start = time.perf_counter()
+        frames_processed = 0
+        workers = self.get_worker_count(len(pending)) if pending else 0
+        if pending:
+            threads = max((os.cpu_count() or 1) // workers, 1)
+            logger.info("Processing %d videos with %d workers", len(pending), workers)
+
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                     initargs=(self.get_pipeline_params(), threads, metrics.enabled,
+                                               get_logging_config())) as pool:
+                futures = {pool.submit(_process_video, str(video), str(self.output_dir / output_names[video]),
+                                       self.render, self.export): video for video in pending}
+                for done, future in enumerate(as_completed(futures), start=1):
+                    video = futures[future]
+                    record = {"video": str(video), "signature": get_video_signature(video),
+                              "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+                    try:
+                        result, snapshot = future.result()
+                    except Exception as e:
+                        # A failed video is recorded and retried by the next run; the rest of the batch carries on
+                        record.update(status="failed", error=repr(e))
+                        logger.error("[%d/%d] %s failed: %r", done, len(pending), output_names[video], e,
+                                     extra={"video": str(video)}, exc_info=e)
+                    else:
+                        metrics.merge(snapshot)
+                        frames_processed += result["frames"]
+                        record.update(status="done", **result)
+                        logger.info("[%d/%d] %s: %d frames in %.1fs (%.1f fps)", done, len(pending),
+                                    output_names[video], result["frames"], result["elapsed"], result["fps"],
+                                    extra={"video": str(video), "frames": result["frames"],
+                                           "elapsed": result["elapsed"], "fps": result["fps"]})
+                    self.save_record(record)
+                    checkpoint[str(video)] = record
+
+        return self.write_summary(videos, checkpoint, time.perf_counter() - start, workers, frames_processed)
+
+    def write_summary(self, videos, checkpoint, wall_time, workers, frames_processed):
+        records = [checkpoint.get(str(video), {"video": str(video), "status": "pending"}) for video in videos]
+        done = [record for record in records if record["status"] == "done"]
+        frames = sum(record["frames"] for record in done)
+        processing_time = sum(record["elapsed"] for record in done)
+        summary = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "workers": workers,
+            "wall_time": wall_time,
+            "videos": records,
+            "totals": {
+                "videos": len(records),
+                "done": len(done),
+                "failed": sum(record["status"] == "failed" for record in records),
+                "missing": sum(record["status"] == "missing" for record in records),
+                "frames": frames,
+                "processing_time": processing_time,
+                # Speed of one worker on one video, and of the whole pool over this run's wall time
+                "fps": frames / processing_time if processing_time > 0 else 0.0,
+                "pool_fps": frames_processed / wall_time if frames_processed else 0.0,
+            },
+        }
+        with open(self.summary_path, "w") as f:
+            json.dump(summary, f, indent=2, default=str)
+
+        totals = summary["totals"]
+        logger.info("Batch finished: %d of %d videos done, %d failed, %d missing; %d frames at %.1f fps per worker, "
+                    "%.1f fps for the pool", totals["done"], totals["videos"], totals["failed"], totals["missing"],
+                    totals["frames"], totals["fps"], totals["pool_fps"])
+        logger.info("Batch summary saved at: %s", self.summary_path)
+        return summary
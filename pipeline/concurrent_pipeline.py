@@ -0,0 +1,209 @@
+import logging
+import queue
+import threading
+import time
+
+from renderer import AnnotationRenderer
+from utils import iter_frame_batches, create_video_writer
+from .streaming_pipeline import StreamingPipeline
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class PipelineStage(threading.Thread):
+    def __init__(self, name, func, input_queue, output_queue, stop_event):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.stop_event = stop_event
+
+        self.frames = 0
+        self.busy_time = 0.0
+        self.input_wait_time = 0.0
+        self.output_wait_time = 0.0
+        self.error = None
+
+    def run(self):
+        try:
+            if self.input_queue is None:
+                self.run_source()
+            else:
+                self.run_worker()
+        except Exception as e:
+            self.error = e
+            self.stop_event.set()
+        finally:
+            self.put(_END)
+
+    def run_source(self):
+        # The first stage pulls its items from an iterator instead of a queue
+        items = iter(self.func)
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            item = next(items, _END)
+            self.busy_time += time.perf_counter() - start
+            if item is _END:
+                break
+            self.frames += len(item[1])
+            self.put(item)
+
+    def run_worker(self):
+        while True:
+            item = self.get()
+            if item is _END:
+                break
+            start = time.perf_counter()
+            outputs = self.func(item)
+            self.busy_time += time.perf_counter() - start
+            self.frames += len(item[1])
+            for output in outputs:
+                self.put(output)
+
+    def get(self):
+        start = time.perf_counter()
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    return self.input_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _END
+        finally:
+            self.input_wait_time += time.perf_counter() - start
+
+    def put(self, item):
+        if self.output_queue is None:
+            return
+        start = time.perf_counter()
+        while not self.stop_event.is_set():
+            try:
+                self.output_queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.output_wait_time += time.perf_counter() - start
+
+    def get_stats(self):
+        return {
+            "frames": self.frames,
+            "busy_time": self.busy_time,
+            "fps": self.frames / self.busy_time if self.busy_time > 0 else 0.0,
+            "input_wait_time": self.input_wait_time,
+            "output_wait_time": self.output_wait_time,
+        }
+
+
+def run_stages(source, stages, queue_size=4):
+    stop_event = threading.Event()
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+
+    workers = [PipelineStage(source[0], source[1], None, queues[0], stop_event)]
+    for i, (name, func) in enumerate(stages):
+        output_queue = queues[i + 1] if i + 1 < len(stages) else None
+        workers.append(PipelineStage(name, func, queues[i], output_queue, stop_event))
+
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    for worker in workers:
+        if worker.error is not None:
+            raise worker.error
+
+    return {worker.name: worker.get_stats() for worker in workers}
+
+
+def print_stage_stats(stage_stats):
+    for name, stats in stage_stats.items():
+        logger.info("Stage %s: %d frames, busy %.2fs (%.1f fps), waiting for input %.2fs, blocked on output %.2fs",
+                    name, stats['frames'], stats['busy_time'], stats['fps'], stats['input_wait_time'],
+                    stats['output_wait_time'], extra={"stage": name, **stats})
+
+    bottleneck = max(stage_stats, key=lambda name: stage_stats[name]['busy_time'])
+    logger.info("Bottleneck stage: %s", bottleneck)
+
+
+class ConcurrentPipeline(StreamingPipeline):
+    def __init__(self, model_path, window_size=20, queue_size=4, cache=None, camera_movement_params=None,
+                 encoder_params=None, reader_params=None, tracker_params=None):
+        super().__init__(model_path, window_size=window_size, cache=cache,
+                         camera_movement_params=camera_movement_params, encoder_params=encoder_params,
+                         reader_params=reader_params, tracker_params=tracker_params)
+        self.queue_size = queue_size
+        self.stage_stats = {}
+
+    def run(self, video_path, output_path, export_path=None):
+        self.stage_stats = {}
+
+        tracks, camera_movement_per_frame = self.get_tracks(video_path)
+
+        start = time.perf_counter()
+        ball_control_stats = self.add_analytics_to_tracks(tracks, camera_movement_per_frame)
+        elapsed = time.perf_counter() - start
+        self.stage_stats["analytics"] = {
+            "frames": len(camera_movement_per_frame),
+            "busy_time": elapsed,
+            "fps": len(camera_movement_per_frame) / elapsed if elapsed > 0 else 0.0,
+            "input_wait_time": 0.0,
+            "output_wait_time": 0.0,
+        }
+
+        self.render(video_path, output_path, tracks, camera_movement_per_frame, ball_control_stats, export_path)
+
+        print_stage_stats(self.stage_stats)
+        return tracks, ball_control_stats
+
+    def get_tracks(self, video_path):
+        self.start_tracks(video_path)
+
+        def detect(batch):
+            start_frame, frames = batch
+            return [(start_frame, frames, self.detect_window(frames))]
+
+        def track(batch):
+            # ByteTrack, camera movement and team assignment depend on the previous frame, so they stay sequential
+            self.track_window(video_path, *batch)
+            return []
+
+        source = ("decode", iter_frame_batches(self.video_reader, self.window_size))
+        stats = run_stages(source, [("inference", detect), ("tracking", track)], self.queue_size)
+        self.stage_stats.update(stats)
+
+        return self.finish_tracks(video_path)
+
+    def render(self, video_path, output_path, tracks, camera_movement_per_frame, ball_control_stats,
+               export_path=None):
+        renderer = AnnotationRenderer(tracks, ball_control_stats, camera_movement_per_frame)
+        writer = None
+        results_writer = self.open_results_writer(export_path)
+
+        def draw(batch):
+            start_frame, frames = batch
+            return [(start_frame, list(renderer.render(frames, start_frame)))]
+
+        def encode(batch):
+            nonlocal writer
+            start_frame, frames = batch
+            if writer is None:
+                writer = create_video_writer(output_path, (frames[0].shape[1], frames[0].shape[0]),
+                                             self.speed_and_distance_estimator.frame_rate, **self.encoder_params)
+            for frame in frames:
+                writer.write(frame)
+            if results_writer is not None:
+                results_writer.write_tracks(tracks, camera_movement_per_frame, ball_control_stats, start_frame,
+                                            start_frame + len(frames))
+            return []
+
+        source = ("decode_render", iter_frame_batches(self.open_video(video_path), self.window_size))
+        try:
+            stats = run_stages(source, [("draw", draw), ("encode", encode)], self.queue_size)
+            self.stage_stats.update(stats)
+        finally:
+            if writer is not None:
+                writer.release()
+            if results_writer is not None:
+                results_writer.close()
@@ -0,0 +1,246 @@
+import json
+import logging
+import sys
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from camera_movement_estimator import CameraMovementEstimator
+from instrumentation import metrics
+from player_ball_assigner import PlayerBallAssigner, BallControlStats
+from renderer import AnnotationRenderer
+from speed_and_distance_estimator import SpeedAndDistanceEstimator
+from team_assigner import TeamAssigner
+from track_store import TrackBundleWriter
+from trackers import Tracker
+from utils import LiveFrameSource, create_video_writer
+from view_transformer import ViewTransformer
+
+logger = logging.getLogger(__name__)
+
+
+class LivePipeline():
+    """Process a live feed frame by frame with causal stages only, dropping frames to stay within a latency budget."""
+
+    def __init__(self, model_path, latency_budget=0.5, buffer_size=4, loop=False, max_ball_gap=5,
+                 team_update_interval=10, camera_movement_params=None, encoder_params=None, tracker_params=None):
+        self.latency_budget = latency_budget
+        self.buffer_size = buffer_size
+        self.loop = loop
+        self.max_ball_gap = max_ball_gap
+        self.team_update_interval = team_update_interval
+        self.camera_movement_params = camera_movement_params or {}
+        # Encode for latency rather than size, timestamping frames as they arrive
+        self.encoder_params = {"preset": "ultrafast", "tune": "zerolatency", "wallclock_timestamps": True,
+                               **(encoder_params or {})}
+
+        # One frame per inference call: batching would hold frames back until the batch fills
+        tracker_params = dict(tracker_params or {})
+        if tracker_params.get("batch_size") is None:
+            tracker_params["batch_size"] = 1
+        self.tracker = Tracker(model_path, **tracker_params)
+        # Load the detector up front so the first frames are not held back by the import
+        self.tracker.load_model()
+        self.team_assigner = TeamAssigner()
+        self.player_assigner = PlayerBallAssigner()
+        self.view_transformer = ViewTransformer()
+        self.speed_and_distance_estimator = SpeedAndDistanceEstimator()
+        self.camera_movement_estimator = None
+        self.renderer = None
+
+    def start(self, frame_rate):
+        self.tracker.reset()
+        self.team_assigner = TeamAssigner()
+        self.speed_and_distance_estimator = SpeedAndDistanceEstimator(frame_rate=frame_rate)
+        self.camera_movement_estimator = None
+        # Camera motion accumulated since the first frame, which places each frame's view on the pitch
+        self.camera_position = np.zeros(2)
+        self.ball_control_stats = BallControlStats()
+        self.renderer = AnnotationRenderer({}, self.ball_control_stats, [])
+
+        self.team_in_control = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        # Smoothed processing time per frame, used to predict whether a frame can still make the budget
+        self.processing_time = 0.0
+        self.latencies = deque(maxlen=10000)
+
+    def select_frame(self, frames):
+        # The oldest frame that can still be finished within the budget; anything older is dropped. When none
+        # can, the newest frame is processed so the output never stalls.
+        now = time.perf_counter()
+        for i, (_, capture_time, _) in enumerate(frames):
+            if now - capture_time + self.processing_time <= self.latency_budget:
+                return i
+        return len(frames) - 1
+
+    def fill_ball_position(self, ball_track):
+        # Causal stand-in for interpolation: follow the ball tracker's prediction for a few frames
+        ball_tracker = self.tracker.ball_tracker
+        if 1 not in ball_track and ball_tracker.initialized and ball_tracker.missed_frames <= self.max_ball_gap:
+            ball_track[1] = {"bbox": ball_tracker.get_bbox()}
+
+    def process_frame(self, frame_num, frame):
+        tracks = {
+            "players": [],
+            "referees": [],
+            "ball": []
+        }
+        self.tracker.add_detections_to_tracks(tracks, self.tracker.detect_frames([frame]))
+
+        if self.camera_movement_estimator is None:
+            self.camera_movement_estimator = CameraMovementEstimator(frame, **self.camera_movement_params)
+        camera_movement = self.camera_movement_estimator.update_camera_movement(frame)
+
+        # The colour model keeps learning from the feed instead of being fitted once on the first frame
+        if self.team_assigner.kmeans is None or self.frames_processed % self.team_update_interval == 0:
+            self.team_assigner.update_team_colors(frame, tracks['players'][0])
+        self.team_assigner.add_team_to_tracks([frame], tracks)
+
+        self.fill_ball_position(tracks['ball'][0])
+        self.tracker.add_position_to_tracks(tracks)
+        self.camera_movement_estimator.add_adjust_positions_to_tracks(tracks, [camera_movement])
+        self.view_transformer.add_transformed_position_to_tracks(tracks, [camera_movement], self.camera_position)
+        self.camera_position = self.camera_position + np.asarray(camera_movement, dtype=np.float64)
+        self.speed_and_distance_estimator.update_speed_and_distance(frame_num, tracks)
+
+        # Possession stays with the last team that had the ball, as in the offline pass
+        players = tracks['players'][0]
+        ball = tracks['ball'][0].get(1)
+        if ball is not None:
+            player_id = self.player_assigner.assign_ball_to_player(players, ball['bbox'])
+            if player_id != -1:
+                players[player_id]['has_ball'] = True
+                self.team_in_control = players[player_id].get('team', 0)
+        self.ball_control_stats.update([self.team_in_control])
+
+        return tracks, camera_movement
+
+    def render_frame(self, frame, tracks, camera_movement, latency):
+        num_frames = len(self.ball_control_stats)
+        self.renderer.tracks = tracks
+        self.renderer.ball_control_stats = self.ball_control_stats.get_window(num_frames - 1, num_frames)
+        self.renderer.camera_movement_per_frame = [camera_movement]
+        self.renderer.render_frame(frame, 0)
+
+        cv2.putText(frame, f"Latency: {latency * 1000:.0f} ms", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
+        return frame
+
+    def get_frame_result(self, frame_num, frame_rate, tracks, camera_movement):
+        players = tracks['players'][0]
+        ball = tracks['ball'][0].get(1)
+        team_1, team_2 = self.ball_control_stats.get_ball_control(len(self.ball_control_stats) - 1)
+
+        def optional_float(value):
+            return None if value is None else float(value)
+
+        return {
+            "frame": frame_num,
+            "time": frame_num / frame_rate,
+            "players": [{"id": int(player_id),
+                         "team": int(player.get('team', 0)),
+                         "bbox": [float(value) for value in player['bbox']],
+                         "speed": optional_float(player.get('speed')),
+                         "distance": optional_float(player.get('distance')),
+                         "has_ball": bool(player.get('has_ball', False))}
+                        for player_id, player in players.items()],
+            "referees": [{"id": int(referee_id), "bbox": [float(value) for value in referee['bbox']]}
+                         for referee_id, referee in tracks['referees'][0].items()],
+            "ball": [float(value) for value in ball['bbox']] if ball is not None else None,
+            "camera_movement": [float(value) for value in camera_movement],
+            "team_ball_control": int(self.team_in_control),
+            "ball_control": [team_1, team_2],
+        }
+
+    def get_summary(self, source):
+        latencies = np.array(self.latencies)
+        summary = {
+            "frames_captured": source.captured,
+            "frames_processed": self.frames_processed,
+            # Frames overwritten in the capture buffer plus frames skipped to meet the budget
+            "frames_dropped": source.dropped + self.frames_dropped,
+            "latency_budget": self.latency_budget,
+        }
+        if len(latencies):
+            summary.update({
+                "latency_p50": float(np.percentile(latencies, 50)),
+                "latency_p95": float(np.percentile(latencies, 95)),
+                "latency_max": float(latencies.max()),
+            })
+        return summary
+
+    def run(self, source, output_path=None, results_path=None, duration=None, on_result=None, export_path=None):
+        """Process source until it ends, duration seconds pass or the run is interrupted, and return a summary.
+
+        Annotated frames go to output_path (a file or a stream URL), per-frame results as JSON lines to
+        results_path ("-" for stdout) and to on_result, and the tracks to a columnar bundle at export_path.
+        """
+        live_source = LiveFrameSource(source, buffer_size=self.buffer_size, loop=self.loop)
+        self.start(live_source.fps)
+        writer = None
+        results_writer = TrackBundleWriter(export_path, live_source.fps) if export_path is not None else None
+        results_file = None
+        if results_path is not None:
+            results_file = sys.stdout if results_path == "-" else open(results_path, "w")
+
+        try:
+            with live_source:
+                end_time = time.perf_counter() + duration if duration is not None else None
+                pending = []
+                while end_time is None or time.perf_counter() < end_time:
+                    pending += live_source.get_frames(block=not pending)
+                    if not pending:
+                        break
+
+                    index = self.select_frame(pending)
+                    self.frames_dropped += index
+                    metrics.count("live_frames_dropped", index)
+                    frame_num, capture_time, frame = pending[index]
+                    pending = pending[index + 1:]
+
+                    start = time.perf_counter()
+                    tracks, camera_movement = self.process_frame(frame_num, frame)
+                    self.render_frame(frame, tracks, camera_movement, time.perf_counter() - capture_time)
+
+                    if output_path is not None:
+                        if writer is None:
+                            writer = create_video_writer(output_path, (frame.shape[1], frame.shape[0]),
+                                                         live_source.fps, **self.encoder_params)
+                        writer.write(frame)
+
+                    # End-to-end: from the frame leaving the decoder to its results being published
+                    result = self.get_frame_result(frame_num, live_source.fps, tracks, camera_movement)
+                    result["latency"] = time.perf_counter() - capture_time
+                    if results_file is not None:
+                        results_file.write(json.dumps(result) + "\n")
+                        results_file.flush()
+                    if on_result is not None:
+                        on_result(result)
+                    if results_writer is not None:
+                        num_frames = len(self.ball_control_stats)
+                        results_writer.write_frame(frame_num, {object: track[0] for object, track in tracks.items()},
+                                                   camera_movement, self.ball_control_stats.counts[num_frames - 1])
+
+                    self.latencies.append(result["latency"])
+                    metrics.observe("frame_latency", result["latency"])
+                    self.processing_time = 0.9 * self.processing_time + 0.1 * (time.perf_counter() - start)
+                    self.frames_processed += 1
+        except KeyboardInterrupt:
+            logger.info("Live processing interrupted")
+        finally:
+            if writer is not None:
+                writer.release()
+            if results_writer is not None:
+                results_writer.close()
+            if results_file is not None and results_file is not sys.stdout:
+                results_file.close()
+
+        summary = self.get_summary(live_source)
+        logger.info("Processed %d of %d frames, dropped %d", summary['frames_processed'],
+                    summary['frames_captured'], summary['frames_dropped'], extra=summary)
+        if "latency_p50" in summary:
+            logger.info("Latency p50 %.0f ms, p95 %.0f ms, max %.0f ms", summary['latency_p50'] * 1000,
+                        summary['latency_p95'] * 1000, summary['latency_max'] * 1000)
+        return summary
@@ -0,0 +1,260 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from imageio_ffmpeg import get_ffmpeg_exe
+
+from camera_movement_estimator import CameraMovementEstimator
+from instrumentation import configure_logging, get_logging_config, metrics
+from renderer import AnnotationRenderer
+from team_assigner import TeamAssigner
+from utils import VideoReader, create_video_writer
+from .streaming_pipeline import StreamingPipeline
+
+logger = logging.getLogger(__name__)
+
+# One pipeline per worker process, so the model is loaded once per worker and not once per segment
+_worker_pipeline = None
+
+
+def _init_worker(pipeline_params, threads, metrics_enabled, logging_config):
+    global _worker_pipeline
+    if logging_config is not None:
+        configure_logging(**logging_config)
+    # Split the cores between the workers instead of letting every process use all of them
+    import torch
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+    metrics.enable(metrics_enabled)
+    _worker_pipeline = StreamingPipeline(**pipeline_params)
+
+
+def _track_segment(video_path, reader_params):
+    pipeline = _worker_pipeline
+    pipeline.reader_params = reader_params
+    pipeline.tracker.reset()
+    pipeline.team_assigner = TeamAssigner()
+
+    metrics.reset()
+    tracks, camera_movement_per_frame = pipeline.get_tracks(video_path)
+    # Each task hands back what it measured, for the parent to merge into one report
+    return (tracks, list(camera_movement_per_frame), dict(pipeline.team_assigner.team_colors)), metrics.snapshot()
+
+
+def _render_segment(video_path, output_path, reader_params, tracks, ball_control_stats, camera_movement_per_frame,
+                    fps, encoder_params):
+    metrics.reset()
+    renderer = AnnotationRenderer(tracks, ball_control_stats, camera_movement_per_frame)
+    writer = None
+    try:
+        for frame in renderer.render(VideoReader(video_path, **reader_params)):
+            if writer is None:
+                writer = create_video_writer(output_path, (frame.shape[1], frame.shape[0]), fps, **encoder_params)
+            writer.write(frame)
+    finally:
+        if writer is not None:
+            writer.release()
+    return output_path, metrics.snapshot()
+
+
+def box_iou(boxes_a, boxes_b):
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+def match_track_ids(previous_frames, current_frames, min_iou=0.5):
+    """Map track IDs of the current segment to the previous one's, by mean box IoU over the overlapping frames."""
+    scores = {}
+    for previous_track, current_track in zip(previous_frames, current_frames):
+        if not previous_track or not current_track:
+            continue
+        previous_ids, current_ids = list(previous_track), list(current_track)
+        iou = box_iou(np.array([previous_track[i]['bbox'] for i in previous_ids], dtype=np.float64),
+                      np.array([current_track[i]['bbox'] for i in current_ids], dtype=np.float64))
+        for a, b in zip(*np.nonzero(iou)):
+            key = (previous_ids[a], current_ids[b])
+            scores[key] = scores.get(key, 0.0) + iou[a, b]
+
+    # Greedy one-to-one assignment, best mean IoU first
+    number_of_frames = max(len(current_frames), 1)
+    mapping, used = {}, set()
+    for (previous_id, current_id), score in sorted(scores.items(), key=lambda item: -item[1]):
+        if score / number_of_frames < min_iou:
+            break
+        if current_id in mapping or previous_id in used:
+            continue
+        mapping[current_id] = previous_id
+        used.add(previous_id)
+    return mapping
+
+
+def match_teams(previous_colors, current_colors):
+    # KMeans numbers the two teams arbitrarily in every segment; keep the labelling closest to the previous one
+    if len(previous_colors) < 2 or len(current_colors) < 2:
+        return {1: 1, 2: 2}
+    distance = lambda a, b: float(np.linalg.norm(np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64)))
+    direct = distance(current_colors[1], previous_colors[1]) + distance(current_colors[2], previous_colors[2])
+    swapped = distance(current_colors[1], previous_colors[2]) + distance(current_colors[2], previous_colors[1])
+    return {1: 2, 2: 1} if swapped < direct else {1: 1, 2: 2}
+
+
+class ShardedPipeline(StreamingPipeline):
+    def __init__(self, model_path, workers=None, segment_seconds=120, overlap_seconds=2, window_size=100, cache=None,
+                 camera_movement_params=None, encoder_params=None, reader_params=None, tracker_params=None):
+        super().__init__(model_path, window_size=window_size, cache=cache,
+                         camera_movement_params=camera_movement_params, encoder_params=encoder_params,
+                         reader_params=reader_params, tracker_params=tracker_params)
+        self.workers = workers or os.cpu_count() or 1
+        self.segment_seconds = segment_seconds
+        self.overlap_seconds = overlap_seconds
+        # Exported backends are converted here, once, and handed to the workers: workers spawned together would
+        # otherwise all export the same model at the same time
+        self.pipeline_params = {
+            "model_path": model_path,
+            "window_size": window_size,
+            "cache": cache,
+            "camera_movement_params": camera_movement_params,
+            "tracker_params": dict(tracker_params or {}, export_path=self.tracker.export_backend()),
+        }
+
+    def get_segments(self, video_reader):
+        """Split the analysed frames into (read_start, start, end) ranges; frames before start are only overlap."""
+        segment_frames = max(int(round(self.segment_seconds * video_reader.fps)), 1)
+        # At least one frame of overlap, so the first owned frame has camera movement relative to its predecessor
+        overlap_frames = max(int(round(self.overlap_seconds * video_reader.fps)), 1)
+        number_of_frames = video_reader.num_frames
+
+        segments = []
+        for start in range(0, max(number_of_frames, 1), segment_frames):
+            end = min(start + segment_frames, number_of_frames)
+            segments.append((max(start - overlap_frames, 0), start, end))
+        return segments
+
+    def get_segment_reader_params(self, video_reader, start, end, last):
+        # Analysed frame numbers back to source times, so stride and the requested time range still apply
+        reader_params = dict(self.reader_params)
+        reader_params["start_time"] = (video_reader.start_frame + start * video_reader.stride) / video_reader.source_fps
+        if last:
+            # The container's frame count can be off, so the last segment reads to the real end
+            end_frame = video_reader.end_frame
+            reader_params["end_time"] = end_frame / video_reader.source_fps if end_frame is not None else None
+        else:
+            reader_params["end_time"] = ((video_reader.start_frame + end * video_reader.stride)
+                                         / video_reader.source_fps)
+        return reader_params
+
+    def stitch_segments(self, segments, results):
+        tracks = {"players": [], "referees": [], "ball": []}
+        camera_movement_per_frame = []
+        team_colors = {}
+        next_track_id = {"players": 1, "referees": 1}
+        previous_colors = {}
+
+        for (read_start, start, _), (segment_tracks, segment_camera_movement, segment_colors) in zip(segments,
+                                                                                                    results):
+            owned = start - read_start
+            team_map = match_teams(previous_colors, segment_colors)
+            previous_colors = {team_map[team]: color for team, color in segment_colors.items()}
+            if not team_colors and len(previous_colors) == 2:
+                team_colors = previous_colors
+
+            for object in ("players", "referees"):
+                # Tracks seen in the overlap keep the ID the previous segment gave them
+                id_map = match_track_ids(tracks[object][read_start:start], segment_tracks[object][:owned])
+                for track in segment_tracks[object][owned:]:
+                    for track_id in track:
+                        if track_id not in id_map:
+                            id_map[track_id] = next_track_id[object]
+                            next_track_id[object] += 1
+                tracks[object] += [{id_map[track_id]: track_info for track_id, track_info in track.items()}
+                                   for track in segment_tracks[object][owned:]]
+                if id_map:
+                    next_track_id[object] = max(next_track_id[object], max(id_map.values()) + 1)
+
+            for track in segment_tracks["players"][owned:]:
+                for track_info in track.values():
+                    if track_info.get("team", 0) in team_map:
+                        track_info["team"] = team_map[track_info["team"]]
+            tracks["ball"] += segment_tracks["ball"][owned:]
+            camera_movement_per_frame += segment_camera_movement[owned:]
+
+        # One colour per team for the whole match
+        for track in tracks["players"]:
+            for track_info in track.values():
+                track_info["team_color"] = team_colors.get(track_info.get("team", 0), (128, 128, 128))
+
+        return tracks, camera_movement_per_frame
+
+    def run(self, video_path, output_path, export_path=None):
+        video_reader = self.open_video(video_path)
+        self.speed_and_distance_estimator.frame_rate = video_reader.fps
+        segments = self.get_segments(video_reader)
+        reader_params = [self.get_segment_reader_params(video_reader, read_start, end, i == len(segments) - 1)
+                         for i, (read_start, _, end) in enumerate(segments)]
+        threads = max((os.cpu_count() or 1) // self.workers, 1)
+        logger.info("Processing %d segments with %d workers", len(segments), self.workers)
+
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(self.workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(self.pipeline_params, threads, metrics.enabled,
+                                           get_logging_config())) as pool:
+            # Detection, tracking, camera movement and teams for every segment in parallel
+            results = []
+            for result, snapshot in pool.map(_track_segment, [video_path] * len(segments), reader_params):
+                results.append(result)
+                metrics.merge(snapshot)
+            tracks, camera_movement_per_frame = self.stitch_segments(segments, results)
+            if not camera_movement_per_frame:
+                raise ValueError(f"No frames could be read from: {video_path}")
+
+            # Whole-match analytics on the stitched tracks are cheap and vectorized
+            first_frame = next(iter(VideoReader(video_path, **{**reader_params[0], "read_ahead": 0})))
+            self.camera_movement_estimator = CameraMovementEstimator(first_frame, **self.camera_movement_params)
+            ball_control_stats = self.add_analytics_to_tracks(tracks, camera_movement_per_frame)
+            results_writer = self.open_results_writer(export_path)
+            if results_writer is not None:
+                with results_writer:
+                    results_writer.write_tracks(tracks, camera_movement_per_frame, ball_control_stats)
+
+            # Every worker renders the frames its segment owns into a part file, which ffmpeg then joins
+            part_dir = tempfile.mkdtemp(prefix="parts-", dir=os.path.dirname(os.path.abspath(output_path)))
+            try:
+                extension = os.path.splitext(output_path)[1]
+                futures = []
+                for i, (_, start, end) in enumerate(segments):
+                    end = len(camera_movement_per_frame) if i == len(segments) - 1 else end
+                    render_params = self.get_segment_reader_params(video_reader, start, end,
+                                                                   i == len(segments) - 1)
+                    futures.append(pool.submit(
+                        _render_segment, video_path, os.path.join(part_dir, f"part-{i:05d}{extension}"),
+                        render_params, {object: object_tracks[start:end] for object, object_tracks in tracks.items()},
+                        ball_control_stats.get_window(start, end), camera_movement_per_frame[start:end],
+                        video_reader.fps, self.encoder_params))
+                part_paths = []
+                for future in futures:
+                    part_path, snapshot = future.result()
+                    part_paths.append(part_path)
+                    metrics.merge(snapshot)
+                self.concat_parts(part_paths, output_path)
+            finally:
+                shutil.rmtree(part_dir, ignore_errors=True)
+
+        return tracks, ball_control_stats
+
+    def concat_parts(self, part_paths, output_path):
+        list_path = os.path.join(os.path.dirname(part_paths[0]), "parts.txt")
+        with open(list_path, "w") as f:
+            for part_path in part_paths:
+                f.write(f"file '{os.path.abspath(part_path)}'\n")
+        subprocess.run([get_ffmpeg_exe(), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                        "-i", list_path, "-c", "copy", output_path], check=True)
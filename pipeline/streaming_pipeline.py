@@ -0,0 +1,165 @@
+from camera_movement_estimator import CameraMovementEstimator
+from detection_cache import save_tracks, load_tracks, detections_to_arrays, concat_detection_arrays, \
+    save_camera_movement, load_camera_movement
+from player_ball_assigner import PlayerBallAssigner, BallControlStats
+from renderer import AnnotationRenderer
+from speed_and_distance_estimator import SpeedAndDistanceEstimator
+from team_assigner import TeamAssigner
+from track_store import TrackBundleWriter, TrackStore
+from trackers import Tracker
+from utils import VideoReader, iter_frame_batches, create_video_writer
+from view_transformer import ViewTransformer
+
+
+class StreamingPipeline():
+    def __init__(self, model_path, window_size=100, cache=None, camera_movement_params=None, encoder_params=None,
+                 reader_params=None, tracker_params=None):
+        self.window_size = window_size
+        self.cache = cache
+        self.camera_movement_params = camera_movement_params or {}
+        self.encoder_params = encoder_params or {}
+        self.reader_params = reader_params or {}
+
+        self.tracker = Tracker(model_path, **(tracker_params or {}))
+        self.team_assigner = TeamAssigner()
+        self.player_assigner = PlayerBallAssigner()
+        self.view_transformer = ViewTransformer()
+        self.speed_and_distance_estimator = SpeedAndDistanceEstimator()
+        self.camera_movement_estimator = None
+
+    def run(self, video_path, output_path, export_path=None):
+        # First pass: detection, tracking, camera movement and teams, one window of frames at a time
+        tracks, camera_movement_per_frame = self.get_tracks(video_path)
+
+        # Whole-match analytics only need the tracks, not the frames
+        ball_control_stats = self.add_analytics_to_tracks(tracks, camera_movement_per_frame)
+
+        # Second pass: decode again, annotate and write each window, exporting the results alongside
+        self.render(video_path, output_path, tracks, camera_movement_per_frame, ball_control_stats, export_path)
+
+        return tracks, ball_control_stats
+
+    def get_tracks(self, video_path):
+        self.start_tracks(video_path)
+
+        for start_frame, frames in iter_frame_batches(self.video_reader, self.window_size):
+            detections = self.detect_window(frames)
+            self.track_window(video_path, start_frame, frames, detections)
+
+        return self.finish_tracks(video_path)
+
+    def open_video(self, video_path):
+        return VideoReader(video_path, **self.reader_params)
+
+    def start_tracks(self, video_path):
+        self.video_reader = self.open_video(video_path)
+        self.speed_and_distance_estimator.frame_rate = self.video_reader.fps
+        self.tracks = {
+            "players": [],
+            "referees": [],
+            "ball": []
+        }
+        self.camera_movement_per_frame = []
+        self.raw_detections = []
+        self.camera_movement_estimator = None
+
+        self.tracks_stub_path = None
+        self.tracks_from_stub = False
+        if self.cache is not None:
+            self.tracks_stub_path = self.cache.get_entry_path("tracks", video_path, self.tracker.model_path,
+                                                              **self.tracker.get_stub_params(),
+                                                              **self.video_reader.get_stub_params())
+            if self.cache.has_entry(self.tracks_stub_path):
+                self.tracks = load_tracks(self.tracks_stub_path)
+                self.tracks_from_stub = True
+
+    def detect_window(self, frames):
+        if self.tracks_from_stub:
+            return None
+        return self.tracker.detect_frames(frames)
+
+    def track_window(self, video_path, start_frame, frames, detections):
+        if detections is not None:
+            self.tracker.add_detections_to_tracks(self.tracks, detections)
+            if self.tracks_stub_path is not None:
+                self.raw_detections.append(detections_to_arrays(detections, start_frame))
+
+        if start_frame == 0:
+            self.camera_movement_estimator = CameraMovementEstimator(frames[0], **self.camera_movement_params)
+            self.team_assigner.assign_team_color(frames[0], self.tracks['players'][0])
+
+            self.camera_movement_stub_path = None
+            self.camera_movement_from_stub = False
+            if self.cache is not None:
+                self.camera_movement_stub_path = self.cache.get_entry_path(
+                    "camera_movement", video_path, **self.camera_movement_estimator.get_stub_params(),
+                    **self.video_reader.get_stub_params())
+                if self.cache.has_entry(self.camera_movement_stub_path):
+                    self.camera_movement_per_frame = load_camera_movement(self.camera_movement_stub_path)
+                    self.camera_movement_from_stub = True
+
+        if not self.camera_movement_from_stub:
+            for frame in frames:
+                self.camera_movement_per_frame.append(self.camera_movement_estimator.update_camera_movement(frame))
+
+        self.team_assigner.add_team_to_tracks(frames, self.tracks, start_frame)
+
+    def finish_tracks(self, video_path):
+        if self.camera_movement_estimator is None:
+            raise ValueError(f"No frames could be read from: {video_path}")
+
+        if self.cache is not None:
+            if not self.tracks_from_stub:
+                save_tracks(self.tracks, self.tracks_stub_path, concat_detection_arrays(self.raw_detections))
+            if not self.camera_movement_from_stub:
+                save_camera_movement(self.camera_movement_per_frame, self.camera_movement_stub_path)
+            self.cache.evict()
+
+        return self.tracks, self.camera_movement_per_frame
+
+    def add_analytics_to_tracks(self, tracks, camera_movement_per_frame):
+        # The analytics are column passes over one TrackStore per object; each object's dict tracks are released
+        # as its store is built and rebuilt from it at the end, for the renderer and the exporters
+        stores = {object: TrackStore.from_frames(tracks.pop(object)) for object in list(tracks)}
+
+        # The ball is interpolated first so that the gap frames get positions too
+        stores['ball'] = self.tracker.interpolate_ball_track_store(stores['ball'])
+
+        self.tracker.add_position_to_track_stores(stores)
+        self.camera_movement_estimator.add_adjust_positions_to_track_stores(stores, camera_movement_per_frame)
+        self.view_transformer.add_transformed_position_to_track_stores(stores, camera_movement_per_frame)
+
+        self.speed_and_distance_estimator.add_speed_and_distance_to_track_stores(stores)
+
+        team_ball_control = self.player_assigner.add_ball_possession_to_track_stores(stores)
+
+        for object in list(stores):
+            tracks[object] = stores.pop(object).to_frames()
+        return BallControlStats.from_team_ball_control(team_ball_control)
+
+    def open_results_writer(self, export_path):
+        if export_path is None:
+            return None
+        return TrackBundleWriter(export_path, self.speed_and_distance_estimator.frame_rate)
+
+    def render(self, video_path, output_path, tracks, camera_movement_per_frame, ball_control_stats,
+               export_path=None):
+        renderer = AnnotationRenderer(tracks, ball_control_stats, camera_movement_per_frame)
+        writer = None
+        results_writer = self.open_results_writer(export_path)
+
+        # Each decoded frame is annotated in place and handed straight to the encoder
+        try:
+            for frame_num, frame in enumerate(renderer.render(self.open_video(video_path))):
+                if writer is None:
+                    writer = create_video_writer(output_path, (frame.shape[1], frame.shape[0]),
+                                                 self.speed_and_distance_estimator.frame_rate, **self.encoder_params)
+                writer.write(frame)
+                if results_writer is not None:
+                    results_writer.write_tracks(tracks, camera_movement_per_frame, ball_control_stats, frame_num,
+                                                frame_num + 1)
+        finally:
+            if writer is not None:
+                writer.release()
+            if results_writer is not None:
+                results_writer.close()
@@ -0,0 +1,71 @@
+import numpy as np
+
+
+class BallControlStats():
+    def __init__(self):
+        # One row per frame: team in control, then the running number of frames each team has had the ball
+        self.num_frames = 0
+        self.counts = np.zeros((0, 3), dtype=np.int64)
+
+    def __len__(self):
+        return self.num_frames
+
+    @classmethod
+    def from_team_ball_control(cls, team_ball_control):
+        stats = cls()
+        stats.update(team_ball_control)
+        return stats
+
+    def update(self, team_ball_control):
+        team_ball_control = np.asarray(team_ball_control, dtype=np.int64).reshape(-1)
+        end = self.num_frames + len(team_ball_control)
+        if end > len(self.counts):
+            # Grow geometrically so streaming updates stay linear over the match
+            counts = np.zeros((max(end, 2 * len(self.counts)), 3), dtype=np.int64)
+            counts[:self.num_frames] = self.counts[:self.num_frames]
+            self.counts = counts
+
+        totals = self.counts[self.num_frames - 1, 1:] if self.num_frames else np.zeros(2, dtype=np.int64)
+        self.counts[self.num_frames:end, 0] = team_ball_control
+        self.counts[self.num_frames:end, 1] = np.cumsum(team_ball_control == 1) + totals[0]
+        self.counts[self.num_frames:end, 2] = np.cumsum(team_ball_control == 2) + totals[1]
+        self.num_frames = end
+
+    def get_window(self, start_frame, end_frame):
+        # Frames keep the running totals of the whole match, renumbered from start_frame
+        window = BallControlStats()
+        window.counts = self.counts[start_frame:min(end_frame, self.num_frames)].copy()
+        window.num_frames = len(window.counts)
+        return window
+
+    @property
+    def team_ball_control(self):
+        return self.counts[:self.num_frames, 0]
+
+    def get_team_frames(self, frame_num):
+        return int(self.counts[frame_num, 1]), int(self.counts[frame_num, 2])
+
+    def get_ball_control(self, frame_num):
+        team_1_num_frames, team_2_num_frames = self.get_team_frames(frame_num)
+        total = team_1_num_frames + team_2_num_frames
+        if total == 0:
+            return 0.0, 0.0
+        return team_1_num_frames / total, team_2_num_frames / total
+
+    def to_dataframe(self, frame_rate=24):
+        import pandas as pd
+        counts = self.counts[:self.num_frames]
+        total = counts[:, 1] + counts[:, 2]
+        share = np.divide(counts[:, 1:], total[:, None], out=np.zeros((len(counts), 2)), where=total[:, None] > 0)
+        return pd.DataFrame({
+            "frame": np.arange(self.num_frames),
+            "time": np.arange(self.num_frames) / frame_rate,
+            "team_ball_control": counts[:, 0],
+            "team_1_frames": counts[:, 1],
+            "team_2_frames": counts[:, 2],
+            "team_1_ball_control": share[:, 0] * 100,
+            "team_2_ball_control": share[:, 1] * 100,
+        })
+
+    def save_csv(self, path, frame_rate=24):
+        self.to_dataframe(frame_rate).to_csv(path, index=False, float_format="%.4f")
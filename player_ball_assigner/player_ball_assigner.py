@@ -1,6 +1,8 @@
-import sys
+from itertools import chain
 
-sys.path.append('../trackers/')
+import numpy as np
+
+from instrumentation import metrics
 from utils import get_center_of_bbox, measure_distance
 
 
@@ -21,8 +23,84 @@ class PlayerBallAssigner():
             distance_right = measure_distance((player_bbox[2], player_bbox[-1]), ball_position)
             distance = min(distance_left, distance_right)
 
-            if distance < self.max_player_ball_distance:
+            if distance < self.max_player_ball_distance and distance < minimum_distance:
                 minimum_distance = distance
                 assigned_player = player_id
 
-        return assigned_player
\ No newline at end of file
+        return assigned_player
+
+    def assign_ball_to_players(self, frame, bbox, ball_positions):
+        """Return, for every frame, the index of the player row nearest to the ball, or -1."""
+        frame = np.asarray(frame, dtype=np.int64)
+        bbox = np.asarray(bbox, dtype=np.float64).reshape(-1, 4)
+        ball_positions = np.asarray(ball_positions, dtype=np.float64).reshape(-1, 2)
+        assigned_rows = np.full(len(ball_positions), -1, dtype=np.int64)
+        if len(frame) == 0:
+            return assigned_rows
+
+        # Distance from the ball to both feet of every player in every frame at once
+        ball = ball_positions[frame]
+        distance_left = np.sqrt((bbox[:, 0] - ball[:, 0]) ** 2 + (bbox[:, 3] - ball[:, 1]) ** 2)
+        distance_right = np.sqrt((bbox[:, 2] - ball[:, 0]) ** 2 + (bbox[:, 3] - ball[:, 1]) ** 2)
+        distance = np.minimum(distance_left, distance_right)
+
+        candidates = np.flatnonzero(distance < self.max_player_ball_distance)
+        if len(candidates) == 0:
+            return assigned_rows
+
+        # Nearest candidate per frame; ties keep the first player of the frame
+        order = candidates[np.lexsort((candidates, distance[candidates], frame[candidates]))]
+        first_of_frame = np.concatenate([[True], frame[order][1:] != frame[order][:-1]])
+        nearest = order[first_of_frame]
+        assigned_rows[frame[nearest]] = nearest
+
+        return assigned_rows
+
+    def get_team_ball_control(self, assigned_rows, team):
+        # Frames without an assigned player keep the previous team in control, starting from 0
+        team = np.asarray(team)
+        last_assigned = np.maximum.accumulate(np.where(assigned_rows >= 0, np.arange(len(assigned_rows)), -1))
+        team_ball_control = np.zeros(len(assigned_rows), dtype=team.dtype if len(team) else np.int64)
+        has_control = last_assigned >= 0
+        team_ball_control[has_control] = team[assigned_rows[last_assigned[has_control]]]
+        return team_ball_control
+
+    def get_ball_positions(self, ball_bboxes):
+        ball_bboxes = np.asarray(ball_bboxes, dtype=np.float64).reshape(-1, 4)
+        return np.trunc(np.stack([(ball_bboxes[:, 0] + ball_bboxes[:, 2]) / 2,
+                                  (ball_bboxes[:, 1] + ball_bboxes[:, 3]) / 2], axis=1))
+
+    def add_ball_possession_to_tracks(self, tracks):
+        with metrics.stage("ball_possession", frames=len(tracks['players'])):
+            player_tracks = tracks['players']
+            track_infos = [track_info for track in player_tracks for track_info in track.values()]
+            frames = np.repeat(np.arange(len(player_tracks)), [len(track) for track in player_tracks])
+            bboxes = np.fromiter(chain.from_iterable(track_info['bbox'] for track_info in track_infos),
+                                 dtype=np.float64, count=4 * len(track_infos))
+            teams = np.array([track_info.get('team', 0) for track_info in track_infos], dtype=np.int64)
+
+            ball_bboxes = []
+            for frame_num in range(len(player_tracks)):
+                ball = tracks['ball'][frame_num].get(1)
+                ball_bboxes.append(ball['bbox'] if ball is not None and len(ball['bbox']) == 4 else [np.nan] * 4)
+
+            assigned_rows = self.assign_ball_to_players(frames, bboxes, self.get_ball_positions(ball_bboxes))
+            for row in assigned_rows[assigned_rows >= 0].tolist():
+                track_infos[row]['has_ball'] = True
+
+            return self.get_team_ball_control(assigned_rows, teams)
+
+    def add_ball_possession_to_track_stores(self, stores):
+        with metrics.stage("ball_possession", frames=stores['players'].num_frames):
+            players = stores['players']
+            ball = stores['ball']
+
+            ball_bboxes = np.full((players.num_frames, 4), np.nan)
+            ball_bboxes[ball.frame] = ball.get_column('bbox')
+
+            assigned_rows = self.assign_ball_to_players(players.frame, players.get_column('bbox'),
+                                                        self.get_ball_positions(ball_bboxes))
+            players.set_column('has_ball', True, assigned_rows[assigned_rows >= 0])
+
+            teams = np.maximum(players.get_column('team'), 0).astype(np.int64)
+            return self.get_team_ball_control(assigned_rows, teams)
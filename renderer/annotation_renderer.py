@@ -0,0 +1,159 @@
+import cv2
+import numpy as np
+
+from instrumentation import timed
+from player_ball_assigner import BallControlStats
+from utils import get_bbox_width, get_center_of_bbox
+from utils.bbox_utils import get_foot_position
+
+
+class AnnotationRenderer():
+    def __init__(self, tracks, ball_control_stats, camera_movement_per_frame, camera_movement_threshold=5):
+        if not isinstance(ball_control_stats, BallControlStats):
+            ball_control_stats = BallControlStats.from_team_ball_control(ball_control_stats)
+
+        self.tracks = tracks
+        self.ball_control_stats = ball_control_stats
+        self.camera_movement_per_frame = camera_movement_per_frame
+        # Camera movement is measured ungated; movements up to this many pixels are shown as no movement
+        self.camera_movement_threshold = camera_movement_threshold
+
+        # Panels are (x1, y1, x2, y2, alpha); corners are inclusive like cv2.rectangle
+        self.team_ball_control_panel = (1350, 850, 1900, 970, 0.4)
+        self.camera_movement_panel = (0, 0, 500, 100, 0.6)
+        self.panel_overlays = {}
+
+    def draw_ellipse(self, frame, bbox, color, track_id=None):
+        y2 = int(bbox[3])
+        x_center, _ = get_center_of_bbox(bbox)
+        width = get_bbox_width(bbox)
+
+        cv2.ellipse(frame,
+                    center=(x_center, y2),
+                    axes=(int(width), int(0.35 * width)),
+                    angle=0.0,
+                    startAngle=-45,
+                    endAngle=235,
+                    color=color,
+                    thickness=2,
+                    lineType=cv2.LINE_4)
+
+        rectangle_width = 40
+        rectangle_height = 20
+        x1_rect = x_center - rectangle_width // 2
+        x2_rect = x_center + rectangle_width // 2
+        y1_rect = (y2 - rectangle_height // 2) + 15
+        y2_rect = (y2 + rectangle_height // 2) + 15
+
+        if track_id is not None:
+            cv2.rectangle(frame, (int(x1_rect), int(y1_rect)), (int(x2_rect), int(y2_rect)), color, cv2.FILLED)
+            x1_text = x1_rect + 12
+            if track_id > 99:
+                x1_text -= 10
+            cv2.putText(frame, f'{track_id}', (int(x1_text), int(y1_rect + 15)), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                        (0, 0, 0),
+                        2)
+
+        return frame
+
+    def draw_triangle(self, frame, bbox, color):
+        y = int(bbox[1])
+        x, _ = get_center_of_bbox(bbox)
+        triangle_points = np.array([
+            [x, y],
+            [x - 10, y - 20],
+            [x + 10, y - 20]
+        ])
+        cv2.drawContours(frame, [triangle_points], 0, color, cv2.FILLED)
+        cv2.drawContours(frame, [triangle_points], 0, (0, 0, 0), 2)
+
+        return frame
+
+    def draw_panel(self, frame, panel):
+        # Blend the white panel into its region only instead of copying the whole frame
+        x1, y1, x2, y2, alpha = panel
+        roi = frame[max(y1, 0):y2 + 1, max(x1, 0):x2 + 1]
+        if roi.size == 0:
+            return frame
+
+        overlay = self.panel_overlays.get(roi.shape)
+        if overlay is None:
+            overlay = np.full(roi.shape, 255, dtype=roi.dtype)
+            self.panel_overlays[roi.shape] = overlay
+        roi[:] = cv2.addWeighted(overlay, alpha, roi, 1 - alpha, 0)
+
+        return frame
+
+    def draw_objects(self, frame, frame_num):
+        for object, color in (("players", (0, 0, 255)), ("referees", (0, 255, 255)), ("ball", (0, 255, 0))):
+            if object not in self.tracks or len(self.tracks[object]) <= frame_num:
+                continue
+
+            for track_id, track_info in self.tracks[object][frame_num].items():
+                if object == "players":
+                    self.draw_ellipse(frame, track_info["bbox"], track_info.get("team_color", color), track_id)
+                    if track_info.get("has_ball", False):
+                        self.draw_triangle(frame, track_info["bbox"], color)
+                elif object == "referees":
+                    self.draw_ellipse(frame, track_info["bbox"], color)
+                else:
+                    self.draw_triangle(frame, track_info["bbox"], color)
+
+        return frame
+
+    def draw_team_ball_control(self, frame, frame_num):
+        self.draw_panel(frame, self.team_ball_control_panel)
+
+        # Possession up to this frame is read from the running counts
+        team_1, team_2 = self.ball_control_stats.get_ball_control(frame_num)
+
+        cv2.putText(frame, f"Team 1 Ball Control: {team_1 * 100:.2f}%", (1400, 900), cv2.FONT_HERSHEY_SIMPLEX, 1,
+                    (0, 0, 0), 3)
+        cv2.putText(frame, f"Team 2 Ball Control: {team_2 * 100:.2f}%", (1400, 950), cv2.FONT_HERSHEY_SIMPLEX, 1,
+                    (0, 0, 0), 3)
+
+        return frame
+
+    def draw_camera_movement(self, frame, frame_num):
+        self.draw_panel(frame, self.camera_movement_panel)
+
+        x_movement, y_movement = self.camera_movement_per_frame[frame_num]
+        if (x_movement ** 2 + y_movement ** 2) ** 0.5 <= self.camera_movement_threshold:
+            x_movement, y_movement = 0, 0
+        cv2.putText(frame, f"Camera Movement X: {x_movement: .2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1,
+                    (0, 0, 0), 3)
+        cv2.putText(frame, f"Camera Movement Y: {y_movement: .2f}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1,
+                    (0, 0, 0), 3)
+
+        return frame
+
+    def draw_speed_and_distance(self, frame, frame_num):
+        for object, object_tracks in self.tracks.items():
+            if object == "ball" or object == "referees":
+                continue
+            for _, track_info in object_tracks[frame_num].items():
+                speed = track_info.get('speed', None)
+                distance = track_info.get('distance', None)
+                if speed is None or distance is None:
+                    continue
+
+                position = get_foot_position(track_info['bbox'])
+                position = (int(position[0]), int(position[1] + 40))
+                cv2.putText(frame, f"{speed:.2f} km/h", position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+                cv2.putText(frame, f"{distance:.2f} m", (position[0], position[1] + 20),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+
+        return frame
+
+    @timed("render")
+    def render_frame(self, frame, frame_num):
+        # Everything is drawn in place, in the same order as the separate passes used to draw it
+        self.draw_objects(frame, frame_num)
+        self.draw_team_ball_control(frame, frame_num)
+        self.draw_camera_movement(frame, frame_num)
+        self.draw_speed_and_distance(frame, frame_num)
+        return frame
+
+    def render(self, frames, start_frame=0):
+        for frame_num, frame in enumerate(frames, start=start_frame):
+            yield self.render_frame(frame, frame_num)
@@ -1,80 +1,196 @@
-import sys
+from collections import OrderedDict, deque
+from itertools import chain
 
-import cv2
+import numpy as np
 
-from utils.bbox_utils import get_foot_position
-
-sys.path.append('../runs/')
+from instrumentation import metrics
 from utils import measure_distance
 
+
 class SpeedAndDistanceEstimator():
-    def __init__(self):
-        self.frame_window = 5
-        self.frame_rate = 24
+    def __init__(self, frame_rate=24, frame_window=5, speed_smoothing=None, cache_size=512):
+        self.frame_window = frame_window
+        self.frame_rate = frame_rate
+        self.speed_smoothing = speed_smoothing
+
+        # Per-track state for the trailing (causal) estimate used on live feeds
+        self.cache_size = cache_size
+        self.track_history = OrderedDict()
+
+    def compute_speed_and_distance(self, frame, track_id, position, number_of_frames):
+        frame = np.asarray(frame, dtype=np.int64)
+        track_id = np.asarray(track_id, dtype=np.int64)
+        position = np.asarray(position, dtype=np.float64).reshape(-1, 2)
+
+        speed = np.full(len(frame), np.nan)
+        distance = np.full(len(frame), np.nan)
+        speed_smoothed = np.full(len(frame), np.nan) if self.speed_smoothing else None
+        result = {"speed": speed, "distance": distance, "speed_smoothed": speed_smoothed}
+        if len(frame) == 0:
+            return result
+
+        # Group rows by track, in frame order
+        order = np.argsort(track_id * (number_of_frames + 1) + frame)
+        frame, track_id, position = frame[order], track_id[order], position[order]
+        index = np.arange(len(order))
+
+        # A window starts on every frame_window-th frame and is measured against the next boundary frame of the
+        # same track: the next window start, or the last frame of the video
+        is_start = frame % self.frame_window == 0
+        is_boundary = is_start | (frame == number_of_frames - 1)
+        next_boundary = np.minimum.accumulate(np.where(is_boundary, index, len(index))[::-1])[::-1]
+        next_boundary = np.append(next_boundary[1:], len(index))
+
+        start_rows = np.flatnonzero(is_start & (next_boundary < len(index)))
+        end_rows = next_boundary[start_rows]
+        window_start = frame[start_rows]
+        window_end = np.minimum(window_start + self.frame_window, number_of_frames - 1)
+
+        valid = ((track_id[end_rows] == track_id[start_rows]) & (frame[end_rows] == window_end) &
+                 (window_end > window_start) &
+                 ~np.isnan(position[start_rows]).any(axis=1) & ~np.isnan(position[end_rows]).any(axis=1))
+        start_rows, end_rows = start_rows[valid], end_rows[valid]
+        window_start, window_end = window_start[valid], window_end[valid]
+
+        displacement = position[end_rows] - position[start_rows]
+        window_distance = (displacement[:, 0] ** 2 + displacement[:, 1] ** 2) ** 0.5
+        time_elapsed = (window_end - window_start) / self.frame_rate
+        window_speed = window_distance / time_elapsed * 3.6
+
+        # Cumulative distance per track in window order; gaps and out-of-pitch windows simply add nothing
+        window_total = np.empty(len(start_rows))
+        window_smoothed = np.empty(len(start_rows))
+        track_changes = np.flatnonzero(np.diff(track_id[start_rows])) + 1
+        for rows in np.split(np.arange(len(start_rows)), track_changes):
+            window_total[rows] = np.cumsum(window_distance[rows])
+            if self.speed_smoothing:
+                # Trailing mean over the last speed_smoothing windows of the track
+                cumulative_speed = np.concatenate([[0.0], np.cumsum(window_speed[rows])])
+                end = np.arange(1, len(rows) + 1)
+                begin = np.maximum(end - self.speed_smoothing, 0)
+                window_smoothed[rows] = (cumulative_speed[end] - cumulative_speed[begin]) / (end - begin)
+
+        # Every frame inside a window, except the window's last frame, takes the values of the window's first row
+        window_of_row = np.full(len(index), -1)
+        window_of_row[start_rows] = np.arange(len(start_rows))
+        last_start = np.maximum.accumulate(np.where(is_start, index, 0))
+
+        row_window_start = frame - frame % self.frame_window
+        row_window_end = np.minimum(row_window_start + self.frame_window, number_of_frames - 1)
+        window_index = window_of_row[last_start]
+        has_window = ((window_index >= 0) & (track_id[last_start] == track_id) &
+                      (frame[last_start] == row_window_start) & (frame < row_window_end))
+        window_index = window_index[has_window]
+        rows = order[has_window]
+
+        speed[rows] = window_speed[window_index]
+        distance[rows] = window_total[window_index]
+        if self.speed_smoothing:
+            speed_smoothed[rows] = window_smoothed[window_index]
+
+        return result
 
     def add_speed_and_distance_to_track(self, tracks):
-        total_distance= {}
-
-        for object, object_tracks in tracks.items():
-            if object == 'ball' or object == 'referees':
-                continue
-            number_of_frames = len(object_tracks)
-            for frame_num in range(0, number_of_frames, self.frame_window):
-                last_frame = min(frame_num + self.frame_window, number_of_frames - 1)
-
-                for track_id, _ in object_tracks[frame_num].items():
-                    if track_id not in object_tracks[last_frame]:
-                        continue
-
-                    start_position = object_tracks[frame_num][track_id]['position_transformed']
-                    end_position = object_tracks[last_frame][track_id]['position_transformed']
-
-                    if start_position is None or end_position is None:
-                        continue
-
-                    distance_covered = measure_distance(start_position, end_position)
-                    time_elapsed = (last_frame - frame_num) / self.frame_rate
-
-                    speed_meters_per_second = distance_covered / time_elapsed
-                    speed_km_per_hour = speed_meters_per_second * 3.6
+        with metrics.stage("speed_and_distance", frames=len(tracks['players'])):
+            for object, object_tracks in tracks.items():
+                if object == 'ball' or object == 'referees':
+                    continue
+                number_of_frames = len(object_tracks)
+                if number_of_frames == 0:
+                    continue
 
-                    if object not in total_distance:
-                        total_distance[object] = {}
+                # Speeds are measured between window boundaries, so only the boundary frames are gathered; the
+                # rows in between are only written to
+                boundary_frames = list(range(0, number_of_frames, self.frame_window))
+                if boundary_frames[-1] != number_of_frames - 1:
+                    boundary_frames.append(number_of_frames - 1)
+                boundary_tracks = [object_tracks[frame_num] for frame_num in boundary_frames]
+                number_of_rows = sum(map(len, boundary_tracks))
+                frames = np.repeat(boundary_frames, [len(track) for track in boundary_tracks])
+                track_ids = np.fromiter(chain.from_iterable(boundary_tracks), dtype=np.int64, count=number_of_rows)
+                positions = np.fromiter(
+                    chain.from_iterable(track_info['position_transformed'] or (np.nan, np.nan)
+                                        for track in boundary_tracks for track_info in track.values()),
+                    dtype=np.float64, count=2 * number_of_rows).reshape(-1, 2)
+
+                result = self.compute_speed_and_distance(frames, track_ids, positions, number_of_frames)
+
+                # Only window starts get values; each window's values go to every frame of the window the track
+                # appears in, looked up per frame instead of per track so absent tracks cost nothing
+                rows = np.flatnonzero(~np.isnan(result["speed"]))
+                columns = [result["distance"][rows].tolist(), result["speed"][rows].tolist()]
+                if self.speed_smoothing:
+                    columns.append(result["speed_smoothed"][rows].tolist())
+                values = list(zip(*columns))
+                row_track_ids = track_ids[rows].tolist()
+                row_frames = frames[rows].tolist()
+
+                window_starts = np.flatnonzero(np.diff(frames[rows], prepend=-1)).tolist()
+                for first, last in zip(window_starts, window_starts[1:] + [len(rows)]):
+                    frame_num = row_frames[first]
+                    get_values = dict(zip(row_track_ids[first:last], values[first:last])).get
+                    for frame_track in object_tracks[frame_num:min(frame_num + self.frame_window,
+                                                                   number_of_frames - 1)]:
+                        for track_id, track_info in frame_track.items():
+                            window_values = get_values(track_id)
+                            if window_values is None:
+                                continue
+                            track_info['distance'] = window_values[0]
+                            track_info['speed'] = window_values[1]
+                            if self.speed_smoothing:
+                                track_info['speed_smoothed'] = window_values[2]
+
+    def add_speed_and_distance_to_track_stores(self, stores):
+        with metrics.stage("speed_and_distance", frames=stores['players'].num_frames):
+            for object, store in stores.items():
+                if object == 'ball' or object == 'referees':
+                    continue
 
-                    if track_id not in total_distance[object]:
-                        total_distance[object][track_id] = 0
+                result = self.compute_speed_and_distance(store.frame, store.track_id,
+                                                         store.get_column('position_transformed'), store.num_frames)
+                store.set_column('speed', result["speed"])
+                store.set_column('distance', result["distance"])
+                if result["speed_smoothed"] is not None:
+                    store.set_column('speed_smoothed', result["speed_smoothed"])
 
-                    total_distance[object][track_id] += distance_covered
+    def update_speed_and_distance(self, frame_num, tracks):
+        """Trailing-window speed and distance for one frame, using only the frames seen so far.
 
-                    for frame_num_batch in range(frame_num, last_frame):
-                        if track_id not in tracks[object][frame_num_batch]:
-                            continue
+        frame_num is the source frame number, so frames skipped by a live feed still count as elapsed time, and
+        tracks holds the single frame's tracks, as {object: [track]}.
+        """
+        for object, object_tracks in tracks.items():
+            if object == 'ball' or object == 'referees':
+                continue
 
-                        tracks[object][frame_num_batch][track_id]['distance'] = total_distance[object][track_id]
-                        tracks[object][frame_num_batch][track_id]['speed'] = speed_km_per_hour
+            for track_id, track_info in object_tracks[-1].items():
+                position = track_info.get('position_transformed')
+                if position is None:
+                    continue
 
-    def draw_speed_and_distance(self, frames, tracks):
-        output_frames = []
-        for frame_num, frame in enumerate(frames):
-            for object, object_tracks in tracks.items():
-                if object == "ball" or object == "referees":
+                history = self.track_history.get(track_id)
+                if history is None:
+                    # Samples of the last frame_window frames, plus the distance up to the last window boundary
+                    history = {"samples": deque(), "anchor": (frame_num, position), "distance": 0.0}
+                self.track_history[track_id] = history
+                self.track_history.move_to_end(track_id)
+                while len(self.track_history) > self.cache_size:
+                    self.track_history.popitem(last=False)
+
+                samples = history["samples"]
+                samples.append((frame_num, position))
+                while len(samples) > 1 and frame_num - samples[1][0] >= self.frame_window:
+                    samples.popleft()
+
+                # Distance grows one window at a time, like the offline estimate
+                anchor_frame, anchor_position = history["anchor"]
+                if frame_num - anchor_frame >= self.frame_window:
+                    history["distance"] += measure_distance(anchor_position, position)
+                    history["anchor"] = (frame_num, position)
+
+                start_frame, start_position = samples[0]
+                if frame_num == start_frame:
                     continue
-                for _, track_info in object_tracks[frame_num].items():
-                    if "speed" in track_info:
-                        speed = track_info.get('speed', None)
-                        distance = track_info.get('distance', None)
-                        if speed is None or distance is None:
-                            continue
-
-                        bbox = track_info['bbox']
-                        position = get_foot_position(bbox)
-                        position = list(position)
-                        position[1] += 40
-
-                        position = tuple(map(int, position))
-                        cv2.putText(frame, f"{speed:.2f} km/h", position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
-                        cv2.putText(frame, f"{distance:.2f} m", (position[0], position[1] + 20),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
-            output_frames.append(frame)
-
-        return output_frames
+                time_elapsed = (frame_num - start_frame) / self.frame_rate
+                track_info['speed'] = measure_distance(start_position, position) / time_elapsed * 3.6
+                track_info['distance'] = history["distance"]
@@ -1,47 +1,91 @@
-from sklearn.cluster import KMeans
+import logging
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
 
 
 class TeamAssigner:
-    def __init__(self):
+    def __init__(self, crop_size=16, kmeans_iterations=10, vote_frames=3, cache_size=512):
         self.team_colors = {}
-        self.player_team_dic = {}
+        self.player_team_dic = OrderedDict()
+        self.player_votes = OrderedDict()
         self.kmeans = None
 
-    def get_top_cluster(self, image):
-        image_2d = image.reshape(-1, 3)
+        self.crop_size = crop_size
+        self.kmeans_iterations = kmeans_iterations
+        self.vote_frames = vote_frames
+        self.cache_size = cache_size
+
+    def get_player_crops(self, frame, bboxes):
+        crops = np.zeros((len(bboxes), self.crop_size, self.crop_size, 3), dtype=np.float32)
+        valid = np.zeros(len(bboxes), dtype=bool)
+
+        for i, bbox in enumerate(bboxes):
+            x1, y1 = max(int(bbox[0]), 0), max(int(bbox[1]), 0)
+            x2, y2 = min(int(bbox[2]), frame.shape[1]), min(int(bbox[3]), frame.shape[0])
+            image = frame[y1:y2, x1:x2]
+            top_half_image = image[:int(image.shape[0] / 2), :]
+            if top_half_image.size == 0:
+                continue
+
+            # Downsample every crop to the same small size so all crops of a frame cluster in one batch
+            crops[i] = cv2.resize(top_half_image, (self.crop_size, self.crop_size), interpolation=cv2.INTER_AREA)
+            valid[i] = True
+
+        return crops, valid
+
+    def get_player_colors(self, frame, bboxes):
+        crops, valid = self.get_player_crops(frame, bboxes)
+        pixels = crops.reshape(len(bboxes), -1, 3)
+
+        # Fixed-iteration 2-means over every crop at once, seeded with the corner (background) and mean colours
+        corners = [0, self.crop_size - 1, self.crop_size * (self.crop_size - 1), self.crop_size * self.crop_size - 1]
+        centers = np.stack([pixels[:, corners].mean(axis=1), pixels.mean(axis=1)], axis=1)
+        for _ in range(self.kmeans_iterations):
+            distances = ((pixels[:, :, None, :] - centers[:, None, :, :]) ** 2).sum(axis=-1)
+            labels = distances.argmin(axis=-1)
+            for cluster in (0, 1):
+                mask = (labels == cluster)[..., None]
+                count = mask.sum(axis=1)
+                cluster_mean = (pixels * mask).sum(axis=1) / np.maximum(count, 1)
+                centers[:, cluster] = np.where(count > 0, cluster_mean, centers[:, cluster])
+
+        distances = ((pixels[:, :, None, :] - centers[:, None, :, :]) ** 2).sum(axis=-1)
+        labels = distances.argmin(axis=-1)
+
+        # The cluster holding most of the corners is the background, the other one is the jersey
+        non_player_cluster = (labels[:, corners].sum(axis=1) > 2).astype(int)
+        player_cluster = 1 - non_player_cluster
+        player_colors = centers[np.arange(len(bboxes)), player_cluster].astype(np.float64)
 
-        kmeans = KMeans(n_clusters=2, init="k-means++", n_init=1).fit(image_2d)
+        # Confidence is the share of colour variance the two clusters explain
+        total_variance = ((pixels - pixels.mean(axis=1, keepdims=True)) ** 2).sum(axis=(1, 2))
+        within_variance = distances.min(axis=-1).sum(axis=1)
+        confidence = np.where(total_variance > 0, 1 - within_variance / np.maximum(total_variance, 1e-9), 0.0)
+        confidence[~valid] = 0.0
 
-        return kmeans
+        return player_colors, confidence, valid
 
     def get_player_color(self, frame, bbox):
-        image = frame[int(bbox[1]):int(bbox[3]), int(bbox[0]):int(bbox[2])]
-
-        top_half_image = image[:int(image.shape[0] / 2), :]
-
-        kmeans = self.get_top_cluster(top_half_image)
-
-        labels = kmeans.labels_
-
-        clustered_image = labels.reshape(top_half_image.shape[0], top_half_image.shape[1])
-
-        corner_cluster = [clustered_image[0, 0], clustered_image[0, -1], clustered_image[-1, 0],
-                          clustered_image[-1, -1]]
-        non_player_cluster = max(set(corner_cluster), key=corner_cluster.count)
-        player_cluster = 1 - non_player_cluster
-        player_color = kmeans.cluster_centers_[player_cluster]
-
-        return player_color
+        player_colors, _, _ = self.get_player_colors(frame, [bbox])
+        return player_colors[0]
 
     def assign_team_color(self, frame, player_detections):
+        # sklearn takes over a second to import, so it is only loaded once teams are actually clustered
+        from sklearn.cluster import KMeans
+        bboxes = [player_detection["bbox"] for player_detection in player_detections.values()]
         player_colors = []
-        for _, player_detection in player_detections.items():
-            bbox = player_detection["bbox"]
-            player_color = self.get_player_color(frame, bbox)
-            player_colors.append(player_color)
+        if bboxes:
+            player_colors, _, valid = self.get_player_colors(frame, bboxes)
+            player_colors = player_colors[valid]
 
         if len(player_colors) < 2:
-            print("[WARNING] Not enough player colors for KMeans clustering — skipping team color assignment.")
+            logger.warning("Not enough player colors for KMeans clustering — skipping team color assignment.")
             self.kmeans = None
             return
         kmeans = KMeans(n_clusters=2, init="k-means++", n_init=10).fit(player_colors)
@@ -51,18 +95,78 @@ class TeamAssigner:
         self.team_colors[1] = kmeans.cluster_centers_[0]
         self.team_colors[2] = kmeans.cluster_centers_[1]
 
-    def get_player_team(self, frame, player_bbox, player_id):
-        if self.kmeans is None:
-            print(f"[WARNING] Skipping team assignment for player {player_id} — KMeans not initialized.")
-            return 0
+    def update_team_colors(self, frame, player_detections):
+        """Refine the two team colours online with the players of one more frame, for live feeds."""
+        from sklearn.cluster import MiniBatchKMeans
+        bboxes = [player_detection["bbox"] for player_detection in player_detections.values()]
+        if not bboxes:
+            return
+        player_colors, _, valid = self.get_player_colors(frame, bboxes)
+        player_colors = player_colors[valid]
+
+        if not isinstance(self.kmeans, MiniBatchKMeans):
+            # The first call needs one colour per cluster; later calls nudge the centres with any number of players
+            if len(player_colors) < 2:
+                return
+            self.kmeans = MiniBatchKMeans(n_clusters=2, init="k-means++", n_init=3)
+        elif len(player_colors) == 0:
+            return
+        self.kmeans.partial_fit(player_colors)
 
-        if player_id in self.player_team_dic:
-            return self.player_team_dic[player_id]
+        self.team_colors[1] = self.kmeans.cluster_centers_[0]
+        self.team_colors[2] = self.kmeans.cluster_centers_[1]
 
-        player_color = self.get_player_color(frame, player_bbox)
-        team_id = self.kmeans.predict(player_color.reshape(1, -1))[0]
-        team_id += 1
+    def _remember(self, cache, player_id, value):
+        cache[player_id] = value
+        cache.move_to_end(player_id)
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
 
-        self.player_team_dic[player_id] = team_id
+    def get_player_teams(self, frame, player_track):
+        if self.kmeans is None:
+            if player_track:
+                logger.warning("Skipping team assignment for %d players — KMeans not initialized.", len(player_track))
+            return {player_id: 0 for player_id in player_track}
+
+        # Only tracks that have not collected all their votes need a colour from this frame
+        pending = [player_id for player_id in player_track
+                   if self.player_votes.get(player_id, (None, 0))[1] < self.vote_frames]
+        if pending:
+            bboxes = [player_track[player_id]['bbox'] for player_id in pending]
+            player_colors, confidence, valid = self.get_player_colors(frame, bboxes)
+            team_index = np.zeros(len(pending), dtype=int)
+            if valid.any():
+                team_index[valid] = self.kmeans.predict(player_colors[valid])
+
+            for i, player_id in enumerate(pending):
+                votes, count = self.player_votes.get(player_id, (np.zeros(2), 0))
+                if valid[i]:
+                    votes[team_index[i]] += max(confidence[i], 1e-3)
+                    count += 1
+                self._remember(self.player_votes, player_id, (votes, count))
+                if votes.any():
+                    self._remember(self.player_team_dic, player_id, int(votes.argmax()) + 1)
+
+        teams = {}
+        for player_id in player_track:
+            teams[player_id] = self.player_team_dic.get(player_id, 0)
+            if player_id in self.player_team_dic:
+                self.player_team_dic.move_to_end(player_id)
+        return teams
+
+    def get_player_team(self, frame, player_bbox, player_id):
+        if self.kmeans is None:
+            logger.warning("Skipping team assignment for player %s — KMeans not initialized.", player_id)
+            return 0
 
-        return team_id
+        return self.get_player_teams(frame, {player_id: {'bbox': player_bbox}})[player_id]
+
+    def add_team_to_tracks(self, frames, tracks, start_frame=0):
+        with metrics.stage("team_assignment", frames=len(frames)):
+            for frame_num, frame in enumerate(frames, start=start_frame):
+                player_track = tracks['players'][frame_num]
+                teams = self.get_player_teams(frame, player_track)
+                for player_id, track in player_track.items():
+                    team = teams[player_id]
+                    track['team'] = team
+                    track['team_color'] = self.team_colors.get(team, (128, 128, 128))
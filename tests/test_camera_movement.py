@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from benchmarks.synthetic_match import SyntheticMatch
+from camera_movement_estimator import CameraMovementEstimator
+from view_transformer import ViewTransformer
+
+NUM_FRAMES = 120
+
+
+def estimate_camera_movement(match, mode):
+    frames = match.iter_frames()
+    first_frame = next(frames)
+    estimator = CameraMovementEstimator(first_frame, mode=mode)
+    camera_movement_per_frame = [estimator.update_camera_movement(first_frame)]
+    camera_movement_per_frame += [estimator.update_camera_movement(frame) for frame in frames]
+    return np.array(camera_movement_per_frame, dtype=np.float64), estimator.minimum_distance
+
+
+# A fast pan of up to 8 px per frame, and a slow one whose every step is under the estimator's minimum distance
+@pytest.mark.parametrize("max_pan", [400, 40])
+@pytest.mark.parametrize("mode", ["max", "median", "affine"])
+def test_accumulated_camera_movement_follows_the_pan(mode, max_pan):
+    match = SyntheticMatch(NUM_FRAMES, max_pan=max_pan)
+    camera_movement_per_frame, minimum_distance = estimate_camera_movement(match, mode)
+
+    true_movement = np.array(match.get_camera_movement())
+    if max_pan == 40:
+        assert np.abs(true_movement).max() < minimum_distance
+
+    camera_positions = ViewTransformer().get_camera_positions(camera_movement_per_frame)
+    true_positions = np.cumsum(true_movement, axis=0)
+    assert true_positions[-1, 0] > 0
+    np.testing.assert_allclose(camera_positions, true_positions, atol=2.0)
+
+
+def test_static_pitch_point_keeps_its_pitch_position():
+    match = SyntheticMatch(NUM_FRAMES, max_pan=400)
+    camera_movement_per_frame, _ = estimate_camera_movement(match, "max")
+
+    # A point painted on the pitch canvas, seen wherever the pan puts it in each frame
+    canvas_point = np.array([900.0, 700.0])
+    offsets = match.camera_offset - match.camera_offset[0]
+    tracks = {"players": [{1: {"position": (canvas_point[0] - offset, canvas_point[1])}} for offset in offsets]}
+
+    ViewTransformer().add_transformed_position_to_tracks(tracks, camera_movement_per_frame)
+    positions = np.array([track[1]["position_transformed"] for track in tracks["players"]], dtype=np.float64)
+
+    assert not np.isnan(positions).any()
+    np.testing.assert_allclose(positions, np.broadcast_to(positions[0], positions.shape), atol=0.1)
+
+
+def test_homography_cache_keeps_the_most_recent_positions():
+    # A steady pan reaches a new quantized camera position on every frame
+    camera_movement_per_frame = np.full((NUM_FRAMES, 2), [-1.0, 0.0])
+    points = np.tile([[900.0, 700.0]], (NUM_FRAMES, 1))
+    frames = np.arange(NUM_FRAMES)
+
+    bounded = ViewTransformer(cache_size=16)
+    positions = bounded.transform_points(points, bounded.get_camera_positions(camera_movement_per_frame), frames)
+    unbounded = ViewTransformer(cache_size=NUM_FRAMES)
+    expected = unbounded.transform_points(points, unbounded.get_camera_positions(camera_movement_per_frame), frames)
+
+    assert len(bounded.homographies) == 16
+    assert len(unbounded.homographies) == NUM_FRAMES
+    np.testing.assert_array_equal(positions.filled(np.nan), expected.filled(np.nan))
@@ -0,0 +1,43 @@
+import numpy as np
+
+from player_ball_assigner import BallControlStats
+from track_store import TrackBundle, TrackBundleWriter, TrackStore
+
+NUM_FRAMES = 12
+
+
+def make_tracks():
+    players = [{1: {"bbox": [10.0 + frame_num, 20.0, 30.0, 60.0], "team": 1},
+                2: {"bbox": [50.0, 20.0, 70.0 + frame_num, 60.0], "team": 2}} for frame_num in range(NUM_FRAMES)]
+    # The ball is missing from the first frame, a gap in the middle and the last three frames
+    ball = [{1: {"bbox": [40.0, 40.0, 44.0, 44.0], "confidence": 0.5}}
+            if frame_num not in (0, 5, 6) and frame_num < NUM_FRAMES - 3 else {} for frame_num in range(NUM_FRAMES)]
+    return {"players": players, "referees": [{} for _ in range(NUM_FRAMES)], "ball": ball}
+
+
+def test_track_store_round_trip_keeps_trailing_empty_frames(tmp_path):
+    tracks = make_tracks()
+    ball_control_stats = BallControlStats.from_team_ball_control(np.ones(NUM_FRAMES, dtype=np.int64))
+    with TrackBundleWriter(tmp_path / "bundle", chunk_frames=5) as writer:
+        writer.write_tracks(tracks, np.zeros((NUM_FRAMES, 2)), ball_control_stats)
+
+    bundle = TrackBundle(tmp_path / "bundle")
+    for object, object_tracks in tracks.items():
+        store = bundle.to_track_store(object)
+        expected = TrackStore.from_frames(object_tracks)
+        assert store.num_frames == NUM_FRAMES
+        np.testing.assert_array_equal(store.frame_offsets, expected.frame_offsets)
+        np.testing.assert_array_equal(store.track_id, expected.track_id)
+        np.testing.assert_array_equal(store.get_column("bbox"), expected.get_column("bbox"))
+
+
+def test_track_store_from_a_bundle_with_dropped_frames(tmp_path):
+    tracks = make_tracks()
+    with TrackBundleWriter(tmp_path / "bundle") as writer:
+        for frame_num in (0, 3, 5):
+            writer.write_frame(frame_num, {object: tracks[object][frame_num] for object in tracks})
+
+    # Frames dropped by a live feed are empty in the store, which spans up to the last frame written
+    store = TrackBundle(tmp_path / "bundle").to_track_store("ball")
+    assert store.num_frames == 6
+    assert [frame_num for frame_num, track in enumerate(store.to_frames()) if track] == [3]
@@ -0,0 +1,2 @@
+from .track_store import FIELDS, TrackStore, tracks_to_stores, stores_to_tracks
+from .track_bundle import TrackBundle, TrackBundleWriter
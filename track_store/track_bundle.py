@@ -0,0 +1,212 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from .track_store import FIELDS, TrackStore
+
+OBJECTS = ("players", "referees", "ball")
+
+# Per-frame analytics, stored as their own table next to the objects
+FRAME_FIELDS = {
+    "camera_movement": (np.float32, (2,)),
+    "team_ball_control": (np.int8, ()),
+    "team_1_frames": (np.int32, ()),
+    "team_2_frames": (np.int32, ()),
+}
+
+# Column names for the components of vector fields when flattened into a DataFrame
+COMPONENTS = {
+    "bbox": ("x1", "y1", "x2", "y2"),
+    "position": ("x", "y"),
+    "position_adjusted": ("x", "y"),
+    "position_transformed": ("x", "y"),
+    "team_color": ("b", "g", "r"),
+    "camera_movement": ("x", "y"),
+}
+
+
+def get_table_fields(table):
+    if table == "frames":
+        return {"frame": (np.int32, ()), **FRAME_FIELDS}
+    return {"frame": (np.int32, ()), "track_id": (np.int32, ()),
+            **{name: (dtype, shape) for name, (dtype, shape, _) in FIELDS.items()}}
+
+
+class TrackBundleWriter():
+    """Append tracks and per-frame analytics to a directory of raw column files, one chunk of frames at a time.
+
+    Frames must be written in increasing order; gaps (frames dropped by a live feed) are allowed. The metadata is
+    rewritten after every chunk, so a reader always sees the complete chunks written so far.
+    """
+
+    def __init__(self, path, frame_rate=24, chunk_frames=250):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.frame_rate = frame_rate
+        self.chunk_frames = chunk_frames
+
+        self.last_frame = -1
+        self.num_rows = {table: 0 for table in OBJECTS + ("frames",)}
+        self.pending_rows = {object: [] for object in OBJECTS}
+        self.pending_frames = []
+        self.files = {(table, name): open(self.path / f"{table}.{name}.bin", "wb")
+                      for table in self.num_rows for name in get_table_fields(table)}
+
+    def write_frame(self, frame_num, frame_tracks, camera_movement=(0, 0), ball_control=(0, 0, 0)):
+        """Add one frame: frame_tracks maps each object to its {track_id: track_info} for the frame, ball_control
+        is the team in control and both teams' running frame counts."""
+        if frame_num <= self.last_frame:
+            raise ValueError(f"Frame {frame_num} written after frame {self.last_frame}")
+        self.last_frame = frame_num
+
+        for object in OBJECTS:
+            track = frame_tracks.get(object, {})
+            self.pending_rows[object] += [(frame_num, track_id, track[track_id]) for track_id in sorted(track)]
+        self.pending_frames.append((frame_num, camera_movement, ball_control))
+
+        if len(self.pending_frames) >= self.chunk_frames:
+            self.flush()
+
+    def write_tracks(self, tracks, camera_movement_per_frame, ball_control_stats, start_frame=0, end_frame=None):
+        end_frame = len(tracks["players"]) if end_frame is None else end_frame
+        for frame_num in range(start_frame, end_frame):
+            self.write_frame(frame_num, {object: tracks[object][frame_num] for object in OBJECTS},
+                             camera_movement_per_frame[frame_num], ball_control_stats.counts[frame_num])
+
+    def get_object_columns(self, rows):
+        columns = {
+            "frame": np.array([frame_num for frame_num, _, _ in rows], dtype=np.int32),
+            "track_id": np.array([track_id for _, track_id, _ in rows], dtype=np.int32),
+        }
+        for name, (dtype, shape, missing) in FIELDS.items():
+            column = np.full((len(rows),) + shape, missing, dtype=dtype)
+            for row, (_, _, track_info) in enumerate(rows):
+                value = track_info.get(name)
+                if value is not None:
+                    column[row] = value
+            columns[name] = column
+        return columns
+
+    def get_frame_columns(self, frames):
+        ball_control = np.array([control for _, _, control in frames], dtype=np.int64).reshape(-1, 3)
+        return {
+            "frame": np.array([frame_num for frame_num, _, _ in frames], dtype=np.int32),
+            "camera_movement": np.array([movement for _, movement, _ in frames], dtype=np.float32).reshape(-1, 2),
+            "team_ball_control": ball_control[:, 0].astype(np.int8),
+            "team_1_frames": ball_control[:, 1].astype(np.int32),
+            "team_2_frames": ball_control[:, 2].astype(np.int32),
+        }
+
+    def flush(self):
+        tables = {object: (self.get_object_columns(rows), len(rows)) for object, rows in self.pending_rows.items()}
+        tables["frames"] = (self.get_frame_columns(self.pending_frames), len(self.pending_frames))
+
+        for table, (columns, num_rows) in tables.items():
+            for name, column in columns.items():
+                file = self.files[(table, name)]
+                column.tofile(file)
+                file.flush()
+            self.num_rows[table] += num_rows
+
+        self.pending_rows = {object: [] for object in OBJECTS}
+        self.pending_frames = []
+        self.write_metadata()
+
+    def write_metadata(self):
+        metadata = {
+            "version": 1,
+            "frame_rate": self.frame_rate,
+            "tables": {table: {"rows": num_rows,
+                               "columns": {name: {"dtype": np.dtype(dtype).str, "shape": list(shape)}
+                                           for name, (dtype, shape) in get_table_fields(table).items()}}
+                       for table, num_rows in self.num_rows.items()},
+        }
+        tmp_path = self.path / "metadata.json.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(tmp_path, self.path / "metadata.json")
+
+    def close(self):
+        self.flush()
+        for file in self.files.values():
+            file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TrackBundle():
+    """Memory-map a bundle written by TrackBundleWriter; only the pages a query touches are read from disk."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / "metadata.json") as f:
+            metadata = json.load(f)
+        self.frame_rate = metadata["frame_rate"]
+        self.tables = metadata["tables"]
+        self._columns = {}
+
+    @property
+    def num_frames(self):
+        return self.tables["frames"]["rows"]
+
+    def get_column(self, table, name):
+        key = (table, name)
+        if key not in self._columns:
+            num_rows = self.tables[table]["rows"]
+            column = self.tables[table]["columns"][name]
+            shape = (num_rows,) + tuple(column["shape"])
+            if num_rows == 0:
+                # np.memmap cannot map an empty file
+                self._columns[key] = np.zeros(shape, dtype=column["dtype"])
+            else:
+                self._columns[key] = np.memmap(self.path / f"{table}.{name}.bin", dtype=column["dtype"], mode="r",
+                                               shape=shape)
+        return self._columns[key]
+
+    def get_columns(self, table, rows=slice(None), columns=None):
+        names = columns if columns is not None else self.tables[table]["columns"]
+        return {name: self.get_column(table, name)[rows] for name in names}
+
+    def get_frame_range(self, table, start_frame, end_frame, columns=None):
+        # Rows are in frame order, so a frame range is a contiguous slice found by binary search
+        start, end = np.searchsorted(self.get_column(table, "frame"), [start_frame, end_frame])
+        return self.get_columns(table, slice(int(start), int(end)), columns)
+
+    def get_frame(self, table, frame_num, columns=None):
+        return self.get_frame_range(table, frame_num, frame_num + 1, columns)
+
+    def get_track(self, object, track_id, columns=None):
+        rows = np.flatnonzero(self.get_column(object, "track_id") == track_id)
+        return self.get_columns(object, rows, columns)
+
+    def to_dataframe(self, table, start_frame=None, end_frame=None, columns=None):
+        import pandas as pd
+        if start_frame is None and end_frame is None:
+            data = self.get_columns(table, columns=columns)
+        else:
+            start_frame = 0 if start_frame is None else start_frame
+            end_frame = np.iinfo(np.int32).max if end_frame is None else end_frame
+            data = self.get_frame_range(table, start_frame, end_frame, columns)
+
+        flat = {}
+        for name, values in data.items():
+            if values.ndim == 1:
+                flat[name] = np.asarray(values)
+            else:
+                for i, component in enumerate(COMPONENTS.get(name, range(values.shape[1]))):
+                    flat[f"{name}_{component}"] = np.asarray(values[:, i])
+        return pd.DataFrame(flat)
+
+    def to_track_store(self, object):
+        columns = self.get_columns(object)
+        frame, track_id = columns.pop("frame"), columns.pop("track_id")
+        # Every written frame has a row in the frames table, including the last ones where the object was not seen
+        frames = self.get_column("frames", "frame")
+        num_frames = int(frames[-1]) + 1 if len(frames) else 0
+        return TrackStore(num_frames, frame, track_id, columns)
@@ -0,0 +1,172 @@
+import numpy as np
+
+# Column dtype, per-row shape and the value used where a row has no data for the field
+FIELDS = {
+    "bbox": (np.float32, (4,), np.nan),
+    "confidence": (np.float32, (), np.nan),
+    "position": (np.int32, (2,), 0),
+    "position_adjusted": (np.float32, (2,), np.nan),
+    "position_transformed": (np.float32, (2,), np.nan),
+    "speed": (np.float32, (), np.nan),
+    "speed_smoothed": (np.float32, (), np.nan),
+    "distance": (np.float32, (), np.nan),
+    "team": (np.int8, (), -1),
+    "team_color": (np.float32, (3,), np.nan),
+    "has_ball": (np.bool_, (), False),
+}
+
+
+class TrackStore():
+    def __init__(self, num_frames, frame, track_id, columns=None):
+        frame = np.asarray(frame, dtype=np.int32)
+        track_id = np.asarray(track_id, dtype=np.int32)
+        order = np.lexsort((track_id, frame))
+
+        self.num_frames = num_frames
+        self.frame = frame[order]
+        self.track_id = track_id[order]
+        self.columns = {name: np.asarray(values, dtype=FIELDS[name][0])[order]
+                        for name, values in (columns or {}).items()}
+
+        # Rows are sorted by frame, so each frame is a contiguous slice
+        self.frame_offsets = np.searchsorted(self.frame, np.arange(num_frames + 1)).astype(np.int64)
+        self._track_order = None
+        self._track_offsets = None
+        self._track_ids = None
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def nbytes(self):
+        return (self.frame.nbytes + self.track_id.nbytes + self.frame_offsets.nbytes +
+                sum(column.nbytes for column in self.columns.values()))
+
+    @property
+    def track_ids(self):
+        self._index_tracks()
+        return self._track_ids
+
+    def _index_tracks(self):
+        if self._track_order is not None:
+            return
+        self._track_order = np.lexsort((self.frame, self.track_id))
+        sorted_ids = self.track_id[self._track_order]
+        self._track_ids, starts = np.unique(sorted_ids, return_index=True)
+        self._track_offsets = np.append(starts, len(sorted_ids))
+
+    def frame_rows(self, frame_num):
+        return slice(int(self.frame_offsets[frame_num]), int(self.frame_offsets[frame_num + 1]))
+
+    def track_rows(self, track_id):
+        self._index_tracks()
+        index = np.searchsorted(self._track_ids, track_id)
+        if index >= len(self._track_ids) or self._track_ids[index] != track_id:
+            return np.zeros(0, dtype=np.int64)
+        return self._track_order[self._track_offsets[index]:self._track_offsets[index + 1]]
+
+    def get_column(self, name):
+        if name not in self.columns:
+            dtype, shape, missing = FIELDS[name]
+            self.columns[name] = np.full((len(self),) + shape, missing, dtype=dtype)
+        return self.columns[name]
+
+    def set_column(self, name, values, rows=None):
+        if rows is None:
+            dtype, shape, _ = FIELDS[name]
+            self.columns[name] = np.asarray(values, dtype=dtype).reshape((len(self),) + shape)
+        else:
+            self.get_column(name)[rows] = values
+
+    def get_values(self, name, rows=slice(None)):
+        """Python values of one column for the given rows, and the rows whose track_info dicts get the value
+        (None for all of them)."""
+        column = self.columns[name][rows]
+        values = column.tolist()
+        if name == "position_transformed":
+            # None marks a position that fell outside the pitch
+            return [None if outside else value for value, outside in
+                    zip(values, np.isnan(column).any(axis=1).tolist())], None
+        if name == "team":
+            return values, np.flatnonzero(column >= 0)
+        if name == "has_ball":
+            return values, np.flatnonzero(column)
+        if name in ("position", "position_adjusted"):
+            values = [tuple(value) for value in values]
+        if name == "team_color":
+            # Every row repeats one of a few colours, so equal colours share one tuple, like the team's colour does
+            shared = {}
+            values = [shared.setdefault(color, color) for color in map(tuple, values)]
+        if column.dtype.kind == "f":
+            return values, np.flatnonzero(~np.isnan(column).reshape(len(column), -1).any(axis=1))
+        return values, None
+
+    def get_rows(self, rows=slice(None)):
+        # Each column is converted in one go, which is far cheaper than converting row by row
+        track_infos = [{} for _ in range(len(self.frame[rows]))]
+        for name in self.columns:
+            values, kept = self.get_values(name, rows)
+            if kept is None:
+                for track_info, value in zip(track_infos, values):
+                    track_info[name] = value
+            else:
+                for row in kept.tolist():
+                    track_infos[row][name] = values[row]
+        return track_infos
+
+    def get_row(self, row):
+        return self.get_rows(slice(row, row + 1))[0]
+
+    def get_frame(self, frame_num):
+        rows = self.frame_rows(frame_num)
+        return dict(zip(self.track_id[rows].tolist(), self.get_rows(rows)))
+
+    def to_frames(self):
+        track_ids = self.track_id.tolist()
+        rows = self.get_rows()
+        offsets = self.frame_offsets.tolist()
+        return [dict(zip(track_ids[start:end], rows[start:end])) for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def to_arrays(self):
+        arrays = {"frame": self.frame, "track_id": self.track_id}
+        arrays.update(self.columns)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, num_frames, arrays):
+        columns = {name: values for name, values in arrays.items() if name in FIELDS}
+        return cls(num_frames, arrays["frame"], arrays["track_id"], columns)
+
+    @classmethod
+    def from_frames(cls, object_tracks, fields=None):
+        frames, track_ids, rows = [], [], []
+        present = set()
+        for frame_num, track in enumerate(object_tracks):
+            for track_id, track_info in track.items():
+                frames.append(frame_num)
+                track_ids.append(track_id)
+                rows.append(track_info)
+                present.update(track_info.keys())
+
+        columns = {}
+        for name in FIELDS:
+            if name not in present or (fields is not None and name not in fields):
+                continue
+            dtype, shape, missing = FIELDS[name]
+            values = [track_info.get(name) for track_info in rows]
+            present_rows = [row for row, value in enumerate(values) if value is not None]
+            column = np.full((len(rows),) + shape, missing, dtype=dtype)
+            if present_rows:
+                column[present_rows] = np.array([values[row] for row in present_rows], dtype=dtype).reshape(
+                    (len(present_rows),) + shape)
+            columns[name] = column
+
+        return cls(len(object_tracks), frames, track_ids, columns)
+
+
+def tracks_to_stores(tracks, fields=None):
+    return {object: TrackStore.from_frames(object_tracks, fields) for object, object_tracks in tracks.items()}
+
+
+def stores_to_tracks(stores):
+    return {object: store.to_frames() for object, store in stores.items()}
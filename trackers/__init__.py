@@ -1 +1,4 @@
-from .tracker import Tracker
\ No newline at end of file
+from .tracker import Tracker
+from .inference_engine import InferenceEngine, AdaptiveBatchSizer, FrameDetections
+from .detector_backend import load_detector, export_model
+from .ball_detector import BallDetector
@@ -0,0 +1,119 @@
+import logging
+import math
+
+import numpy as np
+
+from instrumentation import metrics
+from .inference_engine import FrameDetections, InferenceEngine
+
+logger = logging.getLogger(__name__)
+
+
+class BallDetector():
+    """Re-detect the ball at native resolution in a crop around its predicted position, or in tiles once lost."""
+
+    def __init__(self, model, conf=0.1, crop_size=640, min_confidence=0.3, max_missed_frames=10, tile_overlap=0.1,
+                 search_interval=5, stride=32):
+        # Crops are fed at their own size, so the ball keeps every pixel it has in the source frame. That size has
+        # to be a multiple of the stride for the model to take the crop as it is.
+        if crop_size % stride:
+            rounded_crop_size = math.ceil(crop_size / stride) * stride
+            logger.warning("Ball crop size %d is not a multiple of the stride %d, using %d", crop_size, stride,
+                           rounded_crop_size)
+            crop_size = rounded_crop_size
+        self.engine = InferenceEngine(model, conf=conf, imgsz=crop_size, batch_size=8, stride=stride)
+        self.crop_size = crop_size
+        self.min_confidence = min_confidence
+        self.max_missed_frames = max_missed_frames
+        self.tile_overlap = tile_overlap
+        self.search_interval = search_interval
+        self.reset()
+
+    def reset(self):
+        self.last_center = None
+        self.velocity = np.zeros(2)
+        self.missed_frames = 0
+
+    def predict_center(self):
+        # Constant-velocity extrapolation from the last detection
+        return self.last_center + self.velocity * (self.missed_frames + 1)
+
+    def get_crop_origin(self, center, frame_size):
+        width, height = frame_size
+        x = int(np.clip(center[0] - self.crop_size / 2, 0, max(width - self.crop_size, 0)))
+        y = int(np.clip(center[1] - self.crop_size / 2, 0, max(height - self.crop_size, 0)))
+        return x, y
+
+    def get_tile_origins(self, frame_size):
+        step = max(int(self.crop_size * (1 - self.tile_overlap)), 1)
+
+        def starts(length):
+            last = max(length - self.crop_size, 0)
+            return sorted(set(list(range(0, last, step)) + [last]))
+
+        return [(x, y) for y in starts(frame_size[1]) for x in starts(frame_size[0])]
+
+    def detect_in_regions(self, frame, origins, ball_class_id):
+        crops = [frame[y:y + self.crop_size, x:x + self.crop_size] for x, y in origins]
+        boxes, confidences = [], []
+        for (x, y), detection in zip(origins, self.engine.predict(self.engine.preprocess(crops))):
+            is_ball = detection.class_id == ball_class_id
+            boxes.append(detection.xyxy[is_ball] + np.array([x, y, x, y], dtype=np.float32))
+            confidences.append(detection.confidence[is_ball])
+        return np.concatenate(boxes).reshape(-1, 4), np.concatenate(confidences)
+
+    def update(self, ball_box):
+        if ball_box is None:
+            self.missed_frames += 1
+            return
+
+        center = np.array([(ball_box[0] + ball_box[2]) / 2, (ball_box[1] + ball_box[3]) / 2])
+        if self.last_center is not None and self.missed_frames <= self.max_missed_frames:
+            self.velocity = (center - self.last_center) / (self.missed_frames + 1)
+        else:
+            self.velocity = np.zeros(2)
+        self.last_center = center
+        self.missed_frames = 0
+
+    def refine(self, frame, detection):
+        class_names_inv = {v: k for k, v in detection.names.items()}
+        if "ball" not in class_names_inv:
+            return detection
+        ball_class_id = class_names_inv["ball"]
+
+        is_ball = detection.class_id == ball_class_id
+        boxes, confidences = detection.xyxy[is_ball], detection.confidence[is_ball]
+
+        # A confident ball in the reduced-resolution pass needs no second look
+        if not len(confidences) or confidences.max() < self.min_confidence:
+            frame_size = (frame.shape[1], frame.shape[0])
+            origins = None
+            if self.last_center is not None and self.missed_frames <= self.max_missed_frames:
+                origins = [self.get_crop_origin(self.predict_center(), frame_size)]
+                metrics.count("ball_crop_searches")
+            elif self.missed_frames % self.search_interval == 0:
+                origins = self.get_tile_origins(frame_size)
+                metrics.count("ball_tile_searches")
+
+            if origins:
+                region_boxes, region_confidences = self.detect_in_regions(frame, origins, ball_class_id)
+                boxes = np.concatenate([boxes, region_boxes])
+                confidences = np.concatenate([confidences, region_confidences])
+
+        best = int(np.argmax(confidences)) if len(confidences) else None
+        self.update(boxes[best] if best is not None else None)
+
+        # Keep every other object as detected and at most one ball, the most confident one
+        keep = ~is_ball
+        ball_rows = slice(best, best + 1) if best is not None else slice(0, 0)
+        return FrameDetections(
+            xyxy=np.concatenate([detection.xyxy[keep], boxes[ball_rows]]).astype(np.float32),
+            confidence=np.concatenate([detection.confidence[keep], confidences[ball_rows]]).astype(np.float32),
+            class_id=np.concatenate([detection.class_id[keep],
+                                     np.full(1 if best is not None else 0, ball_class_id, dtype=np.int16)]),
+            names=detection.names)
+
+    def iter_detections(self, batches):
+        for frames, detections in batches:
+            for frame, detection in zip(frames, detections):
+                yield self.refine(frame, detection)
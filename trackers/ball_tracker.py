@@ -0,0 +1,197 @@
+import math
+
+import numpy as np
+
+
+class BallTracker():
+    """Constant-velocity Kalman filter on the ball centre, gating the ball candidates of every frame.
+
+    Both axes share one noise model, so the 2x2 position/velocity covariance is the same for x and y and is
+    kept as three floats; a frame costs a handful of scalar operations however long the match is. Process
+    noise is continuous white acceleration, Q = q [[1/3, 1/2], [1/2, 1]] per frame.
+    """
+
+    def __init__(self, process_noise=100.0, measurement_noise=4.0, gate=13.8, max_missed_frames=12,
+                 initial_velocity_variance=400.0, size_smoothing=0.3):
+        # process_noise is the acceleration variance in px^2/frame^4. measurement_noise is the variance of a
+        # detection with confidence 1; less confident detections count as proportionally noisier. gate is the
+        # squared Mahalanobis distance beyond which a candidate cannot be the tracked ball (99.9% for 2 DOF).
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.gate = gate
+        self.max_missed_frames = max_missed_frames
+        self.initial_velocity_variance = initial_velocity_variance
+        self.size_smoothing = size_smoothing
+        self.reset()
+
+    def reset(self):
+        self.initialized = False
+        self.missed_frames = 0
+        self.x = self.y = self.vx = self.vy = 0.0
+        # Shared covariance [[p_pos, p_cross], [p_cross, p_vel]]
+        self.p_pos = self.p_cross = self.p_vel = 0.0
+        self.width = self.height = 0.0
+
+    @property
+    def lost(self):
+        return not self.initialized or self.missed_frames > self.max_missed_frames
+
+    def get_measurement_noise(self, confidence):
+        return self.measurement_noise / max(confidence, 0.05)
+
+    def initialize(self, box, confidence):
+        self.initialized = True
+        self.missed_frames = 0
+        self.x, self.y = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+        self.vx = self.vy = 0.0
+        self.p_pos = self.get_measurement_noise(confidence)
+        self.p_cross = 0.0
+        self.p_vel = self.initial_velocity_variance
+        self.width, self.height = box[2] - box[0], box[3] - box[1]
+
+    def predict(self):
+        q = self.process_noise
+        self.x += self.vx
+        self.y += self.vy
+        self.p_pos, self.p_cross, self.p_vel = (self.p_pos + 2 * self.p_cross + self.p_vel + q / 3,
+                                                self.p_cross + self.p_vel + q / 2,
+                                                self.p_vel + q)
+
+    def get_distance(self, box, confidence):
+        # Squared Mahalanobis distance of a candidate centre from the predicted position
+        innovation_variance = self.p_pos + self.get_measurement_noise(confidence)
+        dx = (box[0] + box[2]) / 2 - self.x
+        dy = (box[1] + box[3]) / 2 - self.y
+        return (dx * dx + dy * dy) / innovation_variance
+
+    def correct(self, box, confidence):
+        innovation_variance = self.p_pos + self.get_measurement_noise(confidence)
+        gain_pos = self.p_pos / innovation_variance
+        gain_vel = self.p_cross / innovation_variance
+        dx = (box[0] + box[2]) / 2 - self.x
+        dy = (box[1] + box[3]) / 2 - self.y
+        self.x += gain_pos * dx
+        self.y += gain_pos * dy
+        self.vx += gain_vel * dx
+        self.vy += gain_vel * dy
+        self.p_vel -= gain_vel * self.p_cross
+        self.p_cross *= 1 - gain_pos
+        self.p_pos *= 1 - gain_pos
+        self.width += self.size_smoothing * (box[2] - box[0] - self.width)
+        self.height += self.size_smoothing * (box[3] - box[1] - self.height)
+        self.missed_frames = 0
+
+    def update(self, boxes, confidences):
+        """Advance one frame; returns the index of the candidate taken as the ball, or None."""
+        if self.lost:
+            if not len(boxes):
+                self.missed_frames += 1
+                return None
+            # Nothing to gate against: start over from the most confident candidate
+            best = int(np.argmax(confidences))
+            self.initialize(boxes[best], float(confidences[best]))
+            return best
+
+        self.predict()
+        best, best_cost = None, math.inf
+        for i in range(len(boxes)):
+            confidence = float(confidences[i])
+            distance = self.get_distance(boxes[i], confidence)
+            # Closer and more confident candidates are more likely to be the ball
+            cost = distance - 2 * math.log(max(confidence, 1e-6))
+            if distance <= self.gate and cost < best_cost:
+                best, best_cost = i, cost
+
+        if best is None:
+            self.missed_frames += 1
+            return None
+        self.correct(boxes[best], float(confidences[best]))
+        return best
+
+    def get_bbox(self):
+        return [self.x - self.width / 2, self.y - self.height / 2, self.x + self.width / 2, self.y + self.height / 2]
+
+    def smooth(self, frames, centers, noise):
+        """Smoothed centres of every frame between the first and last detection of one or more segments.
+
+        frames are the detected frame numbers, split into segments wherever the ball was lost for longer than
+        max_missed_frames. The Rauch-Tung-Striebel smoother of this model is the least-squares fit of all
+        states to the detections and the motion model, which is block tridiagonal: it is solved in one banded
+        Cholesky solve instead of a Python loop over the frames.
+        """
+        starts = np.r_[True, np.diff(frames) > self.max_missed_frames + 1]
+        first_frames = frames[starts]
+        last_frames = frames[np.r_[starts[1:], True]]
+        lengths = last_frames - first_frames + 1
+        offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+        num_states = int(lengths.sum())
+        state_frames = np.arange(num_states) + np.repeat(first_frames - offsets, lengths)
+        linked = np.ones(num_states, dtype=bool)
+        linked[offsets] = False
+
+        # Upper banded form of the symmetric system over [x_0, v_0, x_1, v_1, ...]: row 3 is the diagonal and
+        # rows 2, 1, 0 the first, second and third superdiagonals, each viewed as (state, x/v column) pairs.
+        # Every link from state k-1 to state k adds the inverse process noise W = 1/q [[12, -6], [-6, 4]]
+        # through x_k - x_{k-1} - v_{k-1} and v_k - v_{k-1}.
+        weight = np.where(linked, 1 / self.process_noise, 0.0)
+        # Built transposed so LAPACK gets the column-major layout it works in without a copy
+        banded = np.zeros((2 * num_states, 4)).T
+        third, second, first, diagonal = (row.reshape(num_states, 2) for row in banded)
+        diagonal[:, 0] += 12 * weight
+        diagonal[:, 1] += 4 * weight
+        diagonal[:-1, 0] += 12 * weight[1:]
+        diagonal[:-1, 1] += 4 * weight[1:]
+        first[:, 1] -= 6 * weight
+        first[:-1, 1] += 6 * weight[1:]
+        first[:, 0] = -6 * weight
+        second[:, 0] = -12 * weight
+        second[:, 1] = 2 * weight
+        third[:, 1] = 6 * weight
+
+        # Detections pull the positions, the prior on the first velocity of each segment keeps it defined
+        measured = frames - np.repeat(first_frames - offsets, np.diff(np.r_[np.flatnonzero(starts), len(frames)]))
+        diagonal[measured, 0] += 1 / noise
+        diagonal[offsets, 1] += 1 / self.initial_velocity_variance
+        rhs = np.zeros((2, num_states, 2))
+        rhs[:, measured, 0] = (centers / noise[:, None]).T
+
+        # scipy is only needed offline, so live and cached runs never import it
+        from scipy.linalg import solveh_banded
+        solution = solveh_banded(banded, rhs.reshape(2, -1).T, overwrite_ab=True, overwrite_b=True,
+                                 check_finite=False)
+        return state_frames, solution[0::2]
+
+    def track(self, boxes, confidences=None):
+        """Smooth a whole ball track offline.
+
+        boxes is (num_frames, 4) with NaN rows where no ball was detected; candidates are expected to have
+        been gated by update() already. Returns (num_frames, 4) boxes for every frame: short gaps follow the
+        motion model, gaps where the track was lost are bridged linearly and frames before the first and
+        after the last detection hold the nearest estimate.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        num_frames = len(boxes)
+        if confidences is None:
+            confidences = np.ones(num_frames)
+        confidences = np.nan_to_num(np.asarray(confidences, dtype=np.float64), nan=1.0)
+        detected = ~np.isnan(boxes).any(axis=1)
+        if not detected.any():
+            return np.full((num_frames, 4), np.nan)
+
+        detected_frames = np.flatnonzero(detected)
+        detected_centers = (boxes[detected, :2] + boxes[detected, 2:]) / 2
+        noise = self.measurement_noise / np.maximum(confidences[detected], 0.05)
+        state_frames, smoothed = self.smooth(detected_frames, detected_centers, noise)
+
+        # Lost stretches are bridged linearly; np.interp holds the end values outside the tracked range
+        frames = np.arange(num_frames)
+        centers = np.stack([np.interp(frames, state_frames, smoothed[:, 0]),
+                            np.interp(frames, state_frames, smoothed[:, 1])], axis=1)
+
+        # Box sizes are not filtered, each frame takes the size of the nearest earlier detection
+        sizes = boxes[:, 2:] - boxes[:, :2]
+        previous = np.maximum.accumulate(np.where(detected, frames, -1))
+        previous[previous < 0] = detected_frames[0]
+        sizes = sizes[previous]
+
+        return np.concatenate([centers - sizes / 2, centers + sizes / 2], axis=1)
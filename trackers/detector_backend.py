@@ -0,0 +1,98 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from detection_cache import hash_file
+
+BACKENDS = ("pytorch", "onnx", "openvino")
+QUANTIZATIONS = (None, "fp16", "int8")
+
+logger = logging.getLogger(__name__)
+
+
+def get_calibration_key(quantization, calibration_data=None):
+    # INT8 scales are fitted to the calibration images, so the dataset yaml is part of an INT8 model's identity.
+    # A name that is not a file is one ultralytics resolves itself, such as coco8.yaml, and is keyed by the name.
+    if quantization != "int8" or calibration_data is None:
+        return None
+    if os.path.isfile(calibration_data):
+        return hash_file(calibration_data)[:16]
+    return hashlib.sha256(str(calibration_data).encode()).hexdigest()[:16]
+
+
+def get_export_path(model_path, backend, imgsz=640, quantization=None, calibration_data=None):
+    # Exports are keyed by the weights' content so retrained weights never reuse a stale export
+    model_path = Path(model_path)
+    suffix = ".onnx" if backend == "onnx" else "_openvino_model"
+    name = f"{model_path.stem.replace(' ', '_')}-{hash_file(model_path)[:16]}-{imgsz}-{quantization or 'fp32'}"
+    calibration_key = get_calibration_key(quantization, calibration_data)
+    if calibration_key is not None:
+        name += f"-{calibration_key}"
+    return model_path.parent / "exports" / f"{name}{suffix}"
+
+
+def export_model(model_path, backend, imgsz=640, quantization=None, calibration_data=None):
+    if backend not in ("onnx", "openvino"):
+        raise ValueError(f"Cannot export to backend: {backend}")
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization: {quantization}")
+    if quantization == "int8" and backend != "openvino":
+        raise ValueError("INT8 quantization is only supported for the OpenVINO backend")
+    if quantization == "fp16" and backend == "onnx":
+        # The ONNX exporter can only trace in half precision on a GPU; on a CPU it drops half or refuses it with
+        # dynamic axes, and an fp32 model would be cached under the fp16 name
+        import torch
+        if not torch.cuda.is_available():
+            raise RuntimeError("FP16 ONNX export needs a CUDA device; use --quantization int8 with the OpenVINO "
+                               "backend or no quantization on this host")
+
+    export_path = get_export_path(model_path, backend, imgsz, quantization, calibration_data)
+    if export_path.exists():
+        return str(export_path)
+
+    from ultralytics import YOLO
+
+    # Dynamic axes so the rect letterboxed batches of any size can be fed to the exported model
+    export_params = {"data": calibration_data} if calibration_data is not None else {}
+    if quantization == "fp16" and backend == "onnx":
+        # ultralytics exports on the CPU unless told otherwise
+        export_params["device"] = 0
+    export_path.parent.mkdir(parents=True, exist_ok=True)
+    # ultralytics writes the export next to the weights, so processes exporting the same weights at once would
+    # overwrite and move each other's files. Each export runs on its own copy of the weights in a private
+    # directory next to the exports, and is renamed into place in one step.
+    with tempfile.TemporaryDirectory(prefix=".export-", dir=export_path.parent) as export_dir:
+        weights_path = Path(export_dir) / Path(model_path).name
+        shutil.copyfile(model_path, weights_path)
+        exported_path = YOLO(str(weights_path)).export(format=backend, imgsz=imgsz, dynamic=True,
+                                                       half=quantization == "fp16", int8=quantization == "int8",
+                                                       **export_params)
+        try:
+            os.replace(exported_path, export_path)
+        except OSError:
+            # An OpenVINO directory cannot replace the one another process has just put in place
+            if not export_path.exists():
+                raise
+            return str(export_path)
+    logger.info("Exported %s to %s", model_path, export_path)
+    return str(export_path)
+
+
+def load_detector(model_path, backend="pytorch", imgsz=640, quantization=None, calibration_data=None,
+                  export_path=None):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend: {backend}")
+    # ultralytics pulls in torch, which takes seconds to import; only the commands that run inference pay for it
+    from ultralytics import YOLO
+    if backend == "pytorch":
+        if quantization is not None:
+            raise ValueError("Quantization needs an exported backend (onnx or openvino)")
+        return YOLO(str(model_path))
+
+    # The exported model runs through its own runtime but returns the same ultralytics Results
+    if export_path is None:
+        export_path = export_model(model_path, backend, imgsz, quantization, calibration_data)
+    return YOLO(export_path, task="detect")
@@ -0,0 +1,150 @@
+import logging
+import math
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import cv2
+import numpy as np
+
+from instrumentation import get_available_ram, metrics
+
+logger = logging.getLogger(__name__)
+
+# Only the boxes survive inference; the ultralytics Results (and the images they hold) are dropped per batch
+FrameDetections = namedtuple("FrameDetections", ["xyxy", "confidence", "class_id", "names"])
+
+
+def get_available_memory():
+    import torch
+    if torch.cuda.is_available():
+        free, _ = torch.cuda.mem_get_info()
+        return free
+    return get_available_ram()
+
+
+class AdaptiveBatchSizer():
+    """Grow the batch size while measured throughput keeps improving and the batch fits in memory."""
+
+    def __init__(self, initial_batch_size=4, max_batch_size=64, frame_memory=None, memory_fraction=0.25,
+                 min_gain=1.05):
+        self.max_batch_size = max_batch_size
+        self.min_gain = min_gain
+        self.throughput = {}
+        self.settled = False
+
+        available_memory = get_available_memory()
+        if frame_memory and available_memory:
+            self.max_batch_size = max(1, min(max_batch_size, int(available_memory * memory_fraction // frame_memory)))
+        self.batch_size = min(initial_batch_size, self.max_batch_size)
+
+    def update(self, batch_size, elapsed):
+        # Partial batches at the end of a video say nothing about the batch size being tried
+        if batch_size != self.batch_size or elapsed <= 0:
+            return
+        fps = batch_size / elapsed
+        self.throughput[batch_size] = max(fps, self.throughput.get(batch_size, 0.0))
+        if self.settled:
+            return
+
+        smaller = self.batch_size // 2
+        if smaller in self.throughput and fps < self.throughput[smaller] * self.min_gain:
+            # Doubling stopped paying off, go back to the best size seen
+            self.batch_size = max(self.throughput, key=self.throughput.get)
+            self.settled = True
+        elif self.batch_size * 2 <= self.max_batch_size:
+            self.batch_size *= 2
+        else:
+            self.settled = True
+
+
+class InferenceEngine():
+    def __init__(self, model, conf=0.1, imgsz=640, batch_size=None, max_batch_size=64, preprocess_workers=None,
+                 stride=32):
+        self.model = model
+        self.conf = conf
+        # The padded input has to be divisible by the stride, which the letterbox only guarantees when imgsz is;
+        # round it up like ultralytics' check_imgsz does
+        self.imgsz = math.ceil(imgsz / stride) * stride
+        if self.imgsz != imgsz:
+            logger.warning("imgsz=%d is not a multiple of the stride %d, using %d", imgsz, stride, self.imgsz)
+        self.stride = stride
+        self.executor = ThreadPoolExecutor(max_workers=preprocess_workers or os.cpu_count() or 1,
+                                           thread_name_prefix="letterbox")
+
+        # A fixed batch size disables the adaptive search
+        self.batch_sizer = None
+        self.batch_size = batch_size
+        if batch_size is None:
+            # Rough per-frame footprint: the float input tensor and the activations it produces
+            frame_memory = 3 * self.imgsz * self.imgsz * 4 * 16
+            self.batch_sizer = AdaptiveBatchSizer(max_batch_size=max_batch_size, frame_memory=frame_memory)
+
+    def get_batch_size(self):
+        return self.batch_sizer.batch_size if self.batch_sizer is not None else self.batch_size
+
+    def letterbox(self, frame):
+        with metrics.stage("preprocess"):
+            # Same geometry as the ultralytics LetterBox in rect mode: keep the aspect ratio, pad to the stride
+            height, width = frame.shape[:2]
+            ratio = min(self.imgsz / height, self.imgsz / width)
+            new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+            pad_x = ((self.imgsz - new_width) % self.stride) / 2
+            pad_y = ((self.imgsz - new_height) % self.stride) / 2
+
+            if (new_width, new_height) != (width, height):
+                frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+            left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+            top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+            image = cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+
+            # BGR HWC -> RGB CHW
+            image = np.ascontiguousarray(image[..., ::-1].transpose(2, 0, 1))
+            return image, ratio, (left, top), (width, height)
+
+    def preprocess(self, frames):
+        return [self.executor.submit(self.letterbox, frame) for frame in frames]
+
+    def predict(self, letterboxed):
+        import torch
+        letterboxed = [future.result() for future in letterboxed]
+        batch = torch.from_numpy(np.stack([image for image, _, _, _ in letterboxed])).float() / 255
+
+        start = time.perf_counter()
+        results = self.model.predict(batch, conf=self.conf, verbose=False)
+        elapsed = time.perf_counter() - start
+        if self.batch_sizer is not None:
+            self.batch_sizer.update(len(letterboxed), elapsed)
+        if metrics.enabled:
+            metrics.record("inference", elapsed, len(letterboxed))
+
+        detections = []
+        for result, (_, ratio, (left, top), (width, height)) in zip(results, letterboxed):
+            boxes = result.boxes
+            xyxy = boxes.xyxy.cpu().numpy().astype(np.float32).reshape(-1, 4)
+            # Undo the letterbox so boxes are in the original frame's pixels
+            xyxy = (xyxy - np.array([left, top, left, top], dtype=np.float32)) / ratio
+            xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, width)
+            xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, height)
+            detections.append(FrameDetections(xyxy=xyxy,
+                                              confidence=boxes.conf.cpu().numpy().astype(np.float32),
+                                              class_id=boxes.cls.cpu().numpy().astype(np.int16),
+                                              names=result.names))
+        return detections
+
+    def iter_batches(self, frames):
+        frames = iter(frames)
+        batch = list(islice(frames, self.get_batch_size()))
+        pending = self.preprocess(batch)
+        while pending:
+            # Letterbox the next batch in the workers while the model runs on this one
+            upcoming_batch = list(islice(frames, self.get_batch_size()))
+            upcoming = self.preprocess(upcoming_batch)
+            yield batch, self.predict(pending)
+            batch, pending = upcoming_batch, upcoming
+
+    def iter_detections(self, frames):
+        for _, detections in self.iter_batches(frames):
+            yield from detections
@@ -1,20 +1,74 @@
+import logging
 import numpy as np
-from ultralytics import YOLO
-import supervision as sv
-import pandas as pd
 import os
-import sys
-import cv2
-from utils import get_bbox_width, get_center_of_bbox
+from itertools import chain
+from detection_cache import load_tracks, save_tracks, detections_to_arrays
+from instrumentation import metrics
+from .ball_detector import BallDetector
+from .ball_tracker import BallTracker
+from .detector_backend import export_model, get_calibration_key, load_detector
+from .inference_engine import InferenceEngine
+from track_store import FIELDS, TrackStore
+from utils import get_center_of_bbox
 from utils.bbox_utils import get_foot_position
 
-sys.path.append('../')
+logger = logging.getLogger(__name__)
 
 
 class Tracker:
-    def __init__(self, model_path):
-        self.model = YOLO(model_path)
-        self.tracker = sv.ByteTrack()
+    def __init__(self, model_path, conf=0.1, batch_size=None, imgsz=640, preprocess_workers=None, backend="pytorch",
+                 quantization=None, calibration_data=None, ball_crop_size=None, export_path=None):
+        self.model_path = model_path
+        self.conf = conf
+        self.imgsz = imgsz
+        self.backend = backend
+        self.quantization = quantization
+        self.calibration_data = calibration_data
+        # Set when the backend was already exported, e.g. by the process that started this one
+        self.export_path = export_path
+        self.batch_size = batch_size
+        self.preprocess_workers = preprocess_workers
+        # Players come from the reduced-resolution pass, the ball from a native-resolution crop around it
+        self.ball_crop_size = ball_crop_size
+        # The detector (and torch with it) is only loaded once frames need inference, so cached runs skip it
+        self.model = None
+        self.inference_engine = None
+        self.ball_detector = None
+        # ByteTrack is created with the first detections, supervision is slow to import as well
+        self.tracker = None
+        # Picks the ball among the candidates of each frame by gating them against its motion model
+        self.ball_tracker = BallTracker()
+
+    def export_backend(self):
+        # Converts the weights for an exported backend without loading them; None for PyTorch
+        if self.backend != "pytorch" and self.export_path is None:
+            self.export_path = export_model(self.model_path, self.backend, self.imgsz, self.quantization,
+                                            self.calibration_data)
+        return self.export_path
+
+    def load_model(self):
+        if self.model is not None:
+            return
+        import torch
+        logger.info("Using device: %s", torch.cuda.get_device_name(0) if torch.cuda.is_available() else "CPU")
+        self.model = load_detector(self.model_path, self.backend, self.imgsz, self.quantization, self.calibration_data,
+                                   self.export_backend())
+        self.inference_engine = InferenceEngine(self.model, conf=self.conf, imgsz=self.imgsz,
+                                                batch_size=self.batch_size, preprocess_workers=self.preprocess_workers)
+        if self.ball_crop_size:
+            self.ball_detector = BallDetector(self.model, conf=self.conf, crop_size=self.ball_crop_size)
+
+    def reset(self):
+        # Forget every track so the next frames start from a fresh ByteTrack state
+        self.tracker = None
+        self.ball_tracker.reset()
+        if self.ball_detector is not None:
+            self.ball_detector.reset()
+
+    def get_stub_params(self):
+        return {"conf": self.conf, "imgsz": self.imgsz, "backend": self.backend, "quantization": self.quantization,
+                "calibration_data": get_calibration_key(self.quantization, self.calibration_data),
+                "ball_crop_size": self.ball_crop_size, "ball_gate": self.ball_tracker.gate}
 
     def add_position_to_tracks(sekf, tracks):
         for object, object_tracks in tracks.items():
@@ -27,41 +81,100 @@ class Tracker:
                         position = get_foot_position(bbox)
                     tracks[object][frame_num][track_id]['position'] = position
 
-    def interpolate_ball_positions(self, ball_positions):
-        ball_positions = [x.get(1, {}).get('bbox', []) for x in ball_positions]
-        df_ball_positions = pd.DataFrame(ball_positions, columns=['x1', 'y1', 'x2', 'y2'])
-
-        # Interpolate missing values
-        df_ball_positions = df_ball_positions.interpolate()
-        df_ball_positions = df_ball_positions.bfill()
-
-        ball_positions = [{1: {"bbox": x}} for x in df_ball_positions.to_numpy().tolist()]
+    def add_position_to_track_stores(self, stores):
+        for object, store in stores.items():
+            bbox = store.get_column('bbox').astype(np.float64)
+            x_center = (bbox[:, 0] + bbox[:, 2]) / 2
+            if object == 'ball':
+                y = (bbox[:, 1] + bbox[:, 3]) / 2
+            else:
+                y = bbox[:, 3]
+            store.set_column('position', np.stack([x_center, y], axis=1).astype(np.int32))
 
+    def interpolate_ball_positions(self, ball_positions):
+        missing = (np.nan,) * 4
+        balls = [ball_track.get(1) for ball_track in ball_positions]
+        boxes = np.fromiter(chain.from_iterable(missing if ball is None else ball['bbox'] for ball in balls),
+                            dtype=np.float64, count=4 * len(balls)).reshape(-1, 4)
+        confidences = np.fromiter((np.nan if ball is None else ball.get('confidence', np.nan) for ball in balls),
+                                  dtype=np.float64, count=len(balls))
+
+        # Gaps follow the Kalman motion model, smoothed forward and backward, instead of straight lines
+        boxes = BallTracker().track(boxes, confidences)
+        if np.isnan(boxes).any():
+            return ball_positions
+
+        # Detected balls are updated in place and only the gaps get new entries, which keeps a full match cheap
+        for ball_track, ball, bbox in zip(ball_positions, balls, boxes.tolist()):
+            if ball is None:
+                ball_track[1] = {"bbox": bbox}
+            else:
+                ball['bbox'] = bbox
         return ball_positions
 
+    def interpolate_ball_track_store(self, ball_store):
+        num_frames = ball_store.num_frames
+        boxes = np.full((num_frames, 4), np.nan)
+        boxes[ball_store.frame] = ball_store.get_column('bbox')
+        confidences = np.full(num_frames, np.nan)
+        confidences[ball_store.frame] = ball_store.get_column('confidence')
+
+        boxes = BallTracker().track(boxes, confidences)
+        if np.isnan(boxes).any():
+            return ball_store
+
+        # Every frame now has a ball row; detected rows keep their other columns, gap rows only get the box
+        columns = {}
+        for name, values in ball_store.columns.items():
+            _, shape, missing = FIELDS[name]
+            column = np.full((num_frames,) + shape, missing, dtype=values.dtype)
+            column[ball_store.frame] = values
+            columns[name] = column
+        columns['bbox'] = boxes
+        return TrackStore(num_frames, np.arange(num_frames), np.ones(num_frames), columns)
+
+    def iter_detections(self, frames):
+        self.load_model()
+        if self.ball_detector is None:
+            return self.inference_engine.iter_detections(frames)
+        return self.ball_detector.iter_detections(self.inference_engine.iter_batches(frames))
+
     def detect_frames(self, frames):
-        batch_size = 20
-        detections = []
-        for i in range(0, len(frames), batch_size):
-            detections_batch = self.model.predict(frames[i:i + batch_size], conf=0.1)
-            detections += detections_batch
-        return detections
+        return list(self.iter_detections(frames))
 
     def get_object_tracks(self, frames, read_from_stub=False, stub_path=None):
-        detections = self.detect_frames(frames)
+        if read_from_stub and stub_path is not None and os.path.exists(stub_path):
+            return load_tracks(stub_path)
 
         tracks = {
             "players": [],
             "referees": [],
             "ball": []
         }
+        # Tracking starts on each batch as soon as inference yields it
+        detections = []
+        for detection in self.iter_detections(frames):
+            self.add_detections_to_tracks(tracks, [detection])
+            detections.append(detection)
 
-        for frame_num, detection in enumerate(detections):
+        if stub_path is not None:
+            save_tracks(tracks, stub_path, detections_to_arrays(detections))
+
+        return tracks
+
+    def add_detections_to_tracks(self, tracks, detections):
+        import supervision as sv
+        if self.tracker is None:
+            self.tracker = sv.ByteTrack()
+        for detection in detections:
+            frame_num = len(tracks["players"])
             class_names = detection.names
             class_names_inv = {v: k for k, v in class_names.items()}
 
             # Convert to supervision Detection format
-            detection_supervision = sv.Detections.from_ultralytics(detection)
+            detection_supervision = sv.Detections(xyxy=detection.xyxy,
+                                                  confidence=detection.confidence,
+                                                  class_id=detection.class_id.astype(int))
 
             # Convert GK to Player
             for object_index, class_id in enumerate(detection_supervision.class_id):
@@ -69,7 +182,8 @@ class Tracker:
                     detection_supervision.class_id[object_index] = class_names_inv["player"]
 
             # Track objects
-            detection_with_tracks = self.tracker.update_with_detections(detection_supervision)
+            with metrics.stage("bytetrack"):
+                detection_with_tracks = self.tracker.update_with_detections(detection_supervision)
 
             tracks["players"].append({})
             tracks["referees"].append({})
@@ -87,128 +201,15 @@ class Tracker:
                     if class_id == class_names_inv["referee"]:
                         tracks["referees"][frame_num][track_id] = {"bbox": bbox}
 
-                for frame_detection in detection_supervision:
-                    bbox = frame_detection[0].tolist()
-                    class_id = frame_detection[3]
-
-                    if class_id == class_names_inv["ball"]:
-                        tracks["ball"][frame_num][1] = {"bbox": bbox}
+                # Several low-confidence ball candidates per frame are common; keep the one the track explains
+                is_ball = detection_supervision.class_id == class_names_inv["ball"]
+                ball_boxes = detection_supervision.xyxy[is_ball]
+                ball_confidences = detection_supervision.confidence[is_ball]
+                ball_index = self.ball_tracker.update(ball_boxes, ball_confidences)
+                if ball_index is not None:
+                    tracks["ball"][frame_num][1] = {"bbox": ball_boxes[ball_index].tolist(),
+                                                    "confidence": float(ball_confidences[ball_index])}
             except Exception as e:
                 continue
 
         return tracks
-
-    def draw_ellipse(self, frame, bbox, color, track_id=None):
-        y2 = int(bbox[3])
-        x_center, _ = get_center_of_bbox(bbox)
-        width = get_bbox_width(bbox)
-
-        cv2.ellipse(frame,
-                    center=(x_center, y2),
-                    axes=(int(width), int(0.35 * width)),
-                    angle=0.0,
-                    startAngle=-45,
-                    endAngle=235,
-                    color=color,
-                    thickness=2,
-                    lineType=cv2.LINE_4)
-
-        rectangle_width = 40
-        rectangle_height = 20
-        x1_rect = x_center - rectangle_width // 2
-        x2_rect = x_center + rectangle_width // 2
-        y1_rect = (y2 - rectangle_height // 2) + 15
-        y2_rect = (y2 + rectangle_height // 2) + 15
-
-        if track_id is not None:
-            cv2.rectangle(frame, (int(x1_rect), int(y1_rect)), (int(x2_rect), int(y2_rect)), color, cv2.FILLED)
-            x1_text = x1_rect + 12
-            if track_id > 99:
-                x1_text -= 10
-            cv2.putText(frame, f'{track_id}', (int(x1_text), int(y1_rect + 15)), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
-                        (0, 0, 0),
-                        2)
-
-        return frame
-
-    def draw_triangle(self, frame, bbox, color):
-        y = int(bbox[1])
-        x, _ = get_center_of_bbox(bbox)
-        triangle_points = np.array([
-            [x, y],
-            [x - 10, y - 20],
-            [x + 10, y - 20]
-        ])
-        cv2.drawContours(frame, [triangle_points], 0, color, cv2.FILLED)
-        cv2.drawContours(frame, [triangle_points], 0, (0, 0, 0), 2)
-
-        return frame
-
-    def draw_team_ball_control(self, frame, frame_num, team_ball_control):
-        # Draw a semi-transparent rectangle
-        overlay = frame.copy()
-        cv2.rectangle(overlay, (1350, 850), (1900, 970), (255, 255, 255), -1)
-        alpha = 0.4
-        cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
-
-        team_ball_control_till_frame = team_ball_control[:frame_num + 1]
-        # Get the number of time each team had ball control
-        team_1_num_frames = team_ball_control_till_frame[team_ball_control_till_frame == 1].shape[0]
-        team_2_num_frames = team_ball_control_till_frame[team_ball_control_till_frame == 2].shape[0]
-        total = team_1_num_frames + team_2_num_frames
-        if total == 0:
-            team_1 = team_2 = 0.0
-        else:
-            team_1 = team_1_num_frames / total
-            team_2 = team_2_num_frames / total
-
-        cv2.putText(frame, f"Team 1 Ball Control: {team_1 * 100:.2f}%", (1400, 900), cv2.FONT_HERSHEY_SIMPLEX, 1,
-                    (0, 0, 0), 3)
-        cv2.putText(frame, f"Team 2 Ball Control: {team_2 * 100:.2f}%", (1400, 950), cv2.FONT_HERSHEY_SIMPLEX, 1,
-                    (0, 0, 0), 3)
-
-        return frame
-
-    def draw_annotations(self, video_frames, tracks, team_ball_control):
-        output_video_frames = []
-        ball_trajectory = []
-
-        for frame_num, frame in enumerate(video_frames):
-            frame = frame.copy()
-            # Check if there are any player tracks for the current frame
-            if "players" in tracks and len(tracks["players"]) > frame_num:
-                player_dic = tracks["players"][frame_num]
-                # Draw players
-                for track_id, player in player_dic.items():
-                    color = player.get("team_color", (0, 0, 255))
-                    frame = self.draw_ellipse(frame, player["bbox"], color, track_id)
-
-                    if player.get("has_ball", False):
-                        frame = self.draw_triangle(frame, player["bbox"], (0, 0, 255))
-
-            # Check if there are any referee tracks for the current frame
-            if "referees" in tracks and len(tracks["referees"]) > frame_num:
-                referee_dic = tracks["referees"][frame_num]
-                # Draw referees
-                for _, referee in referee_dic.items():
-                    frame = self.draw_ellipse(frame, referee["bbox"], (0, 255, 255))
-
-            if "ball" in tracks and len(tracks["ball"]) > frame_num:
-                ball_dic = tracks["ball"][frame_num]
-                # Draw ball
-                for _, ball in ball_dic.items():
-                    frame = self.draw_triangle(frame, ball["bbox"], (0, 255, 0))
-
-                    center = get_center_of_bbox(ball["bbox"])
-                    ball_trajectory.append(center)
-
-            # #Ball trajectory
-            # for i in range(1, len(ball_trajectory)):
-            #     cv2.line(frame, ball_trajectory[i - 1], ball_trajectory[i], (0, 255, 0), 2)
-
-            # Draw team ball control
-            frame = self.draw_team_ball_control(frame, frame_num, team_ball_control)
-
-            output_video_frames.append(frame)
-
-        return output_video_frames
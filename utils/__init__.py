@@ -1,2 +1,5 @@
-from .video_utils import read_video, save_video, convert_to_mp4
+from .video_utils import read_video, save_video, iter_video_frames, iter_frame_batches, \
+    create_video_writer, get_video_fps, FFmpegVideoWriter
+from .video_reader import VideoReader
+from .live_source import LiveFrameSource
 from .bbox_utils import get_center_of_bbox, get_bbox_width, measure_distance
@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+class LiveFrameSource():
+    """Capture a live feed on a background thread, keeping only the newest frames when the consumer falls behind."""
+
+    def __init__(self, source, size=None, buffer_size=4, loop=False, realtime=None):
+        # A bare number is a local camera, anything else a file or a stream URL (rtsp://, udp://, ...)
+        self.source = int(source) if str(source).isdigit() else str(source)
+        self.size = tuple(size) if size is not None else None
+        self.buffer_size = buffer_size
+        self.loop = loop
+        # Files are paced at their frame rate so they can stand in for a live feed
+        self.realtime = os.path.isfile(str(source)) if realtime is None else realtime
+
+        self.cap = cv2.VideoCapture(self.source)
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open video source: {source}")
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and 0 < fps < 1000 else 25
+
+        self.frames = deque()
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.finished = False
+        self.error = None
+        self.captured = 0
+        self.dropped = 0
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._capture, name="capture", daemon=True)
+        self.thread.start()
+        return self
+
+    def _capture(self):
+        frame_num = 0
+        next_time = time.perf_counter()
+        try:
+            while not self.stop_event.is_set():
+                ret, frame = self.cap.read()
+                if not ret:
+                    if self.loop and frame_num > 0 and self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                        continue
+                    break
+
+                if self.realtime:
+                    # Hold each frame back until it would have arrived, without bursting after a slow decode
+                    next_time = max(next_time + 1 / self.fps, time.perf_counter())
+                    time.sleep(max(next_time - time.perf_counter(), 0))
+                if self.size is not None and (frame.shape[1], frame.shape[0]) != self.size:
+                    frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+
+                # Frame numbers keep counting across loops, so they always measure elapsed source time
+                with self.condition:
+                    if len(self.frames) == self.buffer_size:
+                        self.frames.popleft()
+                        self.dropped += 1
+                    self.frames.append((frame_num, time.perf_counter(), frame))
+                    self.captured += 1
+                    self.condition.notify()
+                frame_num += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            self.cap.release()
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+
+    def get_frames(self, block=True):
+        """Take every buffered (frame_num, capture_time, frame), oldest first; empty once the feed has ended."""
+        with self.condition:
+            while block and not self.frames and not self.finished:
+                self.condition.wait()
+            if self.error is not None:
+                raise self.error
+            frames = list(self.frames)
+            self.frames.clear()
+        return frames
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
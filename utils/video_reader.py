@@ -0,0 +1,190 @@
+import math
+import queue
+import subprocess
+import threading
+
+import cv2
+import numpy as np
+from imageio_ffmpeg import get_ffmpeg_exe
+
+from instrumentation import metrics
+
+_END = object()
+
+
+class VideoReader():
+    """Decode a video on a background thread, with optional ffmpeg decoding, frame stride, resize and time range."""
+
+    def __init__(self, video_path, backend="opencv", size=None, stride=1, start_time=None, end_time=None,
+                 read_ahead=8):
+        if backend not in ("opencv", "ffmpeg"):
+            raise ValueError(f"Unknown video decoder backend: {backend}")
+        if stride < 1:
+            raise ValueError(f"Frame stride must be at least 1, got {stride}")
+
+        self.video_path = str(video_path)
+        self.backend = backend
+        self.stride = int(stride)
+        self.read_ahead = read_ahead
+
+        cap = cv2.VideoCapture(self.video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self.source_fps = fps if fps and fps > 0 else 24
+        self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cap.release()
+
+        # The time range is resolved to source frame numbers so both backends cut at the same frames
+        self.start_frame = int(round(start_time * self.source_fps)) if start_time else 0
+        self.end_frame = int(round(end_time * self.source_fps)) if end_time is not None else None
+        self.size = tuple(size) if size is not None else None
+
+    @property
+    def fps(self):
+        return self.source_fps / self.stride
+
+    @property
+    def frame_size(self):
+        return self.size if self.size is not None else (self.width, self.height)
+
+    @property
+    def num_frames(self):
+        end_frame = self.frame_count if self.end_frame is None else min(self.end_frame, self.frame_count)
+        return max(math.ceil((end_frame - self.start_frame) / self.stride), 0)
+
+    def get_metadata(self):
+        return {
+            "fps": self.source_fps,
+            "frame_count": self.frame_count,
+            "width": self.width,
+            "height": self.height,
+            "duration": self.frame_count / self.source_fps,
+        }
+
+    def get_stub_params(self):
+        # Everything that changes which frames, or which pixels, come out of the reader
+        return {
+            "decoder": self.backend,
+            "size": self.size,
+            "stride": self.stride,
+            "start_frame": self.start_frame,
+            "end_frame": self.end_frame,
+        }
+
+    def resize(self, frame):
+        if self.size is None or (frame.shape[1], frame.shape[0]) == self.size:
+            return frame
+        return cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+
+    def iter_opencv_frames(self):
+        cap = cv2.VideoCapture(self.video_path)
+        try:
+            if self.start_frame:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+            frame_num = self.start_frame
+            while cap.isOpened() and (self.end_frame is None or frame_num < self.end_frame):
+                # Skipped frames are only grabbed, never converted to BGR
+                if (frame_num - self.start_frame) % self.stride:
+                    if not cap.grab():
+                        break
+                else:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    yield self.resize(frame)
+                frame_num += 1
+        finally:
+            cap.release()
+
+    def iter_ffmpeg_frames(self):
+        width, height = self.frame_size
+        command = [get_ffmpeg_exe(), "-loglevel", "error"]
+        if self.start_frame:
+            command += ["-ss", f"{self.start_frame / self.source_fps:.6f}"]
+        command += ["-i", self.video_path, "-an"]
+
+        filters = []
+        if self.stride > 1:
+            filters.append(f"select=not(mod(n\\,{self.stride}))")
+        if self.size is not None:
+            filters.append(f"scale={width}:{height}:flags=area")
+        if filters:
+            command += ["-vf", ",".join(filters)]
+        if self.end_frame is not None:
+            command += ["-frames:v", str(max(math.ceil((self.end_frame - self.start_frame) / self.stride), 0))]
+        command += ["-vsync", "0", "-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+
+        frame_bytes = width * height * 3
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=frame_bytes)
+        try:
+            while True:
+                frame = np.empty((height, width, 3), dtype=np.uint8)
+                if process.stdout.readinto(memoryview(frame.reshape(-1))) < frame_bytes:
+                    break
+                yield frame
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+
+    def iter_frames(self):
+        if self.backend == "ffmpeg":
+            return self.iter_ffmpeg_frames()
+        return self.iter_opencv_frames()
+
+    def iter_timed_frames(self):
+        source = self.iter_frames()
+        try:
+            while True:
+                with metrics.stage("decode"):
+                    frame = next(source, _END)
+                if frame is _END:
+                    return
+                yield frame
+        finally:
+            source.close()
+
+    def __iter__(self):
+        if not self.read_ahead:
+            yield from self.iter_timed_frames()
+            return
+
+        frames = queue.Queue(maxsize=self.read_ahead)
+        stop_event = threading.Event()
+
+        def put(item):
+            while not stop_event.is_set():
+                try:
+                    frames.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def decode():
+            source = self.iter_timed_frames()
+            try:
+                for frame in source:
+                    if not put(frame):
+                        return
+            except Exception as e:
+                put(e)
+            finally:
+                source.close()
+                put(_END)
+
+        thread = threading.Thread(target=decode, name="decoder", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = frames.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop_event.set()
+            thread.join()
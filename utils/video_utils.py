@@ -1,35 +1,137 @@
+import logging
+import queue
 import subprocess
+import tempfile
+import threading
+import time
 
 import cv2
 from imageio_ffmpeg import get_ffmpeg_exe
 
+from instrumentation import metrics
+from .video_reader import VideoReader
 
-def read_video(video_path):
+logger = logging.getLogger(__name__)
+
+
+def read_video(video_path, **reader_params):
+    return list(iter_video_frames(video_path, **reader_params))
+
+
+def iter_video_frames(video_path, **reader_params):
+    yield from VideoReader(video_path, **reader_params)
+
+
+def get_video_fps(video_path, default=24):
     cap = cv2.VideoCapture(video_path)
-    frames = []
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frames.append(frame)
-    return frames
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    return fps if fps and fps > 0 else default
+
+
+def iter_frame_batches(frames, batch_size):
+    start_frame = 0
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield start_frame, batch
+            start_frame += len(batch)
+            batch = []
+    if batch:
+        yield start_frame, batch
+
+
+class FFmpegVideoWriter():
+    """Encode BGR frames by piping them into a single ffmpeg process, from a background thread."""
+
+    def __init__(self, output_video_path, frame_size, fps=24, codec="libx264", preset="medium", crf=23, threads=0,
+                 queue_size=8, tune=None, output_format=None, wallclock_timestamps=False):
+        self.output_video_path = output_video_path
+        self.frame_size = frame_size
+        command = [
+            get_ffmpeg_exe(), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{frame_size[0]}x{frame_size[1]}"
+        ]
+        # Live feeds drop frames, so they are timestamped on arrival and resampled to a constant rate
+        command += ["-use_wallclock_as_timestamps", "1"] if wallclock_timestamps else ["-r", str(fps)]
+        command += ["-i", "-", "-an", "-vcodec", codec, "-preset", preset]
+        if tune:
+            command += ["-tune", tune]
+        command += ["-crf", str(crf), "-threads", str(threads), "-pix_fmt", "yuv420p"]
+        if wallclock_timestamps:
+            command += ["-fps_mode", "cfr", "-r", str(fps)]
+        if output_format:
+            command += ["-f", output_format]
+        command.append(output_video_path)
+        # stderr goes to a file, not a pipe nobody reads until release(), which a chatty ffmpeg could fill and block on
+        self.stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self.stderr)
+
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._encode, name="encoder", daemon=True)
+        self.thread.start()
+
+    def _encode(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                continue
+            start = time.perf_counter()
+            try:
+                self.process.stdin.write(frame.tobytes())
+            except (BrokenPipeError, OSError) as e:
+                self.error = e
+            if metrics.enabled:
+                # Time ffmpeg takes to accept the frame, which is bounded by how fast it encodes
+                metrics.record("encode", time.perf_counter() - start)
+
+    def write(self, frame):
+        if self.error is not None:
+            raise RuntimeError(f"ffmpeg stopped encoding {self.output_video_path}: {self.error}")
+        if (frame.shape[1], frame.shape[0]) != tuple(self.frame_size):
+            raise ValueError(f"Frame size {frame.shape[1]}x{frame.shape[0]} does not match the writer size "
+                             f"{self.frame_size[0]}x{self.frame_size[1]}")
+        self.frames.put(frame)
+
+    def release(self):
+        self.frames.put(None)
+        self.thread.join()
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        returncode = self.process.wait()
+        self.stderr.seek(0)
+        stderr = self.stderr.read().decode(errors="replace").strip()
+        self.stderr.close()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to encode {self.output_video_path}: {stderr}")
+
+
+# Container ffmpeg needs for network outputs, by URL scheme
+STREAM_FORMATS = {"udp": "mpegts", "tcp": "mpegts", "srt": "mpegts", "rtp": "rtp_mpegts", "rtmp": "flv",
+                  "rtsp": "rtsp"}
+
+
+def create_video_writer(output_video_path, frame_size, fps=24, **encoder_params):
+    scheme = str(output_video_path).split("://", 1)[0].lower() if "://" in str(output_video_path) else None
+    if scheme in STREAM_FORMATS:
+        encoder_params.setdefault("output_format", STREAM_FORMATS[scheme])
+
+    # AVI keeps the original OpenCV XVID writer, everything else is encoded by ffmpeg
+    if str(output_video_path).lower().endswith(".avi"):
+        fourcc = cv2.VideoWriter_fourcc(*'XVID')
+        return cv2.VideoWriter(str(output_video_path), fourcc, fps, frame_size)
+    return FFmpegVideoWriter(str(output_video_path), frame_size, fps, **encoder_params)
 
 
 def save_video(output_video_frames, output_video_path):
-    fourcc = cv2.VideoWriter_fourcc(*'XVID')
-    out = cv2.VideoWriter(output_video_path, fourcc, 24, (output_video_frames[0].shape[1], output_video_frames[0].shape[0]))
+    out = create_video_writer(output_video_path,
+                              (output_video_frames[0].shape[1], output_video_frames[0].shape[0]))
     for frame in output_video_frames:
         out.write(frame)
     out.release()
-
-def convert_to_mp4(input_path: str, output_path: str):
-    ffmpeg_path = get_ffmpeg_exe()
-    try:
-        subprocess.run([
-            ffmpeg_path,
-            "-y", "-i", input_path,
-            "-vcodec", "libx264", "-acodec", "aac", output_path
-        ], check=True)
-        print(f"[INFO] Converted to MP4 with imageio-ffmpeg: {output_path}")
-    except subprocess.CalledProcessError as e:
-        print(f"[ERROR] ffmpeg failed: {e}")
\ No newline at end of file
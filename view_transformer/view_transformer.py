@@ -1,12 +1,22 @@
+from collections import OrderedDict
+from itertools import chain
+
 import cv2
 import numpy as np
 
+from instrumentation import metrics
+
+# Full pitch in metres; projections further than the margin outside it are not trusted
+PITCH_LENGTH = 105
+PITCH_WIDTH = 68
+
 
 class ViewTransformer():
-    def __init__(self):
-        court_width = 68
+    def __init__(self, recompute_threshold=0.5, margin=5.0, cache_size=1024):
+        court_width = PITCH_WIDTH
         court_length = 23.32
 
+        # Calibration of the first frame's framing: four image points and where they lie on the pitch
         self.pixel_vertices = np.array([[110, 1035],
                                         [265, 275],
                                         [910, 260],
@@ -24,23 +34,112 @@ class ViewTransformer():
 
         self.perspective_transformer = cv2.getPerspectiveTransform(self.pixel_vertices, self.target_vertices)
 
-    def transform_point(self, point):
-        p = (int(point[0]), int(point[1]))
-        is_inside = cv2.pointPolygonTest(self.pixel_vertices, p, False) >= 0
-        if not is_inside:
+        # Later frames compose the calibration with the camera motion accumulated since the first frame. A new
+        # matrix is only computed once the camera has moved recompute_threshold pixels, and matrices are cached by
+        # that quantized camera position, so a camera panning back and forth keeps reusing them. The cache keeps the
+        # cache_size most recently used matrices, as a long match or live feed keeps panning to new positions.
+        self.recompute_threshold = recompute_threshold
+        self.cache_size = cache_size
+        # Where the calibrated strip lies along the pitch is unknown, so x (measured from the strip's near end) can
+        # only be bounded by a full pitch length either way: from about -87 to 110 m. Along x these bounds are a
+        # horizon filter that drops projections blown up near the vanishing line; only y, across the pitch, is
+        # checked against the touchlines.
+        self.bounds = (np.array([court_length - PITCH_LENGTH - margin, -margin]),
+                       np.array([PITCH_LENGTH + margin, court_width + margin]))
+        self.homographies = OrderedDict()
+
+    def get_camera_positions(self, camera_movement_per_frame, initial_position=(0, 0)):
+        # Camera offset of every frame from the calibrated framing, in pixels
+        camera_movement_per_frame = np.asarray(camera_movement_per_frame, dtype=np.float64).reshape(-1, 2)
+        return np.asarray(initial_position, dtype=np.float64) + np.cumsum(camera_movement_per_frame, axis=0)
+
+    def get_homography(self, cell):
+        matrix = self.homographies.get(cell)
+        if matrix is None:
+            # The estimator reports old - new feature positions, so a pixel of a frame whose camera moved by c
+            # shows what the calibrated framing shows at pixel + c
+            offset_x, offset_y = cell[0] * self.recompute_threshold, cell[1] * self.recompute_threshold
+            translation = np.array([[1, 0, offset_x], [0, 1, offset_y], [0, 0, 1]], dtype=np.float64)
+            matrix = self.perspective_transformer @ translation
+            self.homographies[cell] = matrix
+            while len(self.homographies) > self.cache_size:
+                self.homographies.popitem(last=False)
+        self.homographies.move_to_end(cell)
+        return matrix
+
+    def get_frame_homographies(self, camera_positions):
+        """Homographies of the camera segments, and the segment of every frame."""
+        cells = np.round(np.asarray(camera_positions, dtype=np.float64).reshape(-1, 2)
+                         / self.recompute_threshold).astype(np.int64)
+        unique_cells, frame_segments = np.unique(cells, axis=0, return_inverse=True)
+        matrices = np.stack([self.get_homography(tuple(cell)) for cell in unique_cells.tolist()])
+        return matrices, frame_segments.reshape(-1)
+
+    def transform_points(self, points, camera_positions=None, frames=None):
+        """Pitch coordinates of image points, masked where they do not land on the pitch.
+
+        camera_positions holds the accumulated camera offset of every frame and frames the frame of every point;
+        without them all points are projected with the calibrated framing.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if camera_positions is None:
+            matrices, segments = self.perspective_transformer[None], np.zeros(len(points), dtype=np.int64)
+        else:
+            matrices, frame_segments = self.get_frame_homographies(camera_positions)
+            segments = frame_segments[np.asarray(frames, dtype=np.int64)]
+
+        # Every point through its own segment's matrix at once, gathering one matrix entry at a time instead of a
+        # full 3x3 matrix per point
+        x, y = points[:, 0], points[:, 1]
+
+        def row(i):
+            return matrices[:, i, 0][segments] * x + matrices[:, i, 1][segments] * y + matrices[:, i, 2][segments]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w = row(2)
+            transformed = np.stack([row(0) / w, row(1) / w], axis=1)
+
+        # Points above the horizon project behind the camera (w <= 0); far off the pitch the projection is noise
+        low, high = self.bounds
+        valid = (w > 0) & ((transformed >= low) & (transformed <= high)).all(axis=1)
+        transformed[~valid] = np.nan
+
+        return np.ma.masked_array(transformed.astype(np.float32), mask=np.repeat(~valid[:, None], 2, axis=1))
+
+    def transform_point(self, point, camera_position=None):
+        transform_point = self.transform_points(point, None if camera_position is None else [camera_position], [0])
+        if transform_point.mask.any():
             return None
+        return transform_point.data
+
+    def add_transformed_position_to_tracks(self, tracks, camera_movement_per_frame=None, initial_position=(0, 0)):
+        with metrics.stage("view_transform", frames=len(tracks['players'])):
+            camera_positions = None
+            if camera_movement_per_frame is not None:
+                camera_positions = self.get_camera_positions(camera_movement_per_frame, initial_position)
+
+            for object, object_tracks in tracks.items():
+                track_infos = [track_info for track in object_tracks for track_info in track.values()]
+                if not track_infos:
+                    continue
+
+                frames = np.repeat(np.arange(len(object_tracks)), [len(track) for track in object_tracks])
+                positions = np.fromiter(chain.from_iterable(track_info['position'] for track_info in track_infos),
+                                        dtype=np.float64, count=2 * len(track_infos))
+                positions_transformed = self.transform_points(positions, camera_positions, frames)
+
+                for track_info, position_transformed, outside in zip(track_infos,
+                                                                     positions_transformed.data.tolist(),
+                                                                     positions_transformed.mask[:, 0].tolist()):
+                    track_info['position_transformed'] = None if outside else position_transformed
 
-        reshaped_point = point.reshape(-1, 1, 2).astype(np.float32)
-        transform_point = cv2.perspectiveTransform(reshaped_point, self.perspective_transformer)
-        return transform_point.reshape(-1, 2)
-
-    def add_transformed_position_to_tracks(self, tracks):
-        for object, object_tracks in tracks.items():
-            for frame_num, track in enumerate(object_tracks):
-                for track_id, track_info in track.items():
-                    position = track_info['position_adjusted']
-                    position = np.array(position)
-                    position_transformed = self.transform_point(position)
-                    if position_transformed is not None:
-                        position_transformed = position_transformed.squeeze().tolist()
-                    tracks[object][frame_num][track_id]['position_transformed'] = position_transformed
+    def add_transformed_position_to_track_stores(self, stores, camera_movement_per_frame=None,
+                                                 initial_position=(0, 0)):
+        with metrics.stage("view_transform", frames=stores['players'].num_frames):
+            camera_positions = None
+            if camera_movement_per_frame is not None:
+                camera_positions = self.get_camera_positions(camera_movement_per_frame, initial_position)
+            for store in stores.values():
+                positions_transformed = self.transform_points(store.get_column('position'), camera_positions,
+                                                              store.frame)
+                store.set_column('position_transformed', positions_transformed.filled(np.nan))